@@ -0,0 +1,73 @@
+"""Contention of get_next_proxy_from_generator as consumer threads grow, no database needed
+Compares ProxyDispenser with the former design, a generator behind one RLock:
+    python -m benchmarks.bench_dispenser --calls 200000
+"""
+import argparse
+from threading import RLock, Thread
+from time import perf_counter
+from typing import Callable, List, Tuple
+
+from proxy_helpers.mysql_proxies.proxy_dispenser import ProxyDispenser
+
+THREAD_COUNTS: Tuple[int, ...] = (1, 2, 4, 8, 16, 32, 64, 128, 200)
+
+
+class BatchLoader:
+    def __init__(self, batch_size: int):
+        self.batch_size: int = batch_size
+
+    def __call__(self) -> list:
+        return [{"full_url": f"10.0.{index // 256}.{index % 256}:8080"} for index in range(self.batch_size)]
+
+
+class LockedGeneratorDispenser:
+    """get_next_proxy_from_generator before ProxyDispenser: every call goes through one RLock"""
+
+    def __init__(self, load_batch: Callable[[], list]):
+        self.load_batch = load_batch
+        self.next_proxy_yield_rlock: RLock = RLock()
+        self.proxy_generator = None
+
+    def _set_proxy_generator(self):
+        self.proxy_generator = (proxy for proxy in self.load_batch())
+
+    def next_proxy(self):
+        with self.next_proxy_yield_rlock:
+            if self.proxy_generator is None:
+                self._set_proxy_generator()
+            try:
+                return next(self.proxy_generator)
+            except StopIteration:
+                self._set_proxy_generator()
+                return next(self.proxy_generator)
+
+
+def run_threads(next_proxy: Callable, thread_count: int, calls: int) -> float:
+    def consume():
+        for _ in range(calls // thread_count):
+            next_proxy()
+
+    threads: List[Thread] = [Thread(target=consume) for _ in range(thread_count)]
+    started = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400_000, help="next_proxy calls, split between threads")
+    parser.add_argument("--batch", type=int, default=1000, help="proxies per batch (proxy_universe_size)")
+    bench_arguments = parser.parse_args()
+
+    print(f"{'threads':>7} {'locked generator':>18} {'ProxyDispenser':>16}")
+    for thread_count in THREAD_COUNTS:
+        batch_loader = BatchLoader(bench_arguments.batch)
+        locked_elapsed = run_threads(LockedGeneratorDispenser(batch_loader).next_proxy, thread_count,
+                                     bench_arguments.calls)
+        dispenser_elapsed = run_threads(ProxyDispenser(batch_loader).next_proxy, thread_count,
+                                        bench_arguments.calls)
+        print(f"{thread_count:>7} {bench_arguments.calls / locked_elapsed:>16.0f}/s"
+              f" {bench_arguments.calls / dispenser_elapsed:>14.0f}/s")
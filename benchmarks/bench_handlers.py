@@ -0,0 +1,151 @@
+"""Throughput of the sync, pool and async ProxyHandler against the in-memory backend
+Reports proxies served (or scores updated) per second, p50/p99 call latency and batch refresh cost:
+    python -m benchmarks.bench_handlers --calls 20000 --latency 0.001
+"""
+import argparse
+import asyncio
+import random
+from threading import Thread
+from time import perf_counter
+from typing import Callable, List, Tuple
+
+from proxy_helpers.mysql_proxies import mysql_pool_proxies, mysql_proxies, mysql_proxies_async
+from proxy_helpers.mysql_proxies.memory_backend import MemoryBackend, MemoryBackendMixin, AsyncMemoryBackendMixin
+
+CONSUMER_COUNTS: Tuple[int, ...] = (1, 8, 64)
+
+
+class MemoryProxyHandler(MemoryBackendMixin, mysql_proxies.ProxyHandler):
+    pass
+
+
+class MemoryPoolProxyHandler(MemoryBackendMixin, mysql_pool_proxies.ProxyHandler):
+    pass
+
+
+class AsyncMemoryProxyHandler(AsyncMemoryBackendMixin, mysql_proxies_async.ProxyHandler):
+    pass
+
+
+def time_refreshes(proxy_handler) -> List[float]:
+    """wrap the handler batch loader, return the list its durations are appended to"""
+    refresh_times: List[float] = []
+    load_proxy_batch = proxy_handler._load_proxy_batch
+
+    if asyncio.iscoroutinefunction(load_proxy_batch):
+        async def timed_load_proxy_batch():
+            started = perf_counter()
+            proxy_batch = await load_proxy_batch()
+            refresh_times.append(perf_counter() - started)
+            return proxy_batch
+    else:
+        def timed_load_proxy_batch():
+            started = perf_counter()
+            proxy_batch = load_proxy_batch()
+            refresh_times.append(perf_counter() - started)
+            return proxy_batch
+
+    proxy_handler._load_proxy_batch = timed_load_proxy_batch
+    proxy_handler.proxy_dispenser.load_batch = timed_load_proxy_batch
+    return refresh_times
+
+
+def get_score_call(proxy_handler, proxy_count: int) -> Callable:
+    def update_proxy_score():
+        return proxy_handler.update_proxy_score(success=random.random() < 0.8,
+                                                proxy_id=random.randint(1, proxy_count))
+
+    return update_proxy_score
+
+
+def run_threads(call: Callable, consumer_count: int, calls: int) -> Tuple[float, List[float]]:
+    latencies: List[List[float]] = [[] for _ in range(consumer_count)]
+
+    def consume(consumer_latencies: List[float]):
+        for _ in range(calls // consumer_count):
+            started = perf_counter()
+            call()
+            consumer_latencies.append(perf_counter() - started)
+
+    threads = [Thread(target=consume, args=(consumer_latencies,)) for consumer_latencies in latencies]
+    started = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return perf_counter() - started, [latency for consumer_latencies in latencies for latency in consumer_latencies]
+
+
+async def run_tasks(call: Callable, consumer_count: int, calls: int) -> Tuple[float, List[float]]:
+    latencies: List[float] = []
+
+    async def consume():
+        for _ in range(calls // consumer_count):
+            started = perf_counter()
+            await call()
+            latencies.append(perf_counter() - started)
+
+    started = perf_counter()
+    await asyncio.gather(*(consume() for _ in range(consumer_count)))
+    return perf_counter() - started, latencies
+
+
+def report(handler_name: str, operation: str, consumer_count: int, elapsed: float, latencies: List[float],
+           refresh_times: List[float]):
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1e6
+    p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1e6
+    refresh_ms = sum(refresh_times) / len(refresh_times) * 1000 if refresh_times else 0.0
+    print(f"{handler_name:<6} {operation:<20} {consumer_count:>3} consumers {len(latencies) / elapsed:>10.0f} /s"
+          f"  p50 {p50:>8.1f} us  p99 {p99:>9.1f} us  refresh {len(refresh_times):>3} x {refresh_ms:>7.2f} ms")
+
+
+def bench_sync(handler_name: str, handler_class, arguments):
+    for consumer_count in CONSUMER_COUNTS:
+        memory_backend = MemoryBackend(query_latency=arguments.latency)
+        memory_backend.add_proxies(arguments.proxies)
+        proxy_handler = handler_class(memory_backend=memory_backend, proxy_universe_size=arguments.universe)
+        refresh_times = time_refreshes(proxy_handler)
+        elapsed, latencies = run_threads(proxy_handler.get_next_proxy_from_generator, consumer_count, arguments.calls)
+        report(handler_name, "get_next_proxy", consumer_count, elapsed, latencies, refresh_times)
+
+        for write_behind in (False, True):
+            proxy_handler = handler_class(memory_backend=memory_backend, score_write_behind=write_behind)
+            elapsed, latencies = run_threads(get_score_call(proxy_handler, arguments.proxies), consumer_count,
+                                             arguments.score_calls)
+            proxy_handler.close()
+            operation = "update_score (wb)" if write_behind else "update_score"
+            report(handler_name, operation, consumer_count, elapsed, latencies, [])
+
+
+async def bench_async(arguments):
+    for consumer_count in CONSUMER_COUNTS:
+        memory_backend = MemoryBackend(query_latency=arguments.latency)
+        memory_backend.add_proxies(arguments.proxies)
+        proxy_handler = AsyncMemoryProxyHandler(memory_backend=memory_backend, proxy_universe_size=arguments.universe)
+        refresh_times = time_refreshes(proxy_handler)
+        elapsed, latencies = await run_tasks(proxy_handler.get_next_proxy_from_generator, consumer_count,
+                                             arguments.calls)
+        report("async", "get_next_proxy", consumer_count, elapsed, latencies, refresh_times)
+
+        for write_behind in (False, True):
+            proxy_handler = AsyncMemoryProxyHandler(memory_backend=memory_backend, score_write_behind=write_behind)
+            elapsed, latencies = await run_tasks(get_score_call(proxy_handler, arguments.proxies), consumer_count,
+                                                 arguments.score_calls)
+            await proxy_handler.aclose()
+            operation = "update_score (wb)" if write_behind else "update_score"
+            report("async", operation, consumer_count, elapsed, latencies, [])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--proxies", type=int, default=10_000, help="rows in tbl_proxy_url")
+    parser.add_argument("--universe", type=int, default=1000, help="proxy_universe_size")
+    parser.add_argument("--calls", type=int, default=64_000, help="get_next_proxy_from_generator calls")
+    parser.add_argument("--score-calls", type=int, default=6_400, help="update_proxy_score calls")
+    parser.add_argument("--latency", type=float, default=0.0005, help="simulated query round trip, in seconds")
+    bench_arguments = parser.parse_args()
+
+    bench_sync("sync", MemoryProxyHandler, bench_arguments)
+    bench_sync("pool", MemoryPoolProxyHandler, bench_arguments)
+    asyncio.run(bench_async(bench_arguments))
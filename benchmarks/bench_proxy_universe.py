@@ -0,0 +1,58 @@
+"""Compare the DataFrame and Proxy record paths of get_proxy_universe, per 10k rows
+The cursor rows are synthetic so no database is needed:
+    python -m benchmarks.bench_proxy_universe
+"""
+import tracemalloc
+from datetime import datetime
+from time import perf_counter
+from typing import Callable, List
+
+import pandas as pd
+
+from proxy_helpers.mysql_proxies.proxy_record import PROXY_COLUMNS, get_proxy_records
+
+ROW_COUNT: int = 10_000
+REPEAT: int = 20
+
+
+def get_rows(row_count: int = ROW_COUNT) -> List[tuple]:
+    upload_datetime = datetime(2024, 1, 1)
+    return [
+        (index, upload_datetime, f"10.{index // 65536}.{index // 256 % 256}.{index % 256}", 8080,
+         "GB", "London", 1.5, "bench", index % 50, 0)
+        for index in range(row_count)
+    ]
+
+
+def dataframe_path(rows: List[tuple]) -> list:
+    # what fetch_all_as_df + get_proxy_universe(return_as_list_of_dicts=True) do
+    result_df = pd.DataFrame(rows, columns=PROXY_COLUMNS)
+    result_df.insert(0, "full_url", result_df["proxy_url"] + ":" + result_df["proxy_port"].astype(str))
+    result_df = result_df.sample(n=len(result_df))
+    return result_df.to_dict(orient="records")
+
+
+def records_path(rows: List[tuple]) -> list:
+    return get_proxy_records(rows, shuffle_results=True)
+
+
+def bench(name: str, universe_path: Callable[[List[tuple]], list], rows: List[tuple]):
+    universe_path(rows)
+    started = perf_counter()
+    for _ in range(REPEAT):
+        universe_path(rows)
+    elapsed_ms = (perf_counter() - started) / REPEAT * 1000
+
+    tracemalloc.start()
+    proxies = universe_path(rows)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<12} {elapsed_ms:>9.2f} ms  kept {current / 1024:>9.0f} KiB  peak {peak / 1024:>9.0f} KiB"
+          f"  ({len(proxies)} rows)")
+
+
+if __name__ == "__main__":
+    bench_rows = get_rows()
+    print(f"get_proxy_universe, {ROW_COUNT} rows, mean of {REPEAT} runs")
+    bench("dataframe", dataframe_path, bench_rows)
+    bench("records", records_path, bench_rows)
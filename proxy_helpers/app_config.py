@@ -1,17 +1,69 @@
+import atexit
 import logging
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
+from queue import SimpleQueue
+from typing import Optional, Union
 
+LOGGING_FORMAT: str = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 
-def logging_config():
-    logging_folder = Path(get_project_root_path(), "proxy_helpers", "downloads")
-    logging_folder.mkdir(parents=True, exist_ok=True)
+_queue_handler: Optional[QueueHandler] = None
+_queue_listener: Optional[QueueListener] = None
+# level of the root logger before logging_config, restored by stop_logging
+_previous_root_level: int = logging.NOTSET
 
-    # Configure the root logger
-    logging.basicConfig(
-        filename=Path(logging_folder, 'proxy_helpers.log'),  # Global log file name
-        level=logging.DEBUG,  # Global log level
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread
+    The record is queued as is, so its args must not be mutated once logged"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def logging_config(
+        level: Union[int, str] = logging.INFO,
+        log_path: Optional[Union[str, Path]] = None,
+) -> QueueListener:
+    """log to log_path (default proxy_helpers/downloads/proxy_helpers.log) from a background thread
+    Callers only put records on a queue, a QueueListener formats and writes them.
+    Calling it again replaces the previous configuration, see stop_logging"""
+    global _queue_handler, _queue_listener, _previous_root_level
+    stop_logging()
+
+    if log_path is None:
+        logging_folder = Path(get_project_root_path(), "proxy_helpers", "downloads")
+        logging_folder.mkdir(parents=True, exist_ok=True)
+        log_path = Path(logging_folder, 'proxy_helpers.log')
+    file_handler = logging.FileHandler(log_path, encoding="utf-8")
+    file_handler.setFormatter(logging.Formatter(LOGGING_FORMAT))
+
+    log_queue: SimpleQueue = SimpleQueue()
+    _queue_handler = DeferredQueueHandler(log_queue)
+    _queue_listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    root_logger = logging.getLogger()
+    root_logger.addHandler(_queue_handler)
+    _previous_root_level = root_logger.level
+    root_logger.setLevel(level)
+    _queue_listener.start()
+    return _queue_listener
+
+
+def stop_logging():
+    """write the queued records and close the log file, restore the root logger level, run at exit"""
+    global _queue_handler, _queue_listener
+    if _queue_listener is None:
+        return
+    root_logger = logging.getLogger()
+    root_logger.removeHandler(_queue_handler)
+    root_logger.setLevel(_previous_root_level)
+    _queue_listener.stop()
+    for handler in _queue_listener.handlers:
+        handler.close()
+    _queue_handler, _queue_listener = None, None
+
+
+atexit.register(stop_logging)
 
 
 def get_project_root_path() -> Path:
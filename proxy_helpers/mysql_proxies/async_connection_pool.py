@@ -0,0 +1,210 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(f"proxy_helpers:{Path(__file__).name}")
+
+
+async def _connect(**connection_settings):
+    # imported on first connection, importing the driver is slow
+    import mysql.connector.aio
+
+    return await mysql.connector.aio.connect(**connection_settings)
+
+
+def _is_connection_error(ex: BaseException) -> bool:
+    import mysql.connector
+
+    return isinstance(ex, (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError))
+
+
+class AsyncConnectionPool:
+    """Pool of up to pool_size mysql.connector.aio connections, opened on demand
+    Connections idle for more than health_check_interval seconds are pinged before use and reopened
+    if the ping fails. Connections that raised a connection error are dropped.
+    Same fetch_all/run_in_transaction/close interface as AsyncNativeRowReader, see pool_metrics for wait times"""
+
+    def __init__(
+            self,
+            connection_settings: Dict,
+            pool_size: int = 5,
+            health_check_interval: Optional[float] = 30.0,
+            connect: Callable[..., Awaitable] = _connect,
+    ):
+        self.connection_settings: Dict = connection_settings
+        self.pool_size: int = pool_size
+        self.health_check_interval: Optional[float] = health_check_interval
+        self.connect = connect
+
+        # idle connections with the loop time they were released, last released first
+        self.idle_connections: List[Tuple[object, float]] = []
+        self.connection_count: int = 0
+        self.pool_condition: Optional[asyncio.Condition] = None
+        self.closed: bool = False
+
+        self.acquire_count: int = 0
+        self.waiting_count: int = 0
+        self.wait_time_total: float = 0.0
+        self.wait_time_max: float = 0.0
+        self.health_check_failures: int = 0
+        self.dropped_connections: int = 0
+
+    def _get_pool_condition(self) -> asyncio.Condition:
+        # created lazily so the condition binds to the running loop
+        if self.pool_condition is None:
+            self.pool_condition = asyncio.Condition()
+        return self.pool_condition
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator:
+        """yield a healthy connection, waiting for one to be released if pool_size are in use"""
+        loop = asyncio.get_running_loop()
+        pool_condition = self._get_pool_condition()
+        started: float = loop.time()
+        connection, released_time = None, None
+        async with pool_condition:
+            self.waiting_count += 1
+            try:
+                await pool_condition.wait_for(
+                    lambda: len(self.idle_connections) > 0 or self.connection_count < self.pool_size
+                )
+            finally:
+                self.waiting_count -= 1
+            if len(self.idle_connections) > 0:
+                connection, released_time = self.idle_connections.pop()
+            else:
+                # counted now so concurrent tasks don't open more than pool_size
+                self.connection_count += 1
+        wait_time: float = loop.time() - started
+        self.acquire_count += 1
+        self.wait_time_total += wait_time
+        self.wait_time_max = max(self.wait_time_max, wait_time)
+
+        try:
+            connection = await self._check_connection(connection, released_time, loop.time())
+        except BaseException:
+            await self._drop(connection)
+            raise
+
+        try:
+            yield connection
+        except Exception as ex:
+            if _is_connection_error(ex):
+                await self._drop(connection)
+            else:
+                await self._release(connection)
+            raise
+        except BaseException:
+            # cancelled mid-query, the connection state is unknown
+            await self._drop(connection)
+            raise
+        await self._release(connection)
+
+    async def _check_connection(self, connection, released_time: Optional[float], now: float):
+        if connection is None:
+            return await self.connect(**self.connection_settings)
+        if self.health_check_interval is None or now - released_time < self.health_check_interval:
+            return connection
+        try:
+            await connection.ping(reconnect=False)
+            return connection
+        except Exception as ex:
+            self.health_check_failures += 1
+            logger.debug("Pooled connection failed its health check, reconnecting: %s", ex)
+            await self._close_quietly(connection)
+            return await self.connect(**self.connection_settings)
+
+    async def _release(self, connection):
+        if self.closed:
+            await self._drop(connection)
+            return
+        pool_condition = self._get_pool_condition()
+        async with pool_condition:
+            self.idle_connections.append((connection, asyncio.get_running_loop().time()))
+            pool_condition.notify()
+
+    async def _drop(self, connection):
+        if not self.closed:
+            self.dropped_connections += 1
+        if connection is not None:
+            await self._close_quietly(connection)
+        pool_condition = self._get_pool_condition()
+        async with pool_condition:
+            self.connection_count -= 1
+            pool_condition.notify()
+
+    @staticmethod
+    async def _close_quietly(connection):
+        try:
+            await connection.close()
+        except Exception as ex:
+            logger.debug("Handled error closing pooled connection: %s", ex)
+
+    async def fetch_all(self, sql_query: str, sql_variables: Optional[tuple] = None) -> List[tuple]:
+        rows, _ = await self.fetch_all_with_columns(sql_query=sql_query, sql_variables=sql_variables)
+        return rows
+
+    async def fetch_all_with_columns(self, sql_query: str,
+                                     sql_variables: Optional[tuple] = None) -> Tuple[List[tuple], List[str]]:
+        """return rows as tuples and the column names"""
+        async with self.acquire() as connection:
+            cursor = await connection.cursor()
+            try:
+                await cursor.execute(sql_query, sql_variables)
+                rows: List[tuple] = await cursor.fetchall()
+                return rows, [column[0] for column in cursor.description or ()]
+            finally:
+                await cursor.close()
+
+    async def execute(self, sql_query: str, sql_variables: Optional[tuple] = None) -> int:
+        """run one statement, autocommitted, return the affected row count"""
+        async with self.acquire() as connection:
+            cursor = await connection.cursor()
+            try:
+                await cursor.execute(sql_query, sql_variables)
+                return cursor.rowcount
+            finally:
+                await cursor.close()
+
+    async def run_in_transaction(self, callback: Callable[..., Awaitable]):
+        """return await callback(cursor) run in one transaction, committed if it returns, rolled back if it raises"""
+        async with self.acquire() as connection:
+            await connection.start_transaction()
+            cursor = await connection.cursor()
+            try:
+                result = await callback(cursor)
+                await connection.commit()
+                return result
+            except BaseException:
+                await connection.rollback()
+                raise
+            finally:
+                await cursor.close()
+
+    def pool_metrics(self) -> Dict:
+        """return pool size, connections open/idle/in use, tasks waiting and wait times in seconds"""
+        return {
+            "pool_size": self.pool_size,
+            "connections": self.connection_count,
+            "idle": len(self.idle_connections),
+            "in_use": self.connection_count - len(self.idle_connections),
+            "waiting": self.waiting_count,
+            "acquired": self.acquire_count,
+            "wait_time_total": self.wait_time_total,
+            "wait_time_mean": self.wait_time_total / self.acquire_count if self.acquire_count else 0.0,
+            "wait_time_max": self.wait_time_max,
+            "health_check_failures": self.health_check_failures,
+            "dropped_connections": self.dropped_connections,
+        }
+
+    async def close(self):
+        """close idle connections, connections still in use are closed when they are released"""
+        self.closed = True
+        pool_condition = self._get_pool_condition()
+        async with pool_condition:
+            idle_connections, self.idle_connections = self.idle_connections, []
+            self.connection_count -= len(idle_connections)
+        for connection, _ in idle_connections:
+            await self._close_quietly(connection)
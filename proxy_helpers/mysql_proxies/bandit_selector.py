@@ -0,0 +1,229 @@
+import asyncio
+import logging
+from pathlib import Path
+from threading import Lock
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from proxy_helpers.mysql_proxies.proxy_dispenser import AsyncBatchLoader, BatchLoader
+from proxy_helpers.mysql_proxies.score_buffer import ProxyKey, get_proxy_key
+
+logger = logging.getLogger(f"proxy_helpers:{Path(__file__).name}")
+
+SELECTION_STRATEGIES = ("thompson", "ucb")
+
+
+class BanditSelector:
+    """Proxies drawn as the arms of a bandit, by Thompson sampling or UCB, from a universe held as arrays
+    Each proxy has success and failure counts, seeded from its error_count (up to prior_cap) and updated
+    in place by record. Its chance of success is weighted by 1 / (1 + latency_weight * latency), seconds,
+    proxies never measured count as instant so they get measured.
+    Draws are made draw_size at a time in one vectorized call: results recorded in between
+    are used from the next draws on. Thompson sampling may draw a proxy several times in a row,
+    UCB draws the draw_size best proxies once each, so draw_size should stay well below the batch size"""
+
+    def __init__(
+            self,
+            strategy: str = "thompson",
+            draw_size: int = 64,
+            ucb_exploration: float = 2.0,
+            prior_cap: float = 10.0,
+            latency_weight: float = 1.0,
+            latency_alpha: float = 0.3,
+            seed: Optional[int] = None,
+    ):
+        if strategy not in SELECTION_STRATEGIES:
+            raise ValueError(f"Unknown selection strategy: {strategy}, expected one of {SELECTION_STRATEGIES}")
+        self.strategy: str = strategy
+        self.draw_size: int = max(1, draw_size)
+        self.ucb_exploration: float = ucb_exploration
+        self.prior_cap: float = prior_cap
+        self.latency_weight: float = latency_weight
+        self.latency_alpha: float = latency_alpha
+        self.rng = np.random.default_rng(seed)
+
+        # one entry per proxy, proxy_indexes maps proxy_id and (proxy_url, proxy_port) to it
+        self.proxies: List = []
+        self.proxy_indexes: Dict[ProxyKey, int] = {}
+        self.successes: np.ndarray = np.zeros(0)
+        self.failures: np.ndarray = np.zeros(0)
+        # latency averages, NaN until measured
+        self.latencies: np.ndarray = np.zeros(0)
+        # indexes drawn and not served yet, served from the end
+        self.draws: List[int] = []
+        self.selector_lock: Lock = Lock()
+
+    def load(self, proxies: Iterable) -> int:
+        """select from proxies instead of the current ones, return their number
+        Proxies already loaded keep their counts and latency, so a refresh doesn't reset what was learnt"""
+        new_proxies: List = []
+        new_indexes: Dict[ProxyKey, int] = {}
+        for proxy in proxies:
+            proxy_keys = [get_proxy_key(proxy_id=proxy.get("proxy_id")),
+                          get_proxy_key(proxy_url=proxy.get("proxy_url"), proxy_port=proxy.get("proxy_port"))]
+            proxy_keys = [proxy_key for proxy_key in proxy_keys if proxy_key is not None]
+            if len(proxy_keys) == 0 or any(proxy_key in new_indexes for proxy_key in proxy_keys):
+                continue
+            for proxy_key in proxy_keys:
+                new_indexes[proxy_key] = len(new_proxies)
+            new_proxies.append(proxy)
+
+        error_counts = np.fromiter((proxy.get("error_count") or 0 for proxy in new_proxies),
+                                   dtype=float, count=len(new_proxies))
+        successes = np.clip(-error_counts, 0, self.prior_cap)
+        failures = np.clip(error_counts, 0, self.prior_cap)
+        latencies = np.fromiter((np.nan if proxy.get("latency_ewma") is None else proxy.get("latency_ewma")
+                                 for proxy in new_proxies), dtype=float, count=len(new_proxies))
+        with self.selector_lock:
+            # index each proxy had in the current arrays, -1 if new
+            old_indexes = np.full(len(new_proxies), -1)
+            for proxy_key, index in new_indexes.items():
+                old_indexes[index] = max(old_indexes[index], self.proxy_indexes.get(proxy_key, -1))
+            known = old_indexes >= 0
+            successes[known] = self.successes[old_indexes[known]]
+            failures[known] = self.failures[old_indexes[known]]
+            measured = known.copy()
+            measured[known] = ~np.isnan(self.latencies[old_indexes[known]])
+            latencies[measured] = self.latencies[old_indexes[measured]]
+
+            self.proxies, self.proxy_indexes = new_proxies, new_indexes
+            self.successes, self.failures, self.latencies = successes, failures, latencies
+            self.draws = []
+        return len(new_proxies)
+
+    def record(self, proxy_key: Optional[ProxyKey], success: Optional[bool] = None,
+               latency: Optional[float] = None) -> bool:
+        """count a success or failure and/or merge a latency (seconds) for the proxy,
+        return False if it isn't loaded"""
+        with self.selector_lock:
+            index = self.proxy_indexes.get(proxy_key)
+            if index is None:
+                return False
+            if success is not None:
+                if success:
+                    self.successes[index] += 1
+                else:
+                    self.failures[index] += 1
+            if latency is not None:
+                ewma = self.latencies[index]
+                self.latencies[index] = latency if np.isnan(ewma) else (
+                        self.latency_alpha * latency + (1 - self.latency_alpha) * ewma)
+        return True
+
+    def draw(self):
+        """return the next proxy to use, None if none is loaded"""
+        with self.selector_lock:
+            if len(self.draws) == 0:
+                if len(self.proxies) == 0:
+                    return None
+                self.draws = self._draw_indexes()[::-1].tolist()
+            return self.proxies[self.draws.pop()]
+
+    def _draw_indexes(self) -> np.ndarray:
+        latency_weights = 1.0 / (1.0 + self.latency_weight * np.nan_to_num(self.latencies, nan=0.0))
+        if self.strategy == "thompson":
+            # draw_size samples of every posterior, the best arm of each row is served
+            samples = self.rng.beta(self.successes + 1, self.failures + 1,
+                                    size=(self.draw_size, len(self.proxies)))
+            return np.argmax(samples * latency_weights, axis=1)
+
+        # UCB1 scores are deterministic, the draw_size best arms are served, best first
+        trials = self.successes + self.failures
+        means = (self.successes + 1) / (trials + 2)
+        bonuses = np.sqrt(self.ucb_exploration * np.log(trials.sum() + 2) / (trials + 1))
+        scores = (means + bonuses) * latency_weights
+        draw_count: int = min(self.draw_size, len(scores))
+        best_indexes = np.argpartition(-scores, draw_count - 1)[:draw_count]
+        return best_indexes[np.argsort(-scores[best_indexes], kind="stable")]
+
+
+class BanditDispenser:
+    """ProxyDispenser interface over a BanditSelector
+    Batches are loaded in the background by a BatchLoader, proxies already loaded keep their counts"""
+
+    def __init__(
+            self,
+            load_batch: Callable[[], Optional[list]],
+            strategy: str = "thompson",
+            draw_size: int = 64,
+            seed: Optional[int] = None,
+            low_watermark: Optional[float] = 0.2,
+            on_install: Optional[Callable[[list], None]] = None,
+    ):
+        self.bandit_selector: BanditSelector = BanditSelector(strategy=strategy, draw_size=draw_size, seed=seed)
+        self.batch_loader: BatchLoader = BatchLoader(load_batch=load_batch,
+                                                     install_batch=self.bandit_selector.load,
+                                                     low_watermark=low_watermark,
+                                                     on_install=on_install)
+
+    def next_proxy(self):
+        """return the proxy drawn by the bandit, None if no proxy could be loaded"""
+        self.batch_loader.before_serve()
+        proxy = self.bandit_selector.draw()
+        if proxy is not None:
+            self.batch_loader.count_served()
+        return proxy
+
+    def record(self, proxy_key: Optional[ProxyKey], success: Optional[bool] = None,
+               latency: Optional[float] = None) -> bool:
+        """see BanditSelector.record"""
+        return self.bandit_selector.record(proxy_key, success=success, latency=latency)
+
+    def load_first_batch(self):
+        """load a batch if none is loaded, without drawing a proxy"""
+        self.batch_loader.before_serve()
+
+    def preload(self, batch: list):
+        """draw from batch (e.g. read from a snapshot) right away, a fresh batch is loaded in the background
+        on the next call and replaces it once loaded"""
+        self.batch_loader.preload(batch)
+
+    def clear(self):
+        """the next call to next_proxy loads a fresh batch, counts are kept"""
+        self.batch_loader.clear()
+
+
+class AsyncBanditDispenser:
+    """asyncio version of BanditDispenser"""
+
+    def __init__(
+            self,
+            load_batch: Callable[[], Awaitable[Optional[list]]],
+            strategy: str = "thompson",
+            draw_size: int = 64,
+            seed: Optional[int] = None,
+            low_watermark: Optional[float] = 0.2,
+            on_install: Optional[Callable[[list], None]] = None,
+    ):
+        self.bandit_selector: BanditSelector = BanditSelector(strategy=strategy, draw_size=draw_size, seed=seed)
+        self.batch_loader: AsyncBatchLoader = AsyncBatchLoader(load_batch=load_batch,
+                                                               install_batch=self.bandit_selector.load,
+                                                               low_watermark=low_watermark,
+                                                               on_install=on_install)
+
+    async def next_proxy(self):
+        """return the proxy drawn by the bandit, None if no proxy could be loaded"""
+        await self.batch_loader.before_serve()
+        proxy = self.bandit_selector.draw()
+        if proxy is not None:
+            self.batch_loader.count_served()
+        return proxy
+
+    def record(self, proxy_key: Optional[ProxyKey], success: Optional[bool] = None,
+               latency: Optional[float] = None) -> bool:
+        """see BanditSelector.record"""
+        return self.bandit_selector.record(proxy_key, success=success, latency=latency)
+
+    async def load_first_batch(self):
+        """load a batch if none is loaded, without drawing a proxy"""
+        await self.batch_loader.before_serve()
+
+    def preload(self, batch: list):
+        """draw from batch (e.g. read from a snapshot) right away, a fresh batch is loaded in a task
+        on the next call and replaces it once loaded"""
+        self.batch_loader.preload(batch)
+
+    def clear(self):
+        """the next call to next_proxy loads a fresh batch, counts are kept"""
+        self.batch_loader.clear()
@@ -0,0 +1,76 @@
+import logging
+from pathlib import Path
+from threading import Lock
+from time import monotonic
+from typing import Callable, Dict, Optional
+
+from proxy_helpers.mysql_proxies.score_buffer import ProxyKey, get_proxy_key
+
+logger = logging.getLogger(f"proxy_helpers:{Path(__file__).name}")
+
+
+class CircuitBreaker:
+    """In-process per-proxy circuit breaker
+    failure_threshold consecutive failures open a proxy, it is skipped until cooldown (seconds)
+    has passed, then one half-open probe is let through: a success closes it, a failure reopens it"""
+
+    def __init__(
+            self,
+            cooldown: float = 60.0,
+            failure_threshold: int = 1,
+            clock: Callable[[], float] = monotonic,
+    ):
+        self.cooldown: float = cooldown
+        self.failure_threshold: int = failure_threshold
+        self.clock = clock
+
+        # proxy key: consecutive failures, and proxy key: time it was opened (or last probed)
+        self.failure_counts: Dict[ProxyKey, int] = {}
+        self.open_proxies: Dict[ProxyKey, float] = {}
+        self.probe_lock: Lock = Lock()
+
+    def record(self, proxy_key: Optional[ProxyKey], success: bool):
+        """record one request result through the proxy"""
+        if proxy_key is None:
+            return
+        if success:
+            self.failure_counts.pop(proxy_key, None)
+            if self.open_proxies.pop(proxy_key, None) is not None:
+                logger.debug("Proxy %s closed", proxy_key)
+            return
+        failure_count = self.failure_counts.get(proxy_key, 0) + 1
+        self.failure_counts[proxy_key] = failure_count
+        if failure_count >= self.failure_threshold:
+            self.open_proxies[proxy_key] = self.clock()
+            logger.debug("Proxy %s opened after %s failures", proxy_key, failure_count)
+
+    def allow(self, proxy_key: Optional[ProxyKey]) -> bool:
+        """return False while the proxy is open, True for closed proxies and for one half-open probe"""
+        opened_at = self.open_proxies.get(proxy_key)
+        if opened_at is None:
+            return True
+        if self.clock() - opened_at < self.cooldown:
+            return False
+        with self.probe_lock:
+            # restart the cooldown so a single caller gets the probe
+            if self.open_proxies.get(proxy_key) != opened_at:
+                return False
+            self.open_proxies[proxy_key] = self.clock()
+        return True
+
+    def allow_proxy(self, proxy) -> bool:
+        """allow() for a Proxy record or proxy dict, checked by proxy_id and by (proxy_url, proxy_port)
+        as update_proxy_score may be called with either"""
+        if len(self.open_proxies) == 0:
+            return True
+        proxy_id = proxy.get("proxy_id")
+        if proxy_id and not self.allow(int(proxy_id)):
+            return False
+        return self.allow(get_proxy_key(proxy_url=proxy.get("proxy_url"), proxy_port=proxy.get("proxy_port")))
+
+    def is_open(self, proxy_key: ProxyKey) -> bool:
+        return proxy_key in self.open_proxies
+
+    def clear(self):
+        self.failure_counts.clear()
+        self.open_proxies.clear()
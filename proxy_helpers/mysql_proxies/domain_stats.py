@@ -0,0 +1,141 @@
+import random
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from proxy_helpers.mysql_proxies.score_buffer import ProxyKey, get_proxy_key
+
+# Per target domain proxy scores are kept in tbl_proxy_domain_stats, see proxy_schema.
+# Only scores given with a proxy_id are kept per domain.
+DomainKey = Tuple[int, str]
+
+
+def get_domain(target: str) -> str:
+    """return the lower case host of a url or domain, without www."""
+    if "://" in target:
+        host: str = urlsplit(target).hostname or ""
+    else:
+        host = target.split("/")[0].split(":")[0]
+    host = host.strip().lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def build_domain_stats_select_query(domain: str, proxy_ids: List[int]) -> Tuple[str, tuple]:
+    """return the SELECT of the domain stats of proxy_ids"""
+    sql_string = f"""
+                SELECT proxy_id, success_count, error_count
+                FROM tbl_proxy_domain_stats
+                WHERE domain= %s AND proxy_id IN ({', '.join(['%s'] * len(proxy_ids))})
+            """
+    return sql_string, (domain,) + tuple(proxy_ids)
+
+
+def build_domain_stats_upsert_query(deltas: Dict[DomainKey, List[int]]) -> Optional[Tuple[str, tuple]]:
+    """return one multi-row INSERT ... ON DUPLICATE KEY UPDATE adding success and error count deltas
+    the row alias needs MySQL 8.0.19+"""
+    if len(deltas) == 0:
+        return None
+    sql_variables: list = []
+    for (proxy_id, domain), (success_count, error_count) in deltas.items():
+        sql_variables.extend((proxy_id, domain, success_count, error_count))
+    sql_string = f"""
+                INSERT INTO tbl_proxy_domain_stats (proxy_id, domain, success_count, error_count)
+                VALUES {", ".join(["(%s, %s, %s, %s)"] * len(deltas))}
+                AS new
+                ON DUPLICATE KEY UPDATE
+                    success_count= success_count + new.success_count,
+                    error_count= error_count + new.error_count
+            """
+    return sql_string, tuple(sql_variables)
+
+
+class DomainStats:
+    """Success and error counts per (proxy_id, domain), ranking and sticky proxy per domain
+    Counts not yet written are kept as deltas until drained, so they are persisted in batches"""
+
+    def __init__(self, top_fraction: float = 0.5):
+        self.top_fraction: float = top_fraction
+        # domain: {proxy_id: [success_count, error_count]}
+        self.domain_counts: Dict[str, Dict[int, List[int]]] = {}
+        self.deltas: Dict[DomainKey, List[int]] = {}
+        # domain: proxy key of its last success, and the proxies of its last ranked batch by key
+        self.sticky_keys: Dict[str, ProxyKey] = {}
+        self.ranked_proxies: Dict[str, Dict[ProxyKey, object]] = {}
+        self.stats_lock: Lock = Lock()
+
+    def record(self, proxy_key: Optional[ProxyKey], domain: str, success: bool):
+        """record one request result through the proxy on domain"""
+        if proxy_key is None:
+            return
+        if success:
+            self.sticky_keys[domain] = proxy_key
+        elif domain in self.sticky_keys and self._is_sticky_proxy(proxy_key, domain):
+            self.sticky_keys.pop(domain, None)
+        if not isinstance(proxy_key, int):
+            return
+        count_index: int = 0 if success else 1
+        with self.stats_lock:
+            self.domain_counts.setdefault(domain, {}).setdefault(proxy_key, [0, 0])[count_index] += 1
+            self.deltas.setdefault((proxy_key, domain), [0, 0])[count_index] += 1
+
+    def _is_sticky_proxy(self, proxy_key: ProxyKey, domain: str) -> bool:
+        # the sticky proxy may have been scored by id and by (url, port)
+        sticky_key = self.sticky_keys.get(domain)
+        if sticky_key == proxy_key:
+            return True
+        proxies_by_key = self.ranked_proxies.get(domain, {})
+        sticky_proxy = proxies_by_key.get(sticky_key)
+        return sticky_proxy is not None and proxies_by_key.get(proxy_key) is sticky_proxy
+
+    def get_error_score(self, proxy_id: Optional[int], domain: str) -> int:
+        """return errors - successes of the proxy on domain, 0 if it was never used there"""
+        success_count, error_count = self.domain_counts.get(domain, {}).get(proxy_id, (0, 0))
+        return error_count - success_count
+
+    def seed(self, domain: str, rows: Iterable[tuple]):
+        """set the counts of domain from (proxy_id, success_count, error_count) rows, plus deltas not yet written"""
+        with self.stats_lock:
+            domain_counts: Dict[int, List[int]] = self.domain_counts.setdefault(domain, {})
+            for proxy_id, success_count, error_count in rows:
+                delta = self.deltas.get((proxy_id, domain), (0, 0))
+                domain_counts[proxy_id] = [success_count + delta[0], error_count + delta[1]]
+
+    def rank(self, proxies: List, domain: str, shuffle_results: bool = True) -> List:
+        """keep the top_fraction of proxies with the lowest error score on domain, shuffled"""
+        if not proxies:
+            return proxies
+        keep_count: int = max(1, int(len(proxies) * self.top_fraction))
+        # random tie-break so proxies never used on domain are spread
+        ranked_proxies: List = sorted(
+            proxies, key=lambda proxy: (self.get_error_score(proxy.get("proxy_id"), domain), random.random())
+        )[:keep_count]
+        proxies_by_key: Dict[ProxyKey, object] = {}
+        for proxy in ranked_proxies:
+            proxies_by_key[get_proxy_key(proxy_url=proxy.get("proxy_url"), proxy_port=proxy.get("proxy_port"))] = proxy
+            if proxy.get("proxy_id"):
+                proxies_by_key[int(proxy.get("proxy_id"))] = proxy
+        self.ranked_proxies[domain] = proxies_by_key
+        if shuffle_results:
+            random.shuffle(ranked_proxies)
+        return ranked_proxies
+
+    def get_sticky_proxy(self, domain: str):
+        """return the proxy of the last success on domain, None if there is none or it left the ranking"""
+        sticky_key = self.sticky_keys.get(domain)
+        if sticky_key is None:
+            return None
+        return self.ranked_proxies.get(domain, {}).get(sticky_key)
+
+    def drain(self) -> Dict[DomainKey, List[int]]:
+        """return the count deltas recorded since the last drain"""
+        with self.stats_lock:
+            deltas, self.deltas = self.deltas, {}
+        return deltas
+
+    def requeue(self, deltas: Dict[DomainKey, List[int]]):
+        """put drained deltas back, after a failed write"""
+        with self.stats_lock:
+            for domain_key, (success_count, error_count) in deltas.items():
+                delta = self.deltas.setdefault(domain_key, [0, 0])
+                delta[0] += success_count
+                delta[1] += error_count
@@ -0,0 +1,130 @@
+import random
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from proxy_helpers.mysql_proxies.proxy_record import PROXY_COLUMNS
+from proxy_helpers.mysql_proxies.score_buffer import ProxyKey, get_proxy_key
+
+# latency_ewma (seconds, NULL until measured) is a tbl_proxy_url column, see proxy_schema
+PROXY_LATENCY_RECORDS_SQL: str = f"""
+                    SELECT {", ".join(f"a.{column}" for column in PROXY_COLUMNS)}, a.latency_ewma
+                    FROM tbl_proxy_url a
+                    ORDER BY a.error_count ASC
+                    LIMIT %s
+                """
+
+
+def get_proxy_key_from_full_url(proxy_full_url: str) -> Optional[ProxyKey]:
+    """return (proxy_url, proxy_port) from 'proxy_url:proxy_port'"""
+    proxy_url, _, proxy_port = proxy_full_url.rpartition(":")
+    return get_proxy_key(proxy_url=proxy_url, proxy_port=proxy_port)
+
+
+def build_latency_update_query(latencies: Dict[ProxyKey, float]) -> Optional[Tuple[str, tuple]]:
+    """return one multi-row UPDATE setting latency_ewma, keys as in build_score_update_query"""
+    case_strings: list = []
+    case_variables: list = []
+    proxy_ids: list = []
+    url_where_strings: list = []
+    url_where_variables: list = []
+    for proxy_key, latency in latencies.items():
+        if isinstance(proxy_key, tuple):
+            condition = "(proxy_url= %s AND proxy_port=%s)"
+            case_variables.extend(proxy_key)
+            url_where_strings.append(condition)
+            url_where_variables.extend(proxy_key)
+        else:
+            condition = "proxy_id= %s"
+            case_variables.append(proxy_key)
+            proxy_ids.append(proxy_key)
+        case_strings.append(f"WHEN {condition} THEN %s")
+        case_variables.append(latency)
+
+    if len(case_strings) == 0:
+        return None
+
+    where_strings: list = url_where_strings
+    if len(proxy_ids) > 0:
+        where_strings = [f"proxy_id IN ({', '.join(['%s'] * len(proxy_ids))})"] + url_where_strings
+
+    sql_string = f"""
+                UPDATE tbl_proxy_url
+                SET latency_ewma= CASE
+                    {" ".join(case_strings)}
+                    ELSE latency_ewma END
+                WHERE {" OR ".join(where_strings)}
+            """
+    return sql_string, tuple(case_variables + proxy_ids + url_where_variables)
+
+
+class LatencyTracker:
+    """Exponentially weighted moving average of proxy response times (seconds)
+    ewma = alpha * latency + (1 - alpha) * ewma, seeded from the persisted latency_ewma.
+    Reported proxies are kept dirty until drained, so they are persisted in batches"""
+
+    def __init__(self, alpha: float = 0.3):
+        self.alpha: float = alpha
+        self.latencies: Dict[ProxyKey, float] = {}
+        self.dirty_keys: Set[ProxyKey] = set()
+        self.latency_lock: Lock = Lock()
+
+    def report(self, proxy_key: Optional[ProxyKey], latency: float) -> Optional[float]:
+        """merge one observed latency, return the new average"""
+        if proxy_key is None:
+            return None
+        with self.latency_lock:
+            ewma = self.latencies.get(proxy_key)
+            ewma = latency if ewma is None else self.alpha * latency + (1 - self.alpha) * ewma
+            self.latencies[proxy_key] = ewma
+            self.dirty_keys.add(proxy_key)
+        return ewma
+
+    def get_latency(self, proxy) -> Optional[float]:
+        """return the average for a Proxy record or proxy dict, by proxy_id then (proxy_url, proxy_port),
+        falling back on its persisted latency_ewma"""
+        proxy_id = proxy.get("proxy_id")
+        if proxy_id:
+            ewma = self.latencies.get(int(proxy_id))
+            if ewma is not None:
+                return ewma
+        ewma = self.latencies.get(get_proxy_key(proxy_url=proxy.get("proxy_url"), proxy_port=proxy.get("proxy_port")))
+        if ewma is not None:
+            return ewma
+        return proxy.get("latency_ewma")
+
+    def drain(self) -> Dict[ProxyKey, float]:
+        """return the averages reported since the last drain"""
+        with self.latency_lock:
+            dirty_keys, self.dirty_keys = self.dirty_keys, set()
+            return {proxy_key: self.latencies[proxy_key] for proxy_key in dirty_keys}
+
+    def requeue(self, proxy_keys: Iterable[ProxyKey]):
+        """mark drained proxies dirty again, after a failed write"""
+        with self.latency_lock:
+            self.dirty_keys.update(proxy_keys)
+
+    def seed(self, proxies: Iterable):
+        """start the averages of proxies not measured here from their persisted latency_ewma"""
+        with self.latency_lock:
+            for proxy in proxies:
+                latency_ewma = proxy.get("latency_ewma")
+                if latency_ewma is None:
+                    continue
+                proxy_key = get_proxy_key(proxy_id=proxy.get("proxy_id"),
+                                          proxy_url=proxy.get("proxy_url"),
+                                          proxy_port=proxy.get("proxy_port"))
+                if proxy_key is not None and proxy_key not in self.latencies:
+                    self.latencies[proxy_key] = float(latency_ewma)
+
+    def select_fastest(self, proxies: List, top_fraction: float = 0.5, shuffle_results: bool = True) -> List:
+        """keep the fastest top_fraction of proxies, shuffled
+        Proxies never measured are kept so they get a latency"""
+        if not proxies:
+            return proxies
+        latencies = [(self.get_latency(proxy), index) for index, proxy in enumerate(proxies)]
+        keep_count: int = max(1, int(len(proxies) * top_fraction))
+        latencies.sort(key=lambda latency_index: -1.0 if latency_index[0] is None else latency_index[0])
+        fastest_proxies: List = [proxies[index] for _, index in latencies[:keep_count]]
+        if shuffle_results:
+            random.shuffle(fastest_proxies)
+        return fastest_proxies
@@ -0,0 +1,297 @@
+import asyncio
+import math
+import re
+import sqlite3
+from datetime import datetime, timezone
+from threading import Lock
+from time import sleep
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+# sqlite version of the proxy_schema tables, same columns and index names,
+# triggers stand in for ON UPDATE CURRENT_TIMESTAMP(6) and the delete tombstones
+SQLITE_SCHEMA: str = """
+    CREATE TABLE IF NOT EXISTS tbl_proxy_url (
+        proxy_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        upload_datetime TEXT,
+        proxy_url TEXT NOT NULL,
+        proxy_port INTEGER NOT NULL,
+        proxy_country TEXT,
+        proxy_town TEXT,
+        proxy_speed REAL,
+        proxy_web_name TEXT,
+        error_count INTEGER NOT NULL DEFAULT 0,
+        error_selenium_count INTEGER NOT NULL DEFAULT 0,
+        latency_ewma REAL,
+        lease_owner TEXT,
+        lease_expires TEXT,
+        updated_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+        decayed_score REAL NOT NULL DEFAULT 0,
+        score_updated_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+        score_rank REAL NOT NULL DEFAULT 0
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_proxy_url_port ON tbl_proxy_url (proxy_url, proxy_port);
+    CREATE INDEX IF NOT EXISTS idx_error_count ON tbl_proxy_url (error_count);
+    CREATE INDEX IF NOT EXISTS idx_updated_at ON tbl_proxy_url (updated_at);
+    CREATE INDEX IF NOT EXISTS idx_lease_owner ON tbl_proxy_url (lease_owner);
+    CREATE INDEX IF NOT EXISTS idx_score_rank ON tbl_proxy_url (score_rank);
+    CREATE TRIGGER IF NOT EXISTS trg_proxy_url_updated_at AFTER UPDATE ON tbl_proxy_url
+        FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+        BEGIN
+            UPDATE tbl_proxy_url SET updated_at= strftime('%Y-%m-%d %H:%M:%f', 'now') WHERE proxy_id= NEW.proxy_id;
+        END;
+    CREATE TABLE IF NOT EXISTS tbl_proxy_url_deleted (
+        proxy_id INTEGER PRIMARY KEY,
+        deleted_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+    );
+    CREATE INDEX IF NOT EXISTS idx_deleted_at ON tbl_proxy_url_deleted (deleted_at);
+    CREATE TRIGGER IF NOT EXISTS trg_proxy_url_deleted AFTER DELETE ON tbl_proxy_url
+        FOR EACH ROW
+        BEGIN
+            REPLACE INTO tbl_proxy_url_deleted (proxy_id) VALUES (OLD.proxy_id);
+        END;
+    CREATE TABLE IF NOT EXISTS tbl_proxy_domain_stats (
+        proxy_id INTEGER NOT NULL,
+        domain TEXT NOT NULL,
+        success_count INTEGER NOT NULL DEFAULT 0,
+        error_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (proxy_id, domain)
+    );
+"""
+
+# conflict target used to translate ON DUPLICATE KEY UPDATE, per table
+UNIQUE_KEYS = {
+    "tbl_proxy_url": "proxy_url, proxy_port",
+    "tbl_proxy_domain_stats": "proxy_id, domain",
+}
+
+_ON_DUPLICATE_PATTERN = re.compile(r"ON\s+DUPLICATE\s+KEY\s+UPDATE", re.IGNORECASE)
+_INSERT_TABLE_PATTERN = re.compile(r"INSERT\s+INTO\s+`?(\w+)`?", re.IGNORECASE)
+_VALUES_FUNCTION_PATTERN = re.compile(r"VALUES\((`?\w+`?)\)", re.IGNORECASE)
+_ROW_ALIAS_PATTERN = re.compile(r"\s+AS\s+(\w+)\s+(?=ON\s+DUPLICATE\s+KEY\s+UPDATE)", re.IGNORECASE)
+_DATE_ADD_SECONDS_PATTERN = re.compile(r"DATE_ADD\(NOW\(\),\s*INTERVAL\s+%s\s+SECOND\)", re.IGNORECASE)
+_NOW_PATTERN = re.compile(r"NOW\(\)", re.IGNORECASE)
+_NOW_MICROSECONDS_PATTERN = re.compile(r"NOW\(6\)", re.IGNORECASE)
+# sqlite serializes writers, and queries already run one at a time under connection_lock
+_FOR_UPDATE_PATTERN = re.compile(r"FOR\s+UPDATE(\s+SKIP\s+LOCKED)?", re.IGNORECASE)
+
+
+def translate_mysql_query(sql_query: str) -> str:
+    """translate the MySQL dialect used by the handlers to sqlite"""
+    sql_query = _DATE_ADD_SECONDS_PATTERN.sub("datetime('now', '+' || %s || ' seconds')", sql_query)
+    sql_query = _NOW_PATTERN.sub("datetime('now')", sql_query)
+    sql_query = _NOW_MICROSECONDS_PATTERN.sub("strftime('%Y-%m-%d %H:%M:%f', 'now')", sql_query)
+    sql_query = _FOR_UPDATE_PATTERN.sub("", sql_query)
+    sql_query = sql_query.replace("%s", "?")
+    if _ON_DUPLICATE_PATTERN.search(sql_query):
+        table_name = _INSERT_TABLE_PATTERN.search(sql_query).group(1)
+        # the row alias of INSERT ... AS new ON DUPLICATE KEY UPDATE column= new.column
+        row_alias = _ROW_ALIAS_PATTERN.search(sql_query)
+        if row_alias is not None:
+            sql_query = _ROW_ALIAS_PATTERN.sub(" ", sql_query)
+            sql_query = re.sub(rf"\b{row_alias.group(1)}\.", "excluded.", sql_query)
+        sql_query = _ON_DUPLICATE_PATTERN.sub(f"ON CONFLICT({UNIQUE_KEYS[table_name]}) DO UPDATE SET", sql_query)
+        sql_query = _VALUES_FUNCTION_PATTERN.sub(r"excluded.\1", sql_query)
+    return sql_query
+
+
+def _unix_timestamp(value: Optional[str]) -> Optional[float]:
+    # sqlite datetimes are UTC text, see translate_mysql_query
+    if value is None:
+        return None
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp()
+
+
+def _to_sqlite_variables(sql_variables: Optional[tuple]) -> tuple:
+    return tuple(value.isoformat(sep=" ") if isinstance(value, datetime) else value
+                 for value in (sql_variables or ()))
+
+
+class MemoryCursor:
+    """DB-API like cursor over the MemoryBackend connection, for run_in_transaction callbacks"""
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+        self.cursor: Optional[sqlite3.Cursor] = None
+
+    def execute(self, sql_query: str, sql_variables: Optional[tuple] = None):
+        self.cursor = self.connection.execute(translate_mysql_query(sql_query), _to_sqlite_variables(sql_variables))
+
+    def fetchall(self) -> List[tuple]:
+        return self.cursor.fetchall()
+
+    @property
+    def rowcount(self) -> int:
+        return self.cursor.rowcount
+
+
+class AsyncMemoryCursor(MemoryCursor):
+    """MemoryCursor with awaitable execute and fetchall"""
+
+    async def execute(self, sql_query: str, sql_variables: Optional[tuple] = None):
+        super().execute(sql_query, sql_variables)
+
+    async def fetchall(self) -> List[tuple]:
+        return super().fetchall()
+
+
+class MemoryBackend:
+    """In-memory stand-in for MySQL, backed by sqlite, for tests and benchmarks without a server
+    query_latency (seconds) is slept on every query to mimic the network round trip,
+    while offline every query raises ConnectionError, as with an unreachable server
+    Unlike MySQL, an upsert counts 1 affected row whether the row was inserted or updated,
+    insert_proxies doesn't rely on it, see proxy_upsert.add_upsert_counts"""
+
+    def __init__(self, query_latency: float = 0.0):
+        self.query_latency: float = query_latency
+        self.query_count: int = 0
+        self.offline: bool = False
+
+        self.connection = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+        self.connection.create_function("GREATEST", -1, max, deterministic=True)
+        self.connection.create_function("LEAST", -1, min, deterministic=True)
+        self.connection.create_function("CONCAT", -1, lambda *values: "".join(str(value) for value in values),
+                                        deterministic=True)
+        self.connection.create_function("POW", 2, pow, deterministic=True)
+        self.connection.create_function("LOG2", 1, math.log2, deterministic=True)
+        self.connection.create_function("UNIX_TIMESTAMP", 1, _unix_timestamp, deterministic=True)
+        self.connection.executescript(SQLITE_SCHEMA)
+        self.connection_lock: Lock = Lock()
+
+    def run_query(self, sql_query: str, sql_variables: Optional[tuple] = None) -> Tuple[List[tuple], List[str], int]:
+        """run a MySQL dialect query, return (rows, column names, affected rows), no simulated latency"""
+        self._check_online()
+        sql_variables = _to_sqlite_variables(sql_variables)
+        with self.connection_lock:
+            self.query_count += 1
+            cursor = self.connection.execute(translate_mysql_query(sql_query), sql_variables)
+            rows: List[tuple] = cursor.fetchall()
+            column_names: List[str] = [column[0] for column in cursor.description or ()]
+            return rows, column_names, cursor.rowcount
+
+    def _check_online(self):
+        if self.offline:
+            raise ConnectionError("MemoryBackend is offline")
+
+    def fetch_all_as_tuples(self, sql_query: str, sql_variables: Optional[tuple] = None) -> List[tuple]:
+        if self.query_latency:
+            sleep(self.query_latency)
+        return self.run_query(sql_query, sql_variables)[0]
+
+    def fetch_all_as_df(self, sql_query: str, sql_variables: Optional[tuple] = None, close_connection: bool = False):
+        import pandas as pd
+
+        if self.query_latency:
+            sleep(self.query_latency)
+        rows, column_names, _ = self.run_query(sql_query, sql_variables)
+        return pd.DataFrame(rows, columns=column_names)
+
+    def execute_one_query(self, sql_query: str, sql_variables: Optional[tuple] = None,
+                          close_connection: bool = False) -> int:
+        if self.query_latency:
+            sleep(self.query_latency)
+        return self.run_query(sql_query, sql_variables)[2]
+
+    def run_in_transaction(self, callback: Callable):
+        """return callback(MemoryCursor) run in one transaction"""
+        if self.query_latency:
+            sleep(self.query_latency)
+        self._check_online()
+        with self.connection_lock:
+            self.query_count += 1
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = callback(MemoryCursor(self.connection))
+                self.connection.execute("COMMIT")
+                return result
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def add_proxies(self, proxy_count: int, proxy_country: str = "GB", error_count: int = 0) -> int:
+        """insert proxy_count generated proxies, return the number of rows inserted"""
+        first_proxy_id: int = self.run_query("SELECT COALESCE(MAX(proxy_id), 0) FROM tbl_proxy_url")[0][0][0]
+        upload_datetime: str = datetime.utcnow().isoformat(sep=" ")
+        proxy_rows = [
+            (upload_datetime, f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}", 8080 + index // 16777216,
+             proxy_country, None, None, "memory_backend", error_count)
+            for index in range(first_proxy_id, first_proxy_id + proxy_count)
+        ]
+        with self.connection_lock:
+            cursor = self.connection.executemany(
+                """INSERT INTO tbl_proxy_url
+                (upload_datetime, proxy_url, proxy_port, proxy_country, proxy_town, proxy_speed, proxy_web_name,
+                error_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                proxy_rows,
+            )
+        return cursor.rowcount
+
+
+class MemoryBackendMixin:
+    """Put before a sync handler class to run it against a MemoryBackend:
+        class MemoryProxyHandler(MemoryBackendMixin, ProxyHandler): pass
+        MemoryProxyHandler(memory_backend=MemoryBackend(), proxy_universe_size=100)
+    """
+
+    def __init__(self, *args, memory_backend: MemoryBackend, **kwargs):
+        self.memory_backend: MemoryBackend = memory_backend
+        super().__init__(*args, **kwargs)
+
+    def fetch_all_as_tuples(self, sql_query: str, sql_variables: Optional[tuple] = None) -> List[tuple]:
+        return self.memory_backend.fetch_all_as_tuples(sql_query=sql_query, sql_variables=sql_variables)
+
+    def fetch_all_as_df(self, sql_query: str, sql_variables: Optional[tuple] = None, close_connection: bool = False):
+        return self.memory_backend.fetch_all_as_df(sql_query=sql_query, sql_variables=sql_variables)
+
+    def execute_one_query(self, sql_query: str, sql_variables: Optional[tuple] = None,
+                          close_connection: bool = False) -> int:
+        return self.memory_backend.execute_one_query(sql_query=sql_query, sql_variables=sql_variables)
+
+    def run_in_transaction(self, callback: Callable):
+        return self.memory_backend.run_in_transaction(callback)
+
+
+class AsyncMemoryBackendMixin:
+    """Put before the async handler class to run it against a MemoryBackend
+    query_latency is awaited with asyncio.sleep so concurrent tasks overlap as they would on MySQL"""
+
+    def __init__(self, *args, memory_backend: MemoryBackend, **kwargs):
+        self.memory_backend: MemoryBackend = memory_backend
+        super().__init__(*args, **kwargs)
+
+    async def _sleep_query_latency(self):
+        if self.memory_backend.query_latency:
+            await asyncio.sleep(self.memory_backend.query_latency)
+
+    async def fetch_all_as_tuples(self, sql_query: str, sql_variables: Optional[tuple] = None) -> List[tuple]:
+        await self._sleep_query_latency()
+        return self.memory_backend.run_query(sql_query, sql_variables)[0]
+
+    async def fetch_all_as_df(self, sql_query: str, sql_variables: Optional[tuple] = None,
+                              close_connection: bool = False):
+        import pandas as pd
+
+        await self._sleep_query_latency()
+        rows, column_names, _ = self.memory_backend.run_query(sql_query, sql_variables)
+        return pd.DataFrame(rows, columns=column_names)
+
+    async def execute_one_query(self, sql_query: str, sql_variables: Optional[tuple] = None,
+                                close_connection: bool = False) -> int:
+        await self._sleep_query_latency()
+        return self.memory_backend.run_query(sql_query, sql_variables)[2]
+
+    async def run_in_transaction(self, callback: Callable[..., Awaitable]):
+        # no await may run other tasks between BEGIN and COMMIT, AsyncMemoryCursor never yields
+        await self._sleep_query_latency()
+        memory_backend = self.memory_backend
+        memory_backend._check_online()
+        with memory_backend.connection_lock:
+            memory_backend.query_count += 1
+            memory_backend.connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = await callback(AsyncMemoryCursor(memory_backend.connection))
+                memory_backend.connection.execute("COMMIT")
+                return result
+            except BaseException:
+                memory_backend.connection.execute("ROLLBACK")
+                raise
@@ -0,0 +1,148 @@
+import logging
+from bisect import bisect_left
+from pathlib import Path
+from threading import Lock, Thread
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+logger = logging.getLogger(f"proxy_helpers:{Path(__file__).name}")
+
+# seconds, from a local sqlite query to a slow MySQL batch load
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (metric name, sorted label pairs)
+SeriesKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _get_series_key(name: str, labels: Optional[Dict[str, str]]) -> SeriesKey:
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+
+def _format_labels(label_pairs: Sequence[Tuple[str, str]]) -> str:
+    if not label_pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label_value(value)}"' for key, value in label_pairs) + "}"
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """Fixed-bucket histogram, counts[i] is the number of values <= buckets[i], the last count is +Inf"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def get_cumulative_counts(self) -> List[Tuple[float, int]]:
+        """return (upper bound, values <= upper bound) per bucket, +Inf last"""
+        cumulative_counts: List[Tuple[float, int]] = []
+        total: int = 0
+        for upper_bound, bucket_count in zip(self.buckets + (float("inf"),), self.counts):
+            total += bucket_count
+            cumulative_counts.append((upper_bound, total))
+        return cumulative_counts
+
+
+class MetricsRegistry:
+    """In-process counters and fixed-bucket histograms, keyed by name and labels
+    Handlers and checkers only record when given a registry, several can share one"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS, prefix: str = "proxy_helpers_"):
+        self.buckets: Tuple[float, ...] = tuple(buckets)
+        self.prefix: str = prefix
+        self.counters: Dict[SeriesKey, float] = {}
+        self.histograms: Dict[SeriesKey, Histogram] = {}
+        self.metrics_lock: Lock = Lock()
+
+    def increment(self, name: str, value: float = 1, labels: Optional[Dict[str, str]] = None):
+        series_key = _get_series_key(name, labels)
+        with self.metrics_lock:
+            self.counters[series_key] = self.counters.get(series_key, 0) + value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        series_key = _get_series_key(name, labels)
+        with self.metrics_lock:
+            histogram = self.histograms.get(series_key)
+            if histogram is None:
+                histogram = self.histograms[series_key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """return {"counters": {series: value}, "histograms": {series: {"buckets", "sum", "count"}}},
+        series as name{label="value"}, bucket counts cumulative"""
+        with self.metrics_lock:
+            return {
+                "counters": {name + _format_labels(label_pairs): value
+                             for (name, label_pairs), value in self.counters.items()},
+                "histograms": {name + _format_labels(label_pairs): {
+                    "buckets": histogram.get_cumulative_counts(),
+                    "sum": histogram.sum,
+                    "count": histogram.count,
+                } for (name, label_pairs), histogram in self.histograms.items()},
+            }
+
+    def to_prometheus_text(self) -> str:
+        """return the metrics in the Prometheus text exposition format"""
+        lines: List[str] = []
+        with self.metrics_lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {self.prefix}{name} counter")
+                for (series_name, label_pairs), value in sorted(self.counters.items()):
+                    if series_name == name:
+                        lines.append(f"{self.prefix}{name}{_format_labels(label_pairs)} {value:g}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {self.prefix}{name} histogram")
+                for (series_name, label_pairs), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if series_name != name:
+                        continue
+                    for upper_bound, bucket_count in histogram.get_cumulative_counts():
+                        le: str = "+Inf" if upper_bound == float("inf") else f"{upper_bound:g}"
+                        bucket_labels = _format_labels(label_pairs + (("le", le),))
+                        lines.append(f"{self.prefix}{name}_bucket{bucket_labels} {bucket_count}")
+                    lines.append(f"{self.prefix}{name}_sum{_format_labels(label_pairs)} {histogram.sum:g}")
+                    lines.append(f"{self.prefix}{name}_count{_format_labels(label_pairs)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self.metrics_lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+def start_metrics_server(metrics: MetricsRegistry, port: int = 9108, host: str = "127.0.0.1") -> "ThreadingHTTPServer":
+    """serve metrics.to_prometheus_text() on http://host:port/metrics from a daemon thread,
+    call shutdown() on the returned server to stop it"""
+    # imported on start, http.server pulls in email and html
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body: bytes = metrics.to_prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args):
+            logger.debug(format, *args)
+
+    metrics_server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    Thread(target=metrics_server.serve_forever, name="proxy_metrics_server", daemon=True).start()
+    return metrics_server
@@ -1,16 +1,41 @@
 import logging
+import random
+from functools import partial
 from pathlib import Path
-
-from proxy_helpers.app_config import logging_config
-
-logger = logging.getLogger(f"proxy_helpers:{Path(__file__).name}")
-
 from threading import RLock
-from typing import Union, Optional, Dict
+from time import monotonic, perf_counter, sleep
+from typing import TYPE_CHECKING, Callable, Union, Optional, Dict, Iterable, List
 
-import pandas as pd
 from mysql_helpers.mysql_con.mysql_pool_sync import MySQLConnectorPoolNative
 
+from proxy_helpers.mysql_proxies.circuit_breaker import CircuitBreaker
+from proxy_helpers.mysql_proxies.domain_stats import (DomainStats, build_domain_stats_select_query,
+                                                      build_domain_stats_upsert_query, get_domain)
+from proxy_helpers.mysql_proxies.latency_tracker import (PROXY_LATENCY_RECORDS_SQL, LatencyTracker,
+                                                         build_latency_update_query,
+                                                         get_proxy_key_from_full_url)
+from proxy_helpers.mysql_proxies.metrics import MetricsRegistry
+from proxy_helpers.mysql_proxies.native_rows import NativeRowReader, get_connector_settings
+from proxy_helpers.mysql_proxies.proxy_dispenser import ProxyDispenser
+from proxy_helpers.mysql_proxies.proxy_filter import AttributeIndex, ProxyFilters, get_proxy_filters
+from proxy_helpers.mysql_proxies.proxy_lease import (LEASE_RELEASE_SQL, build_lease_renew_query,
+                                                     claim_proxy_lease, new_lease_owner)
+from proxy_helpers.mysql_proxies.proxy_prune import (PruneStats, build_prune_delete_query,
+                                                     build_prune_select_query, get_prune_conditions)
+from proxy_helpers.mysql_proxies.proxy_record import PROXY_COLUMNS, PROXY_RECORDS_SQL, get_proxy_records
+from proxy_helpers.mysql_proxies.proxy_snapshot import read_proxy_snapshot, write_proxy_snapshot
+from proxy_helpers.mysql_proxies.proxy_universe import (DELETED_PROXY_IDS_SQL, WATERMARK_SQL, IncrementalUniverse,
+                                                        build_changed_rows_sql, build_universe_sql)
+from proxy_helpers.mysql_proxies.proxy_upsert import (add_upsert_counts, build_existing_proxy_count_query,
+                                                      build_proxy_upsert_query, chunk_proxy_rows, new_upsert_counts)
+from proxy_helpers.mysql_proxies.rate_limiter import RateLimitedDispenser
+from proxy_helpers.mysql_proxies.score_buffer import ProxyKey, ScoreBuffer, build_score_update_query, get_proxy_key
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(f"proxy_helpers:{Path(__file__).name}")
+
 
 class MySQLProxy(MySQLConnectorPoolNative):
     """MySQL class helpers with Rlock use"""
@@ -26,7 +51,11 @@ class MySQLProxy(MySQLConnectorPoolNative):
             pool_name: Optional[str] = 'mysql_proxies',
             raise_on_warnings: bool = False,
             proxy_universe_size: int = 100,
-
+            score_write_behind: bool = False,
+            score_flush_size: int = 500,
+            score_flush_interval: Optional[float] = 1.0,
+            score_half_life: Optional[float] = None,
+            metrics: Optional[MetricsRegistry] = None,
     ):
         super().__init__(
             db_host, db_port, db_user, db_password, db_name, raise_on_warnings,
@@ -36,6 +65,25 @@ class MySQLProxy(MySQLConnectorPoolNative):
 
         self.mysql_connection_rlock: RLock = RLock()
 
+        # Rows read as tuples for the pandas-free get_proxy_universe path, on connections of the connector pool
+        self.native_row_reader: NativeRowReader = NativeRowReader(
+            get_connector_settings(self, pool_size=pool_size, pool_name=pool_name)
+        )
+
+        # Write-behind proxy scores, see update_proxy_score
+        self.score_buffer: Optional[ScoreBuffer] = None
+        if score_write_behind:
+            self.score_buffer = ScoreBuffer(flush_callback=self._write_proxy_scores,
+                                            flush_size=score_flush_size,
+                                            flush_interval=score_flush_interval)
+
+        # Counters and histograms are only recorded when a registry is given, see metrics.MetricsRegistry
+        self.metrics: Optional[MetricsRegistry] = metrics
+
+        # Time-decayed scores: proxies are ranked by score_rank, errors weigh less as they age, see score_decay
+        self.score_half_life: Optional[float] = score_half_life
+        self.score_order_column: str = "error_count" if score_half_life is None else "score_rank"
+
     def insert_proxy(self, proxy_dict: Dict):
         sql_query = """
                     INSERT INTO `tbl_proxy_url`
@@ -55,6 +103,19 @@ class MySQLProxy(MySQLConnectorPoolNative):
         )
         return self.execute_one_query(sql_query=sql_query, sql_variables=sql_variables)
 
+    def insert_proxies(self, proxy_dicts: Iterable[Dict], chunk_size: int = 1000) -> Dict[str, int]:
+        """insert proxies in chunks of multi-row INSERT ... ON DUPLICATE KEY UPDATE
+        Existing (proxy_url, proxy_port) are updated, return inserted/updated/failed counts, see add_upsert_counts"""
+        upsert_counts: Dict[str, int] = new_upsert_counts()
+        for proxy_rows in chunk_proxy_rows(proxy_dicts, chunk_size=chunk_size):
+            existing_count: int = self.fetch_all_as_tuples(*build_existing_proxy_count_query(proxy_rows))[0][0]
+            sql_string, sql_variables = build_proxy_upsert_query(proxy_rows)
+            affected_rows = self.execute_one_query(
+                sql_query=sql_string, sql_variables=sql_variables
+            )
+            add_upsert_counts(upsert_counts, proxy_rows, existing_count=existing_count, affected_rows=affected_rows)
+        return upsert_counts
+
     def delete_proxy(
             self,
             proxy_id: Optional[Union[str, int]] = None,
@@ -81,23 +142,113 @@ class MySQLProxy(MySQLConnectorPoolNative):
 
         return self.execute_one_query(sql_query=sql_string, sql_variables=sql_variables)
 
+    def prune_proxies(
+            self,
+            min_error_count: int,
+            max_age_days: Optional[float] = None,
+            chunk_size: int = 1000,
+            chunk_pause: float = 0.0,
+            progress_interval: Optional[float] = 10.0,
+    ) -> Dict[str, Union[int, float]]:
+        """delete proxies with error_count above min_error_count and, with max_age_days,
+        not uploaded for max_age_days, in autocommitted DELETEs of at most chunk_size rows by primary key
+        Safe while handlers serve: loaded batches keep pruned proxies, their scores update no row,
+        and incremental refresh drops them through the delete tombstones. chunk_pause seconds are slept
+        between chunks. Return deleted/kept/chunks/seconds/rows_per_second, progress is logged"""
+        conditions = get_prune_conditions(min_error_count=min_error_count, max_age_days=max_age_days)
+        prune_stats = PruneStats(progress_interval=progress_interval)
+        after_proxy_id: int = 0
+        while True:
+            sql_string, sql_variables = build_prune_select_query(conditions, after_proxy_id, chunk_size)
+            proxy_ids: List[int] = [row[0] for row in self.fetch_all_as_tuples(sql_string, sql_variables)]
+            if len(proxy_ids) == 0:
+                break
+            sql_string, sql_variables = build_prune_delete_query(conditions, proxy_ids)
+            deleted_count = self.execute_one_query(sql_query=sql_string, sql_variables=sql_variables)
+            prune_stats.add_chunk(selected_count=len(proxy_ids), deleted_count=deleted_count)
+            after_proxy_id = proxy_ids[-1]
+            if len(proxy_ids) < chunk_size:
+                break
+            if chunk_pause > 0:
+                sleep(chunk_pause)
+        prune_counts = prune_stats.get_counts()
+        logger.info("Proxy prune done: %s", prune_counts)
+        return prune_counts
+
+    def _observe_query(self, method: str, started: float):
+        self.metrics.observe("db_query_seconds", perf_counter() - started, {"method": method})
+
+    def execute_one_query(self, *args, **kwargs):
+        """execute_one_query of the connector, timed when metrics are recorded"""
+        if self.metrics is None:
+            return super().execute_one_query(*args, **kwargs)
+        started: float = perf_counter()
+        try:
+            return super().execute_one_query(*args, **kwargs)
+        finally:
+            self._observe_query("execute_one_query", started)
+
+    def fetch_all_as_df(self, *args, **kwargs):
+        """fetch_all_as_df of the connector, timed when metrics are recorded"""
+        if self.metrics is None:
+            return super().fetch_all_as_df(*args, **kwargs)
+        started: float = perf_counter()
+        try:
+            return super().fetch_all_as_df(*args, **kwargs)
+        finally:
+            self._observe_query("fetch_all_as_df", started)
+
+    def fetch_all_as_tuples(self, sql_query: str, sql_variables: Optional[tuple] = None) -> List[tuple]:
+        """return rows as tuples, in the column order of the query"""
+        if self.metrics is None:
+            return self.native_row_reader.fetch_all(sql_query=sql_query, sql_variables=sql_variables)
+        started: float = perf_counter()
+        try:
+            return self.native_row_reader.fetch_all(sql_query=sql_query, sql_variables=sql_variables)
+        finally:
+            self._observe_query("fetch_all_as_tuples", started)
+
+    def run_in_transaction(self, callback: Callable):
+        """return callback(cursor) run in one transaction on the row reader connection"""
+        if self.metrics is None:
+            return self.native_row_reader.run_in_transaction(callback)
+        started: float = perf_counter()
+        try:
+            return self.native_row_reader.run_in_transaction(callback)
+        finally:
+            self._observe_query("run_in_transaction", started)
+
     def get_proxy_universe(
             self,
             proxy_universe_size: int = 1000,
             return_as_list_of_dicts: bool = False,
             shuffle_results: bool = True,
-    ) -> Union[pd.DataFrame, list]:
-        """methods that return a datagrame of proxies"""
-        sql_string = """
+            return_as_records: bool = False,
+    ) -> Union["pd.DataFrame", list, None]:
+        """methods that return a dataframe of proxies
+        return_as_records skips pandas and returns a list of Proxy records"""
+        if return_as_records:
+            rows = self.fetch_all_as_tuples(
+                sql_query=PROXY_RECORDS_SQL if self.score_half_life is None
+                else build_universe_sql(PROXY_COLUMNS, order_column=self.score_order_column),
+                sql_variables=(proxy_universe_size,)
+            )
+            return get_proxy_records(rows, shuffle_results=shuffle_results)
+
+        sql_string = f"""
                     SELECT CONCAT(a.proxy_url,':', a.proxy_port) as 'full_url',
                         a.* 
                     FROM tbl_proxy_url a 
-                    ORDER BY a.error_count ASC 
+                    ORDER BY a.{self.score_order_column} ASC 
                     LIMIT %s
                 """
         result_df = self.fetch_all_as_df(
             sql_query=sql_string, sql_variables=(proxy_universe_size,)
         )
+
+        if result_df is None or len(result_df) == 0:
+            return None
+
         if shuffle_results:
             result_df = result_df.sample(n=len(result_df))
         if return_as_list_of_dicts:
@@ -111,7 +262,21 @@ class MySQLProxy(MySQLConnectorPoolNative):
             proxy_url: Optional[str] = None,
             proxy_port: Optional[Union[int, str]] = None,
     ) -> Union[int, None]:
-        """method that update the proxy score"""
+        """method that update the proxy score
+        With score_write_behind, the score is buffered and 0 is returned, see flush_proxy_scores"""
+        if self.metrics is not None:
+            self.metrics.increment("proxy_scores_total", labels={"result": "success" if success else "failure"})
+        if self.score_buffer is not None:
+            proxy_key = get_proxy_key(proxy_id=proxy_id, proxy_url=proxy_url, proxy_port=proxy_port)
+            if proxy_key is None:
+                return None
+            self.score_buffer.add(proxy_key, success=success)
+            return 0
+        if self.score_half_life is not None:
+            proxy_key = get_proxy_key(proxy_id=proxy_id, proxy_url=proxy_url, proxy_port=proxy_port)
+            if proxy_key is None:
+                return None
+            return self._write_proxy_scores({proxy_key: -1 if success else 1})
 
         if success:
             if proxy_id:
@@ -158,6 +323,29 @@ class MySQLProxy(MySQLConnectorPoolNative):
 
         return query_result
 
+    def _write_proxy_scores(self, deltas: Dict) -> Union[int, None]:
+        """write net error_count deltas with one multi-row UPDATE, and the decayed scores with score_half_life"""
+        query = build_score_update_query(deltas, score_half_life=self.score_half_life)
+        if query is None:
+            return 0
+        sql_string, sql_variables = query
+        with self.mysql_connection_rlock:
+            return self.execute_one_query(
+                sql_query=sql_string, sql_variables=sql_variables, close_connection=True
+            )
+
+    def flush_proxy_scores(self) -> int:
+        """write buffered proxy scores now, return the number of proxies flushed"""
+        if self.score_buffer is None:
+            return 0
+        return self.score_buffer.flush()
+
+    def close(self):
+        """flush buffered proxy scores, stop the flush thread and close the row reader connection"""
+        if self.score_buffer is not None:
+            self.score_buffer.close()
+        self.native_row_reader.close()
+
     def update_proxy_selenium_score(self, proxy_id: Union[str, int], success: bool):
         """methods that updates proxy score for selenium"""
         proxy_id: int = int(proxy_id)
@@ -200,46 +388,478 @@ class ProxyHandler(MySQLProxy):
     def __init__(self,
                  proxy_universe_size: int = 1000,
                  pool_size: int = 1,
-                 pool_name: str = 'mysql_proxies'
+                 pool_name: str = 'mysql_proxies',
+                 score_write_behind: bool = False,
+                 score_flush_size: int = 500,
+                 score_flush_interval: Optional[float] = 1.0,
+                 score_half_life: Optional[float] = None,
+                 prefetch_low_watermark: Optional[float] = 0.2,
+                 circuit_breaker_cooldown: Optional[float] = None,
+                 circuit_breaker_threshold: int = 1,
+                 circuit_breaker_max_skips: int = 100,
+                 latency_selection: bool = False,
+                 latency_top_fraction: float = 0.5,
+                 latency_alpha: float = 0.3,
+                 lease_ttl: Optional[float] = None,
+                 incremental_refresh: bool = False,
+                 full_resync_interval: float = 300.0,
+                 domain_top_fraction: float = 0.5,
+                 domain_sticky: bool = False,
+                 rate_limit: Optional[float] = None,
+                 rate_limit_burst: float = 1.0,
+                 selection_strategy: Optional[str] = None,
+                 selection_draw_size: int = 64,
+                 snapshot_path: Optional[Union[str, Path]] = None,
+                 snapshot_max_age: Optional[float] = None,
+                 proxy_records: bool = False,
+                 metrics: Optional[MetricsRegistry] = None,
                  ):
         super().__init__(proxy_universe_size=proxy_universe_size,
                          pool_size=pool_size,
-                         pool_name=pool_name)
-        # Proxy generator
-        self.proxy_yield_rlock: RLock = RLock()
-        self.next_proxy_yield_rlock: RLock = RLock()
-        self.print_proxy_rlock: RLock = RLock()
+                         pool_name=pool_name,
+                         score_write_behind=score_write_behind,
+                         score_flush_size=score_flush_size,
+                         score_flush_interval=score_flush_interval,
+                         score_half_life=score_half_life,
+                         metrics=metrics)
+        # Proxy generator, the next batch is prefetched below prefetch_low_watermark.
+        # With rate_limit, each proxy is served at most rate_limit times per second (rate_limit_burst in a row)
         self.proxy_generator = None
+        self.prefetch_low_watermark: Optional[float] = prefetch_low_watermark
+        self.rate_limit: Optional[float] = rate_limit
+        self.rate_limit_burst: float = rate_limit_burst
+        # With selection_strategy ("thompson" or "ucb"), each batch is served by a bandit learning from the results
+        # given to update_proxy_score and report_proxy_latency, see bandit_selector
+        if selection_strategy is not None and rate_limit is not None:
+            raise ValueError("selection_strategy and rate_limit both replace the proxy dispenser, use one of them")
+        self.selection_strategy: Optional[str] = selection_strategy
+        self.selection_draw_size: int = selection_draw_size
+        self.proxy_dispenser: Union[ProxyDispenser, RateLimitedDispenser] = self._new_proxy_dispenser(
+            self._load_proxy_batch, on_install=self._index_proxy_batch
+        )
 
-        # Initiate variables
-        self._set_proxy_generator(proxy_universe_size=self.proxy_universe_size)
+        # Proxies failing through update_proxy_score are skipped for circuit_breaker_cooldown seconds
+        self.circuit_breaker: Optional[CircuitBreaker] = None
+        if circuit_breaker_cooldown is not None:
+            self.circuit_breaker = CircuitBreaker(cooldown=circuit_breaker_cooldown,
+                                                  failure_threshold=circuit_breaker_threshold)
+        self.circuit_breaker_max_skips: int = circuit_breaker_max_skips
+
+        # Reported latencies are averaged here and persisted at each batch refresh,
+        # latency_selection serves the fastest latency_top_fraction of each batch
+        self.latency_tracker: LatencyTracker = LatencyTracker(alpha=latency_alpha)
+        self.latency_selection: bool = latency_selection
+        self.latency_top_fraction: float = latency_top_fraction
+
+        # Lease mode: each batch is claimed for lease_ttl seconds, concurrent handlers get disjoint batches.
+        # A claim keeps the batch of the previous claim, still being served, and releases the older ones.
+        # The leases are renewed at the first pick past half of lease_ttl, see _renew_lease_if_due
+        self.lease_ttl: Optional[float] = lease_ttl
+        self.lease_owner: str = new_lease_owner()
+        self.leased_proxy_ids: List[int] = []
+        self.lease_renewed_at: float = monotonic()
+
+        # Incremental refresh: a local copy of the universe is updated with the rows changed since the last refresh
+        self.proxy_universe: Optional[IncrementalUniverse] = None
+        if incremental_refresh and score_half_life is not None:
+            raise ValueError("incremental_refresh orders proxies by error_count, it can't be used with score_half_life")
+        if incremental_refresh:
+            self.proxy_universe = IncrementalUniverse(universe_size=proxy_universe_size,
+                                                      full_resync_interval=full_resync_interval)
+
+        # Scores given with a target domain are counted per (proxy, domain) and persisted at each batch refresh,
+        # each domain is served the domain_top_fraction of its batches with the fewest errors there.
+        # domain_sticky serves the last proxy that succeeded on the domain again
+        self.domain_stats: DomainStats = DomainStats(top_fraction=domain_top_fraction)
+        self.domain_sticky: bool = domain_sticky
+        self.domain_dispensers: Dict[str, Union[ProxyDispenser, RateLimitedDispenser]] = {}
+        self.domain_dispensers_lock: RLock = RLock()
+        # Domains rank the batch loaded last by the handler, a batch is only loaded for a domain
+        # which already ranked the last one. Batch loads are serialized by proxy_batch_lock
+        self.proxy_batch: Optional[list] = None
+        self.proxy_batch_lock: RLock = RLock()
+        self.domain_source_batches: Dict[str, list] = {}
+
+        # Proxies are served as dicts, or as the Proxy records they are kept in with proxy_records
+        self.proxy_records: bool = proxy_records
+
+        # Proxies asked for by country, town or source are picked in turn from indexes of the batch
+        # the main dispenser serves, it is indexed as the dispenser installs it
+        self.attribute_index: AttributeIndex = AttributeIndex()
+
+        # Snapshot: each batch read from MySQL is written to snapshot_path. The handler starts from it and
+        # refreshes in the background, and serves it while MySQL is unreachable (if not older than snapshot_max_age)
+        self.snapshot_path: Optional[Path] = Path(snapshot_path) if snapshot_path is not None else None
+        self.snapshot_max_age: Optional[float] = snapshot_max_age
+        if self.snapshot_path is not None and lease_ttl is None:
+            self.preload_proxy_snapshot()
 
-    def _set_proxy_generator(self, proxy_universe_size: Optional[int] = 100):
-        with self.proxy_yield_rlock:
-            self.proxy_yield = self.refresh_generator_proxy_dict(
-                proxy_universe_size=proxy_universe_size
+    def update_proxy_score(
+            self,
+            success: bool,
+            proxy_id: Optional[Union[str, int]] = None,
+            proxy_url: Optional[str] = None,
+            proxy_port: Optional[Union[int, str]] = None,
+            domain: Optional[str] = None,
+    ) -> Union[int, None]:
+        """update the proxy score, the result also closes or trips the proxy circuit breaker
+        With a target domain (or url), the result is also counted for the proxy on that domain"""
+        if self.circuit_breaker is not None or domain or self.selection_strategy is not None:
+            proxy_key = get_proxy_key(proxy_id=proxy_id, proxy_url=proxy_url, proxy_port=proxy_port)
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record(proxy_key, success=success)
+            if domain:
+                self.domain_stats.record(proxy_key, domain=get_domain(domain), success=success)
+            if self.selection_strategy is not None:
+                self._record_selection(proxy_key, success=success, domain=domain)
+        return super().update_proxy_score(success=success,
+                                          proxy_id=proxy_id,
+                                          proxy_url=proxy_url,
+                                          proxy_port=proxy_port)
+
+    def _load_proxy_batch(self) -> Optional[list]:
+        # the main and domain dispensers load batches concurrently
+        with self.proxy_batch_lock:
+            return self._load_proxy_batch_locked()
+
+    def _load_proxy_batch_locked(self) -> Optional[list]:
+        if len(self.latency_tracker.dirty_keys) > 0:
+            self.flush_proxy_latencies()
+        if len(self.domain_stats.deltas) > 0:
+            self.flush_domain_stats()
+        started: float = perf_counter()
+        try:
+            if self.snapshot_path is None:
+                proxies = self._query_proxy_batch()
+            else:
+                proxies = self._query_proxy_batch_or_snapshot()
+        except Exception:
+            if self.metrics is not None:
+                self.metrics.increment("proxy_batch_load_failures_total")
+            raise
+        if self.metrics is not None:
+            self.metrics.observe("proxy_batch_load_seconds", perf_counter() - started)
+            self.metrics.increment("proxy_batches_loaded_total")
+
+        if proxies is not None and self.latency_selection:
+            self.latency_tracker.seed(proxies)
+            proxies = self.latency_tracker.select_fastest(proxies, top_fraction=self.latency_top_fraction)
+        if proxies:
+            self.proxy_batch = proxies
+        return proxies
+
+    def _query_proxy_batch(self) -> Optional[list]:
+        if self.lease_ttl is not None:
+            return self.lease_proxies()
+        elif self.proxy_universe is not None:
+            return self.refresh_proxy_universe()
+        elif self.latency_selection:
+            rows = self.fetch_all_as_tuples(
+                sql_query=PROXY_LATENCY_RECORDS_SQL if self.score_half_life is None
+                else build_universe_sql(PROXY_COLUMNS + ("latency_ewma",), order_column=self.score_order_column),
+                sql_variables=(self.proxy_universe_size,)
             )
+            return get_proxy_records(rows, shuffle_results=False)
+        return self.get_proxy_universe(
+            proxy_universe_size=self.proxy_universe_size,
+            shuffle_results=True,
+            return_as_records=True,
+        )
+
+    def _query_proxy_batch_or_snapshot(self) -> Optional[list]:
+        try:
+            proxies = self._query_proxy_batch()
+        except Exception as ex:
+            logger.warning("Proxy batch query failed, serving the snapshot: %s", ex)
+            return read_proxy_snapshot(self.snapshot_path, max_age=self.snapshot_max_age)
+        if not proxies:
+            return read_proxy_snapshot(self.snapshot_path, max_age=self.snapshot_max_age)
+        try:
+            write_proxy_snapshot(self.snapshot_path, proxies)
+        except OSError as ex:
+            logger.warning("Proxy snapshot %s could not be written: %s", self.snapshot_path, ex)
+        return proxies
+
+    def preload_proxy_snapshot(self) -> int:
+        """serve the snapshot proxies right away, a batch is read from MySQL in the background on the next call
+        return the number of proxies preloaded, 0 without a snapshot (or older than snapshot_max_age)"""
+        proxies = read_proxy_snapshot(self.snapshot_path, max_age=self.snapshot_max_age)
+        if not proxies:
+            return 0
+        random.shuffle(proxies)
+        self.proxy_dispenser.preload(proxies)
+        self.proxy_batch = proxies
+        return len(proxies)
+
+    def _load_domain_batch(self, domain: str) -> Optional[list]:
+        with self.proxy_batch_lock:
+            proxies = self.proxy_batch
+            if proxies is None or proxies is self.domain_source_batches.get(domain):
+                # the domain already ranked the last batch, the previous one is ranked again if the load fails
+                proxies = self._load_proxy_batch_locked() or proxies
+            if proxies is None:
+                return None
+            self.domain_source_batches[domain] = proxies
+        proxy_ids: List[int] = [proxy.proxy_id for proxy in proxies if proxy.proxy_id is not None]
+        if len(proxy_ids) > 0:
+            sql_string, sql_variables = build_domain_stats_select_query(domain, proxy_ids)
+            try:
+                self.domain_stats.seed(domain, self.fetch_all_as_tuples(sql_query=sql_string,
+                                                                        sql_variables=sql_variables))
+            except Exception as ex:
+                logger.warning("Proxy domain stats could not be read, ranking on local stats: %s", ex)
+        return self.domain_stats.rank(proxies, domain)
+
+    def _new_proxy_dispenser(self, load_batch: Callable[[], Optional[list]],
+                             on_install: Optional[Callable[[list], None]] = None):
+        if self.selection_strategy is not None:
+            # numpy is only imported when a selection strategy is used
+            from proxy_helpers.mysql_proxies.bandit_selector import BanditDispenser
+
+            return BanditDispenser(load_batch=load_batch, strategy=self.selection_strategy,
+                                   draw_size=self.selection_draw_size, low_watermark=self.prefetch_low_watermark,
+                                   on_install=on_install)
+        if self.rate_limit is not None:
+            return RateLimitedDispenser(load_batch=load_batch, rate=self.rate_limit, burst=self.rate_limit_burst,
+                                        low_watermark=self.prefetch_low_watermark, on_install=on_install)
+        return ProxyDispenser(load_batch=load_batch, low_watermark=self.prefetch_low_watermark,
+                              on_install=on_install)
+
+    def _get_domain_dispenser(self, domain: str) -> Union[ProxyDispenser, RateLimitedDispenser]:
+        proxy_dispenser = self.domain_dispensers.get(domain)
+        if proxy_dispenser is None:
+            with self.domain_dispensers_lock:
+                proxy_dispenser = self.domain_dispensers.get(domain)
+                if proxy_dispenser is None:
+                    proxy_dispenser = self._new_proxy_dispenser(partial(self._load_domain_batch, domain))
+                    self.domain_dispensers[domain] = proxy_dispenser
+        return proxy_dispenser
+
+    def _record_selection(self, proxy_key: Optional[ProxyKey], success: Optional[bool] = None,
+                          latency: Optional[float] = None, domain: Optional[str] = None):
+        """update the bandit arrays of the proxy, in the domain's dispenser too
+        Latencies are updated in every dispenser"""
+        proxy_dispensers = [self.proxy_dispenser]
+        if latency is not None:
+            proxy_dispensers.extend(list(self.domain_dispensers.values()))
+        elif domain:
+            proxy_dispensers.append(self.domain_dispensers.get(get_domain(domain)))
+        for proxy_dispenser in proxy_dispensers:
+            if proxy_dispenser is not None:
+                proxy_dispenser.record(proxy_key, success=success, latency=latency)
+
+    def refresh_proxy_universe(self) -> Optional[list]:
+        """update the local universe with the rows inserted, updated or deleted since the last refresh,
+        or reload it when a full resync is due. Return its proxy_universe_size best proxies, shuffled"""
+        columns = PROXY_COLUMNS + ("latency_ewma",) if self.latency_selection else PROXY_COLUMNS
+        watermark = self.fetch_all_as_tuples(sql_query=WATERMARK_SQL)[0][0]
+        if self.proxy_universe.needs_full_resync():
+            rows = self.fetch_all_as_tuples(
+                sql_query=build_universe_sql(columns), sql_variables=(self.proxy_universe.capacity,)
+            )
+            row_count = self.proxy_universe.load_full(get_proxy_records(rows, shuffle_results=False) or [],
+                                                      watermark=watermark)
+            logger.debug("Proxy universe full resync: %s rows", row_count)
+        else:
+            since = self.proxy_universe.get_since()
+            rows = self.fetch_all_as_tuples(
+                sql_query=build_changed_rows_sql(columns), sql_variables=(since,)
+            )
+            deleted_rows = self.fetch_all_as_tuples(sql_query=DELETED_PROXY_IDS_SQL, sql_variables=(since,))
+            row_count = self.proxy_universe.apply_changes(get_proxy_records(rows, shuffle_results=False) or [],
+                                                          deleted_proxy_ids=[row[0] for row in deleted_rows],
+                                                          watermark=watermark)
+            logger.debug("Proxy universe refresh: %s rows changed", row_count)
+        return self.proxy_universe.top()
+
+    def lease_proxies(self, lease_size: Optional[int] = None) -> Optional[list]:
+        """release this handler's lease, but the proxies of its last claim, and lease it the lease_size
+        (proxy_universe_size) lowest error_count proxies that no other handler holds, for lease_ttl seconds.
+        Return them as shuffled Proxy records. Expired leases, from handlers that died, are claimed again"""
+        rows = self.run_in_transaction(partial(
+            claim_proxy_lease,
+            lease_owner=self.lease_owner,
+            lease_ttl=self.lease_ttl or 0,
+            lease_size=lease_size or self.proxy_universe_size,
+            order_column=self.score_order_column,
+            keep_proxy_ids=self.leased_proxy_ids,
+        ))
+        if not rows:
+            return None
+        proxies = get_proxy_records(rows, shuffle_results=True)
+        self.leased_proxy_ids = [proxy.proxy_id for proxy in proxies]
+        self.lease_renewed_at = monotonic()
+        return proxies
+
+    def renew_proxy_lease(self) -> Union[int, None]:
+        """extend the proxies leased by this handler to lease_ttl seconds from now"""
+        self.lease_renewed_at = monotonic()
+        sql_string, sql_variables = build_lease_renew_query(self.lease_owner, lease_ttl=self.lease_ttl or 0)
+        return self.execute_one_query(sql_query=sql_string, sql_variables=sql_variables)
+
+    def _renew_lease_if_due(self):
+        if monotonic() - self.lease_renewed_at < self.lease_ttl / 2:
+            return
+        try:
+            self.renew_proxy_lease()
+        except Exception as ex:
+            logger.warning("Proxy lease renewal failed: %s", ex)
+
+    def release_proxy_lease(self) -> Union[int, None]:
+        """give back the proxies leased by this handler"""
+        self.leased_proxy_ids = []
+        return self.execute_one_query(sql_query=LEASE_RELEASE_SQL, sql_variables=(self.lease_owner,))
+
+    def report_proxy_latency(
+            self,
+            latency: float,
+            proxy_id: Optional[Union[str, int]] = None,
+            proxy_url: Optional[str] = None,
+            proxy_port: Optional[Union[int, str]] = None,
+    ) -> Optional[float]:
+        """merge an observed response time (seconds) into the proxy average and return it
+        No query is run, averages are persisted at the next batch refresh, see flush_proxy_latencies"""
+        proxy_key = get_proxy_key(proxy_id=proxy_id, proxy_url=proxy_url, proxy_port=proxy_port)
+        if self.selection_strategy is not None:
+            self._record_selection(proxy_key, latency=latency)
+        return self.latency_tracker.report(proxy_key, latency)
+
+    def report_proxy_checks(self, check_results: Iterable) -> int:
+        """report the latency of successful ProxyChecker.check_proxy_result results (proxy_full_url, ok, latency)
+        With selection_strategy, every result is also counted by the bandit. Return the number of latencies reported"""
+        reported: int = 0
+        for proxy_full_url, ok, latency in check_results:
+            proxy_key = get_proxy_key_from_full_url(proxy_full_url)
+            if self.selection_strategy is not None:
+                self._record_selection(proxy_key, success=ok, latency=latency if ok else None)
+            if ok and latency is not None:
+                self.latency_tracker.report(proxy_key, latency)
+                reported += 1
+        return reported
+
+    def flush_proxy_latencies(self) -> int:
+        """write the averages reported since the last flush into latency_ewma with one multi-row UPDATE
+        return the number of proxies written, on error they are kept for the next flush"""
+        latencies = self.latency_tracker.drain()
+        query = build_latency_update_query(latencies)
+        if query is None:
+            return 0
+        sql_string, sql_variables = query
+        try:
+            with self.mysql_connection_rlock:
+                self.execute_one_query(
+                    sql_query=sql_string, sql_variables=sql_variables, close_connection=True
+                )
+        except Exception as ex:
+            logger.warning("Proxy latency flush failed, %s proxies requeued: %s", len(latencies), ex)
+            self.latency_tracker.requeue(latencies)
+            return 0
+        return len(latencies)
+
+    def flush_domain_stats(self) -> int:
+        """add the per domain counts recorded since the last flush to tbl_proxy_domain_stats with one multi-row
+        INSERT ... ON DUPLICATE KEY UPDATE, return the number of rows written, on error they are kept for the next flush"""
+        deltas = self.domain_stats.drain()
+        query = build_domain_stats_upsert_query(deltas)
+        if query is None:
+            return 0
+        sql_string, sql_variables = query
+        try:
+            with self.mysql_connection_rlock:
+                self.execute_one_query(
+                    sql_query=sql_string, sql_variables=sql_variables, close_connection=True
+                )
+        except Exception as ex:
+            logger.warning("Proxy domain stats flush failed, %s rows requeued: %s", len(deltas), ex)
+            self.domain_stats.requeue(deltas)
+            return 0
+        return len(deltas)
+
+    def close(self):
+        """write reported latencies and domain stats and release the lease, then close as MySQLProxy.close"""
+        self.flush_proxy_latencies()
+        self.flush_domain_stats()
+        if self.lease_ttl is not None:
+            self.release_proxy_lease()
+        super().close()
 
     @staticmethod
     def get_requests_proxies_as_dict(full_url: str) -> dict:
         """return dict {http:full_proxy_url, https:full_proxy_url using a full_proxy_url}"""
         return {"http": full_url, "https": full_url}
 
-    def get_next_proxy_from_generator(self):
-        """Return a generator of proxy dicts which include country, score and else.
-        At stop iteration, the generator is refreshed"""
-        with self.next_proxy_yield_rlock:
-            while True:
-                try:
-                    return next(self.proxy_yield)
-                except StopIteration as ex:
-                    logger.debug(f"Handled error: {ex}")
-                    self._set_proxy_generator()
+    def get_next_proxy_from_generator(self, domain: Optional[str] = None, wait: bool = False,
+                                     country: Optional[str] = None, town: Optional[str] = None,
+                                     source: Optional[str] = None):
+        """Return the next proxy dict which include country, score and else, a Proxy record with proxy_records.
+        The next batch is loaded in the background before the current one is used up,
+        None is returned if no proxy could be loaded.
+        Proxies open in the circuit breaker are skipped, at most circuit_breaker_max_skips in a row
+        With a target domain (or url), proxies come from the domain ranking, see update_proxy_score.
+        With rate_limit, the earliest available proxy is returned, None if all are at their limit
+        unless wait, which sleeps until one is available. Limits apply per domain, sticky proxies skip them.
+        With country, town or source (proxy_web_name), matching proxies of the batch being served are returned
+        in turn, None if none matches. These picks run no query and take rate limit tokens, but never wait.
+        They skip the domain ranking and the selection strategy, whose counts still get their results"""
+        proxy_filters: Optional[ProxyFilters] = get_proxy_filters(country=country, town=town, source=source)
+        if self.metrics is None:
+            return self._serve_proxy(self._get_next_proxy(domain=domain, wait=wait, proxy_filters=proxy_filters))
+        started: float = perf_counter()
+        proxy = self._get_next_proxy(domain=domain, wait=wait, proxy_filters=proxy_filters)
+        self.metrics.observe("next_proxy_seconds", perf_counter() - started)
+        self.metrics.increment("proxies_served_total" if proxy is not None else "proxies_unavailable_total")
+        return self._serve_proxy(proxy)
+
+    def _serve_proxy(self, proxy):
+        if proxy is None or self.proxy_records:
+            return proxy
+        return proxy.to_dict()
+
+    def _get_next_proxy(self, domain: Optional[str], wait: bool, proxy_filters: Optional[ProxyFilters] = None):
+        if self.lease_ttl is not None:
+            self._renew_lease_if_due()
+        proxy_dispenser = self.proxy_dispenser
+        if domain and proxy_filters is None:
+            domain = get_domain(domain)
+            if self.domain_sticky:
+                proxy = self.domain_stats.get_sticky_proxy(domain)
+                if proxy is not None and (self.circuit_breaker is None or self.circuit_breaker.allow_proxy(proxy)):
+                    return proxy
+            proxy_dispenser = self._get_domain_dispenser(domain)
+        next_proxy = proxy_dispenser.next_proxy
+        if self.rate_limit is not None:
+            next_proxy = partial(proxy_dispenser.next_proxy, wait=wait)
+        if proxy_filters is not None:
+            next_proxy = partial(self._next_filtered_proxy, proxy_filters)
+        proxy = next_proxy()
+        if self.circuit_breaker is None:
+            return proxy
+        for _ in range(self.circuit_breaker_max_skips):
+            if proxy is None or self.circuit_breaker.allow_proxy(proxy):
+                return proxy
+            if self.metrics is not None:
+                self.metrics.increment("proxies_skipped_total")
+            proxy = next_proxy()
+        return proxy
+
+    def _next_filtered_proxy(self, proxy_filters: ProxyFilters):
+        if not self.attribute_index.loaded:
+            # no query of its own: the main dispenser's first batch is indexed as it is installed
+            self.proxy_dispenser.load_first_batch()
+        if self.rate_limit is None:
+            return self.attribute_index.next_proxy(proxy_filters)
+        # a token is taken from the proxy picked, matching proxies at their rate limit are skipped
+        return self.attribute_index.next_proxy(proxy_filters, accept=self.proxy_dispenser.rate_limiter.acquire_proxy)
+
+    def _index_proxy_batch(self, proxies: list):
+        self.attribute_index.load(proxies)
 
 
 if __name__ == "__main__":
     from dotenv import load_dotenv
 
+    from proxy_helpers.app_config import logging_config
+
     logging_config()
     load_dotenv()
 
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+from pathlib import Path
+from threading import RLock
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+logger = logging.getLogger(f"proxy_helpers:{Path(__file__).name}")
+
+
+def get_connector_settings(connector, pool_size: Optional[int] = None, pool_name: Optional[str] = None) -> Dict:
+    """return mysql.connector connect kwargs from the settings mysql_helpers resolved on the connector,
+    so rows read as tuples come from the same server and database as the connector queries.
+    With pool_name, connections are taken from the mysql.connector pool of that name"""
+    connection_settings: Dict = {
+        "host": connector.db_host,
+        "port": int(connector.db_port or 3306),
+        "user": connector.db_user,
+        "password": connector.db_password,
+        "database": connector.db_name,
+        "autocommit": True,
+    }
+    if pool_name:
+        connection_settings.update(pool_name=pool_name, pool_size=pool_size or 1)
+    return connection_settings
+
+
+class NativeRowReader:
+    """Fetch rows as plain tuples, without building a DataFrame, see get_connector_settings
+    The connection is opened on first use and reopened once if it was lost.
+    Pooled connections are given back to their pool after each query"""
+
+    def __init__(self, connection_settings: Dict):
+        self.connection_settings: Dict = connection_settings
+        self.connection = None
+        self.connection_rlock: RLock = RLock()
+        self.pooled: bool = "pool_name" in connection_settings
+
+    def _connect(self):
+        import mysql.connector
+
+        if self.connection is None or not self.connection.is_connected():
+            self.connection = mysql.connector.connect(**self.connection_settings)
+
+    def _release(self):
+        if self.pooled and self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def fetch_all(self, sql_query: str, sql_variables: Optional[tuple] = None) -> List[tuple]:
+        # imported on first query, importing the driver is slow
+        import mysql.connector
+
+        with self.connection_rlock:
+            for attempt in range(2):
+                try:
+                    self._connect()
+                    cursor = self.connection.cursor()
+                    try:
+                        cursor.execute(sql_query, sql_variables)
+                        return cursor.fetchall()
+                    finally:
+                        cursor.close()
+                        self._release()
+                except (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError) as ex:
+                    if attempt > 0:
+                        raise
+                    logger.debug("Handled error, reconnecting: %s", ex)
+                    self.connection = None
+
+    def run_in_transaction(self, callback: Callable):
+        """return callback(cursor) run in one transaction, committed if it returns, rolled back if it raises"""
+        with self.connection_rlock:
+            self._connect()
+            self.connection.start_transaction()
+            cursor = self.connection.cursor()
+            try:
+                result = callback(cursor)
+                self.connection.commit()
+                return result
+            except BaseException:
+                self.connection.rollback()
+                raise
+            finally:
+                cursor.close()
+                self._release()
+
+    def close(self):
+        with self.connection_rlock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+class AsyncNativeRowReader:
+    """asyncio version of NativeRowReader, using mysql.connector.aio"""
+
+    def __init__(self, connection_settings: Dict):
+        self.connection_settings: Dict = connection_settings
+        self.connection = None
+        self.connection_lock = asyncio.Lock()
+
+    async def fetch_all(self, sql_query: str, sql_variables: Optional[tuple] = None) -> List[tuple]:
+        # imported on first query, importing the driver is slow
+        import mysql.connector
+        import mysql.connector.aio
+
+        async with self.connection_lock:
+            for attempt in range(2):
+                try:
+                    if self.connection is None or not await self.connection.is_connected():
+                        self.connection = await mysql.connector.aio.connect(**self.connection_settings)
+                    cursor = await self.connection.cursor()
+                    try:
+                        await cursor.execute(sql_query, sql_variables)
+                        return await cursor.fetchall()
+                    finally:
+                        await cursor.close()
+                except (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError) as ex:
+                    if attempt > 0:
+                        raise
+                    logger.debug("Handled error, reconnecting: %s", ex)
+                    self.connection = None
+
+    async def run_in_transaction(self, callback: Callable[..., Awaitable]):
+        """return await callback(cursor) run in one transaction, committed if it returns, rolled back if it raises"""
+        import mysql.connector.aio
+
+        async with self.connection_lock:
+            if self.connection is None or not await self.connection.is_connected():
+                self.connection = await mysql.connector.aio.connect(**self.connection_settings)
+            await self.connection.start_transaction()
+            cursor = await self.connection.cursor()
+            try:
+                result = await callback(cursor)
+                await self.connection.commit()
+                return result
+            except BaseException:
+                await self.connection.rollback()
+                raise
+            finally:
+                await cursor.close()
+
+    async def close(self):
+        async with self.connection_lock:
+            if self.connection is not None:
+                await self.connection.close()
+                self.connection = None
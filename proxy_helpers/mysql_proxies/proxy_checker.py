@@ -1,38 +1,54 @@
-from time import sleep
+import logging
+from pathlib import Path
+from time import perf_counter, sleep
+from typing import Optional, Tuple
 
-import requests
+from proxy_helpers.mysql_proxies.metrics import MetricsRegistry
+
+logger = logging.getLogger(f"proxy_helpers:{Path(__file__).name}")
+
+ProxyCheckResult = Tuple[str, bool, Optional[float]]
 
 
 class ProxyChecker:
-    def __init__(self, timeout: int = 25):
-        self.base_url = "https://httpbin.org/ip"
+    def __init__(self, timeout: int = 25, metrics: Optional[MetricsRegistry] = None,
+                 base_url: str = "https://httpbin.org/ip"):
+        self.base_url: str = base_url
         self.timeout: int = timeout
+        self.metrics: Optional[MetricsRegistry] = metrics
 
     def check_proxy(self, proxy_full_url: str, max_attempts: int = 10) -> bool:
         """Return True if IP returned by request if the same as proxy_full_url's url"""
+        return self.check_proxy_result(proxy_full_url=proxy_full_url, max_attempts=max_attempts)[1]
+
+    def check_proxy_result(self, proxy_full_url: str, max_attempts: int = 10) -> ProxyCheckResult:
+        """Return (proxy_full_url, ok, latency in seconds of the successful request), as the async ProxyChecker
+        the results can be given to ProxyHandler.report_proxy_checks"""
+        # imported on first check, importing requests is slow
+        import requests
+
         # https://www.scrapingbee.com/blog/python-requests-proxy/#:~:text=To%20use%20a%20proxy%20in,webpage%20you're%20scraping%20from.
         proxies = {
             "http": "http://" + proxy_full_url,
             "https": "http://" + proxy_full_url,
         }
         while max_attempts > 0:
-            print(30 * "#")
-            print(f"Attempts left: {max_attempts}")
             try:
+                started: float = perf_counter()
                 response = requests.get(
                     url=self.base_url, timeout=self.timeout, proxies=proxies
                 )
-                print(f"Proxy request status code: {response.status_code}")
-                print(f'Proxy IP: {proxy_full_url.split(":")[0]}')
-                print(f'Response IP: {response.json()["origin"]}')
+                latency: float = perf_counter() - started
+                logger.debug("Proxy %s attempts left %s: status code %s",
+                             proxy_full_url, max_attempts, response.status_code)
 
                 if response.status_code == 200:
-                    return True
+                    if self.metrics is not None:
+                        self.metrics.increment("proxy_checks_total", labels={"result": "ok"})
+                        self.metrics.observe("proxy_check_seconds", latency)
+                    return proxy_full_url, True, latency
             except Exception as ex:
-                print(
-                    f"Error with proxy: {proxy_full_url}\n"
-                    f"Error is: {ex.__class__.__name__}"
-                )
+                logger.debug("Proxy %s attempts left %s: %s", proxy_full_url, max_attempts, ex.__class__.__name__)
                 max_attempts -= 1
                 sleep(5)
                 continue
@@ -40,7 +56,9 @@ class ProxyChecker:
             max_attempts -= 1
             sleep(5)
 
-        return False
+        if self.metrics is not None:
+            self.metrics.increment("proxy_checks_total", labels={"result": "failed"})
+        return proxy_full_url, False, None
 
 
 if __name__ == "__main__":
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+from pathlib import Path
+from time import perf_counter
+from typing import TYPE_CHECKING, AsyncIterator, Iterable, Optional
+
+from proxy_helpers.mysql_proxies.metrics import MetricsRegistry
+from proxy_helpers.mysql_proxies.proxy_checker import ProxyCheckResult
+
+if TYPE_CHECKING:
+    import aiohttp
+
+logger = logging.getLogger(f"proxy_helpers:{Path(__file__).name}")
+
+
+class ProxyChecker:
+    """Check many proxies at once, at most max_concurrency requests are in flight"""
+
+    def __init__(
+            self,
+            timeout: float = 25,
+            max_concurrency: int = 100,
+            base_url: str = "https://httpbin.org/ip",
+            backoff: float = 1.0,
+            max_backoff: float = 30.0,
+            metrics: Optional[MetricsRegistry] = None,
+    ):
+        self.base_url: str = base_url
+        self.timeout: float = timeout
+        self.max_concurrency: int = max_concurrency
+        self.backoff: float = backoff
+        self.max_backoff: float = max_backoff
+        self.metrics: Optional[MetricsRegistry] = metrics
+
+        self.request_semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_request_semaphore(self) -> asyncio.Semaphore:
+        # created lazily so the semaphore binds to the running loop
+        if self.request_semaphore is None:
+            self.request_semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self.request_semaphore
+
+    async def check_proxy(
+            self,
+            proxy_full_url: str,
+            max_attempts: int = 3,
+            deadline: Optional[float] = None,
+            session: Optional["aiohttp.ClientSession"] = None,
+    ) -> ProxyCheckResult:
+        """Return (proxy_full_url, ok, latency in seconds of the successful request)
+        deadline bounds the whole check, attempts included, backoff is exponential and doesn't hold a slot"""
+        # imported on first check, importing aiohttp is slow
+        import aiohttp
+
+        if session is None:
+            async with aiohttp.ClientSession() as session:
+                return await self.check_proxy(proxy_full_url=proxy_full_url,
+                                              max_attempts=max_attempts,
+                                              deadline=deadline,
+                                              session=session)
+
+        loop = asyncio.get_running_loop()
+        deadline_time: Optional[float] = None if deadline is None else loop.time() + deadline
+        request_semaphore = self._get_request_semaphore()
+        proxy: str = "http://" + proxy_full_url
+        backoff: float = self.backoff
+
+        for attempt in range(1, max_attempts + 1):
+            timeout: float = self.timeout
+            if deadline_time is not None:
+                timeout = min(timeout, deadline_time - loop.time())
+                if timeout <= 0:
+                    break
+            try:
+                async with request_semaphore:
+                    started: float = perf_counter()
+                    async with session.get(self.base_url,
+                                           proxy=proxy,
+                                           timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                        await response.read()
+                        latency: float = perf_counter() - started
+                logger.debug("Proxy %s attempt %s: status code %s", proxy_full_url, attempt, response.status)
+                if response.status == 200:
+                    if self.metrics is not None:
+                        self.metrics.increment("proxy_checks_total", labels={"result": "ok"})
+                        self.metrics.observe("proxy_check_seconds", latency)
+                    return proxy_full_url, True, latency
+            except Exception as ex:
+                logger.debug("Proxy %s attempt %s: %s", proxy_full_url, attempt, ex.__class__.__name__)
+
+            if attempt == max_attempts:
+                break
+            sleep_time: float = backoff
+            if deadline_time is not None:
+                sleep_time = min(sleep_time, deadline_time - loop.time())
+            if sleep_time > 0:
+                await asyncio.sleep(sleep_time)
+            backoff = min(backoff * 2, self.max_backoff)
+
+        if self.metrics is not None:
+            self.metrics.increment("proxy_checks_total", labels={"result": "failed"})
+        return proxy_full_url, False, None
+
+    async def check_proxies(
+            self,
+            proxy_full_urls: Iterable[str],
+            max_attempts: int = 3,
+            deadline: Optional[float] = None,
+    ) -> AsyncIterator[ProxyCheckResult]:
+        """Yield (proxy_full_url, ok, latency) as checks finish, not in input order"""
+        import aiohttp
+
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, force_close=True)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            check_tasks = [
+                asyncio.create_task(self.check_proxy(proxy_full_url=proxy_full_url,
+                                                     max_attempts=max_attempts,
+                                                     deadline=deadline,
+                                                     session=session))
+                for proxy_full_url in proxy_full_urls
+            ]
+            try:
+                for check_task in asyncio.as_completed(check_tasks):
+                    yield await check_task
+            finally:
+                for check_task in check_tasks:
+                    check_task.cancel()
+                await asyncio.gather(*check_tasks, return_exceptions=True)
+
+
+async def try_out():
+    proxy_checker = ProxyChecker(max_concurrency=10)
+    async for proxy_full_url, ok, latency in proxy_checker.check_proxies(["167.235.63.238:3128"]):
+        print(proxy_full_url, ok, latency)
+
+
+if __name__ == "__main__":
+    asyncio.run(try_out())
@@ -0,0 +1,459 @@
+import asyncio
+import logging
+from collections import deque
+from math import inf
+from pathlib import Path
+from threading import RLock, Thread
+from time import monotonic
+from typing import Awaitable, Callable, Deque, Optional
+
+logger = logging.getLogger(f"proxy_helpers:{Path(__file__).name}")
+
+
+class ProxyDispenser:
+    """Serve proxies from a double-buffered batch
+    Once the current batch drops under low_watermark (fraction left), the next batch is loaded
+    by load_batch in a background thread and swapped in when the current batch is used up.
+    Consumers don't share a lock: deque.popleft is atomic, batch_rlock is only taken to swap batches
+    and to start the prefetch. on_install is called with each batch made current.
+    After a prefetch failed or returned no proxy, no prefetch is started for retry_interval seconds"""
+
+    def __init__(
+            self,
+            load_batch: Callable[[], Optional[list]],
+            low_watermark: Optional[float] = 0.2,
+            on_install: Optional[Callable[[list], None]] = None,
+            retry_interval: float = 5.0,
+            clock: Callable[[], float] = monotonic,
+    ):
+        self.load_batch = load_batch
+        self.low_watermark: Optional[float] = low_watermark
+        self.on_install: Optional[Callable[[list], None]] = on_install
+        self.retry_interval: float = retry_interval
+        self.clock = clock
+
+        self.batch_rlock: RLock = RLock()
+        self.current_batch: Deque = deque()
+        self.current_batch_size: int = 0
+        self.prefetch_threshold: float = -1
+        self.next_batch: Optional[list] = None
+        self._prefetch_thread: Optional[Thread] = None
+        self.retry_time: float = -inf
+        # a preloaded batch is replaced as soon as the next batch is loaded, see preload
+        self.stale_batch: bool = False
+
+    def next_proxy(self):
+        """return the next proxy, None if no proxy could be loaded"""
+        while True:
+            try:
+                proxy = self.current_batch.popleft()
+            except IndexError:
+                with self.batch_rlock:
+                    if len(self.current_batch) == 0 and not self._swap_batches():
+                        return None
+                # other consumers may empty the new batch first
+                continue
+            if self.stale_batch:
+                self._replace_stale_batch()
+            elif len(self.current_batch) <= self.prefetch_threshold:
+                self._check_low_watermark()
+            return proxy
+
+    def load_first_batch(self):
+        """load a batch if none is being served, without serving a proxy"""
+        with self.batch_rlock:
+            if len(self.current_batch) == 0:
+                self._swap_batches()
+
+    def preload(self, batch: list):
+        """serve batch (e.g. read from a snapshot) right away, the next batch is loaded in the background
+        on the next call and replaces it once loaded"""
+        with self.batch_rlock:
+            self.current_batch = deque(batch)
+            self.current_batch_size = len(batch)
+            self.stale_batch = True
+            if self.on_install is not None:
+                self.on_install(batch)
+
+    def _replace_stale_batch(self):
+        if self.next_batch is None:
+            self._check_low_watermark()
+            return
+        with self.batch_rlock:
+            if self.stale_batch and self.next_batch is not None:
+                self._swap_batches()
+
+    def _check_low_watermark(self):
+        if self.next_batch is not None or self._prefetch_thread is not None or self.clock() < self.retry_time:
+            return
+        with self.batch_rlock:
+            if self.next_batch is not None or self._prefetch_thread is not None:
+                return
+            self._prefetch_thread = Thread(target=self._prefetch, name="proxy_prefetch", daemon=True)
+            self._prefetch_thread.start()
+
+    def _prefetch(self):
+        try:
+            next_batch = self.load_batch()
+        except Exception as ex:
+            logger.warning("Proxy batch prefetch failed: %s", ex)
+            next_batch = None
+        # no batch_rlock here: _swap_batches may be joining this thread while holding it
+        if not next_batch:
+            self.retry_time = self.clock() + self.retry_interval
+            # keep serving the preloaded batch rather than retry on every call
+            self.stale_batch = False
+        self.next_batch = next_batch or None
+        self._prefetch_thread = None
+
+    def _swap_batches(self) -> bool:
+        """make the next batch current, load it synchronously if it wasn't prefetched"""
+        prefetch_thread = self._prefetch_thread
+        if prefetch_thread is not None:
+            # prefetch is slower than consumers, wait for it rather than run a second query
+            prefetch_thread.join()
+        next_batch, self.next_batch = self.next_batch, None
+        if not next_batch:
+            next_batch = self.load_batch()
+        if not next_batch:
+            logger.warning("No proxy could be loaded")
+            return False
+        self.current_batch = deque(next_batch)
+        self.current_batch_size = len(next_batch)
+        self.stale_batch = False
+        if self.low_watermark:
+            self.prefetch_threshold = self.low_watermark * self.current_batch_size
+        if self.on_install is not None:
+            self.on_install(next_batch)
+        return True
+
+    def clear(self):
+        """drop loaded batches, the next call to next_proxy loads a fresh batch"""
+        with self.batch_rlock:
+            self.current_batch = deque()
+            self.current_batch_size = 0
+            self.prefetch_threshold = -1
+            self.next_batch = None
+            self.retry_time = -inf
+            self.stale_batch = False
+
+
+class AsyncProxyDispenser:
+    """asyncio version of ProxyDispenser, the next batch is prefetched in a task"""
+
+    def __init__(
+            self,
+            load_batch: Callable[[], Awaitable[Optional[list]]],
+            low_watermark: Optional[float] = 0.2,
+            on_install: Optional[Callable[[list], None]] = None,
+            retry_interval: float = 5.0,
+            clock: Callable[[], float] = monotonic,
+    ):
+        self.load_batch = load_batch
+        self.low_watermark: Optional[float] = low_watermark
+        self.on_install: Optional[Callable[[list], None]] = on_install
+        self.retry_interval: float = retry_interval
+        self.clock = clock
+
+        self.batch_lock = asyncio.Lock()
+        self.current_batch: Deque = deque()
+        self.current_batch_size: int = 0
+        self.next_batch: Optional[list] = None
+        self._prefetch_task: Optional[asyncio.Task] = None
+        self.retry_time: float = -inf
+        # a preloaded batch is replaced as soon as the next batch is loaded, see preload
+        self.stale_batch: bool = False
+
+    async def next_proxy(self):
+        """return the next proxy, None if no proxy could be loaded"""
+        if len(self.current_batch) > 0:
+            # no await between the check and popleft: no other task can empty the batch
+            proxy = self.current_batch.popleft()
+            if self.stale_batch:
+                self._replace_stale_batch()
+            else:
+                self._check_low_watermark()
+            return proxy
+        async with self.batch_lock:
+            if len(self.current_batch) == 0 and not await self._swap_batches():
+                return None
+            proxy = self.current_batch.popleft()
+            self._check_low_watermark()
+            return proxy
+
+    async def load_first_batch(self):
+        """load a batch if none is being served, without serving a proxy"""
+        async with self.batch_lock:
+            if len(self.current_batch) == 0:
+                await self._swap_batches()
+
+    def preload(self, batch: list):
+        """serve batch (e.g. read from a snapshot) right away, the next batch is loaded in a task
+        on the next call and replaces it once loaded"""
+        self._use_batch(batch)
+        self.stale_batch = True
+
+    def _replace_stale_batch(self):
+        if self.next_batch is not None:
+            self._use_batch(self.next_batch)
+            self.next_batch = None
+        elif self._prefetch_task is None and self.clock() >= self.retry_time:
+            self._prefetch_task = asyncio.create_task(self._prefetch())
+
+    def _check_low_watermark(self):
+        if not self.low_watermark or self.next_batch is not None or self._prefetch_task is not None:
+            return
+        if self.clock() < self.retry_time:
+            return
+        if len(self.current_batch) <= self.low_watermark * self.current_batch_size:
+            self._prefetch_task = asyncio.create_task(self._prefetch())
+
+    async def _prefetch(self):
+        try:
+            self.next_batch = await self.load_batch() or None
+        except Exception as ex:
+            logger.warning("Proxy batch prefetch failed: %s", ex)
+            self.next_batch = None
+        finally:
+            if self.next_batch is None:
+                self.retry_time = self.clock() + self.retry_interval
+                # keep serving the preloaded batch rather than retry on every call
+                self.stale_batch = False
+            self._prefetch_task = None
+
+    async def _swap_batches(self) -> bool:
+        """make the next batch current, load it if it wasn't prefetched"""
+        prefetch_task = self._prefetch_task
+        if prefetch_task is not None:
+            await prefetch_task
+        next_batch, self.next_batch = self.next_batch, None
+        if not next_batch:
+            next_batch = await self.load_batch()
+        if not next_batch:
+            logger.warning("No proxy could be loaded")
+            return False
+        self._use_batch(next_batch)
+        return True
+
+    def _use_batch(self, batch: list):
+        self.current_batch = deque(batch)
+        self.current_batch_size = len(batch)
+        self.stale_batch = False
+        if self.on_install is not None:
+            self.on_install(batch)
+
+    def clear(self):
+        """drop loaded batches, the next call to next_proxy loads a fresh batch"""
+        self.current_batch = deque()
+        self.current_batch_size = 0
+        self.next_batch = None
+        self.retry_time = -inf
+        self.stale_batch = False
+
+
+class BatchLoader:
+    """Batch loading for dispensers that install a whole batch at once, see RateLimitedDispenser
+    Once low_watermark (fraction) of the batch is left to serve, the next batch is loaded by load_batch
+    in a background thread. It is installed by install_batch (which returns its size) once as many
+    proxies as the current batch holds were served. Only the first batch is loaded in the caller's thread.
+    After a load failed or returned no proxy, no load is started for retry_interval seconds.
+    on_install is called with each batch installed"""
+
+    def __init__(
+            self,
+            load_batch: Callable[[], Optional[list]],
+            install_batch: Callable[[list], int],
+            low_watermark: Optional[float] = 0.2,
+            retry_interval: float = 5.0,
+            clock: Callable[[], float] = monotonic,
+            on_install: Optional[Callable[[list], None]] = None,
+    ):
+        self.load_batch = load_batch
+        self.install_batch = install_batch
+        self.on_install: Optional[Callable[[list], None]] = on_install
+        self.low_watermark: Optional[float] = low_watermark
+        self.retry_interval: float = retry_interval
+        self.clock = clock
+
+        self.batch_rlock: RLock = RLock()
+        self.batch_size: int = 0
+        self.served_count: int = 0
+        self.prefetch_count: float = inf
+        self.next_batch: Optional[list] = None
+        self.retry_time: float = -inf
+        self._prefetch_thread: Optional[Thread] = None
+
+    def before_serve(self):
+        """load the first batch, or install the next one once the current batch was served"""
+        if self.served_count < self.batch_size:
+            return
+        with self.batch_rlock:
+            if self.batch_size == 0:
+                self._load_first_batch()
+            elif self.served_count >= self.batch_size:
+                if self.next_batch is not None:
+                    self._install(self.next_batch)
+                else:
+                    # the current batch keeps being served until the next one is loaded
+                    self._start_prefetch()
+
+    def count_served(self):
+        """count a proxy served from the current batch"""
+        with self.batch_rlock:
+            self.served_count += 1
+            if self.served_count >= self.prefetch_count:
+                self._start_prefetch()
+
+    def _load_first_batch(self):
+        if self.clock() < self.retry_time:
+            return
+        try:
+            batch = self.load_batch()
+        except Exception:
+            self.retry_time = self.clock() + self.retry_interval
+            raise
+        if not batch:
+            logger.warning("No proxy could be loaded")
+            self.retry_time = self.clock() + self.retry_interval
+            return
+        self._install(batch)
+
+    def _install(self, batch: list):
+        self.next_batch = None
+        self.batch_size = self.install_batch(batch)
+        self.served_count = 0
+        self.prefetch_count = self.batch_size * (1 - self.low_watermark) if self.low_watermark else self.batch_size
+        if self.on_install is not None:
+            self.on_install(batch)
+
+    def _start_prefetch(self):
+        if self.next_batch is not None or self._prefetch_thread is not None or self.clock() < self.retry_time:
+            return
+        self._prefetch_thread = Thread(target=self._prefetch, name="proxy_prefetch", daemon=True)
+        self._prefetch_thread.start()
+
+    def _prefetch(self):
+        try:
+            next_batch = self.load_batch()
+        except Exception as ex:
+            logger.warning("Proxy batch prefetch failed, the current batch is kept: %s", ex)
+            next_batch = None
+        with self.batch_rlock:
+            if not next_batch:
+                self.retry_time = self.clock() + self.retry_interval
+            self.next_batch = next_batch or None
+            self._prefetch_thread = None
+
+    def preload(self, batch: list):
+        """install batch (e.g. read from a snapshot) right away, the next batch is loaded in the background
+        on the next call and replaces it once loaded"""
+        with self.batch_rlock:
+            self._install(batch)
+            self.served_count = self.batch_size
+
+    def clear(self):
+        """the next call to before_serve loads a fresh batch"""
+        with self.batch_rlock:
+            self.batch_size = 0
+            self.served_count = 0
+            self.next_batch = None
+            self.retry_time = -inf
+
+
+class AsyncBatchLoader:
+    """asyncio version of BatchLoader, the next batch is prefetched in a task"""
+
+    def __init__(
+            self,
+            load_batch: Callable[[], Awaitable[Optional[list]]],
+            install_batch: Callable[[list], int],
+            low_watermark: Optional[float] = 0.2,
+            retry_interval: float = 5.0,
+            clock: Callable[[], float] = monotonic,
+            on_install: Optional[Callable[[list], None]] = None,
+    ):
+        self.load_batch = load_batch
+        self.install_batch = install_batch
+        self.on_install: Optional[Callable[[list], None]] = on_install
+        self.low_watermark: Optional[float] = low_watermark
+        self.retry_interval: float = retry_interval
+        self.clock = clock
+
+        self.batch_lock = asyncio.Lock()
+        self.batch_size: int = 0
+        self.served_count: int = 0
+        self.prefetch_count: float = inf
+        self.next_batch: Optional[list] = None
+        self.retry_time: float = -inf
+        self._prefetch_task: Optional[asyncio.Task] = None
+
+    async def before_serve(self):
+        """load the first batch, or install the next one once the current batch was served"""
+        if self.served_count < self.batch_size:
+            return
+        if self.batch_size == 0:
+            # tasks wait for the first batch only
+            async with self.batch_lock:
+                if self.batch_size == 0:
+                    await self._load_first_batch()
+        elif self.next_batch is not None:
+            self._install(self.next_batch)
+        else:
+            self._start_prefetch()
+
+    def count_served(self):
+        """count a proxy served from the current batch"""
+        self.served_count += 1
+        if self.served_count >= self.prefetch_count:
+            self._start_prefetch()
+
+    async def _load_first_batch(self):
+        if self.clock() < self.retry_time:
+            return
+        try:
+            batch = await self.load_batch()
+        except Exception:
+            self.retry_time = self.clock() + self.retry_interval
+            raise
+        if not batch:
+            logger.warning("No proxy could be loaded")
+            self.retry_time = self.clock() + self.retry_interval
+            return
+        self._install(batch)
+
+    def _install(self, batch: list):
+        self.next_batch = None
+        self.batch_size = self.install_batch(batch)
+        self.served_count = 0
+        self.prefetch_count = self.batch_size * (1 - self.low_watermark) if self.low_watermark else self.batch_size
+        if self.on_install is not None:
+            self.on_install(batch)
+
+    def _start_prefetch(self):
+        if self.next_batch is not None or self._prefetch_task is not None or self.clock() < self.retry_time:
+            return
+        self._prefetch_task = asyncio.create_task(self._prefetch())
+
+    async def _prefetch(self):
+        try:
+            next_batch = await self.load_batch()
+        except Exception as ex:
+            logger.warning("Proxy batch prefetch failed, the current batch is kept: %s", ex)
+            next_batch = None
+        if not next_batch:
+            self.retry_time = self.clock() + self.retry_interval
+        self.next_batch = next_batch or None
+        self._prefetch_task = None
+
+    def preload(self, batch: list):
+        """install batch (e.g. read from a snapshot) right away, the next batch is loaded in a task
+        on the next call and replaces it once loaded"""
+        self._install(batch)
+        self.served_count = self.batch_size
+
+    def clear(self):
+        """the next call to before_serve loads a fresh batch"""
+        self.batch_size = 0
+        self.served_count = 0
+        self.next_batch = None
+        self.retry_time = -inf
@@ -0,0 +1,113 @@
+from itertools import count
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# filter name: tbl_proxy_url column it matches
+FILTER_COLUMNS: Dict[str, str] = {
+    "country": "proxy_country",
+    "town": "proxy_town",
+    "source": "proxy_web_name",
+}
+
+# ((column, normalised value), ...) in FILTER_COLUMNS order
+ProxyFilters = Tuple[Tuple[str, str], ...]
+
+
+def normalise_filter_value(value) -> str:
+    """return value stripped and lower case, filters are case insensitive"""
+    return str(value).strip().lower()
+
+
+def get_proxy_filters(
+        country: Optional[str] = None,
+        town: Optional[str] = None,
+        source: Optional[str] = None,
+) -> Optional[ProxyFilters]:
+    """return the filters given as ProxyFilters, None if none is given"""
+    filter_values = {"country": country, "town": town, "source": source}
+    proxy_filters: ProxyFilters = tuple(
+        (column, normalise_filter_value(filter_values[filter_name]))
+        for filter_name, column in FILTER_COLUMNS.items()
+        if filter_values[filter_name] is not None
+    )
+    return proxy_filters or None
+
+
+class RotatingPool:
+    """Proxies served in turn, next_proxy is O(1) and needs no lock: next() on a count is atomic"""
+    __slots__ = ("proxies", "counter")
+
+    def __init__(self, proxies: List):
+        self.proxies: List = proxies
+        self.counter = count()
+
+    def next_proxy(self, accept: Optional[Callable[[object], bool]] = None):
+        """return the next proxy, None if the pool is empty
+        With accept, the proxies are tried in turn until one is accepted, None if none is"""
+        if len(self.proxies) == 0:
+            return None
+        if accept is None:
+            return self.proxies[next(self.counter) % len(self.proxies)]
+        for _ in range(len(self.proxies)):
+            proxy = self.proxies[next(self.counter) % len(self.proxies)]
+            if accept(proxy):
+                return proxy
+        return None
+
+
+class AttributeIndex:
+    """Secondary indexes of the proxies served: filter value -> RotatingPool of the matching proxies
+    load only keeps the batch, a column is indexed on the first filtered pick after a load
+    and pools of combined filters are cached, so picks are O(1) and handlers not using filters pay nothing"""
+
+    def __init__(self):
+        self.loaded: bool = False
+        self.proxies: List = []
+        # column: {normalised value: pool}
+        self.column_pools: Dict[str, Dict[str, RotatingPool]] = {}
+        self.filter_pools: Dict[ProxyFilters, RotatingPool] = {}
+        self.index_lock: Lock = Lock()
+
+    def load(self, proxies: Iterable):
+        """index proxies instead of the current ones"""
+        proxies = list(proxies)
+        with self.index_lock:
+            self.proxies = proxies
+            self.column_pools = {}
+            self.filter_pools = {}
+            self.loaded = True
+
+    def next_proxy(self, proxy_filters: ProxyFilters, accept: Optional[Callable[[object], bool]] = None):
+        """return the next proxy matching every filter (and accepted by accept), None if none does"""
+        proxy_pool = self.filter_pools.get(proxy_filters)
+        if proxy_pool is None:
+            with self.index_lock:
+                proxy_pool = self.filter_pools.get(proxy_filters)
+                if proxy_pool is None:
+                    proxy_pool = self._build_filter_pool(proxy_filters)
+                    self.filter_pools[proxy_filters] = proxy_pool
+        return proxy_pool.next_proxy(accept)
+
+    def _get_column_pools(self, column: str) -> Dict[str, RotatingPool]:
+        column_pools = self.column_pools.get(column)
+        if column_pools is None:
+            proxies_by_value: Dict[str, List] = {}
+            for proxy in self.proxies:
+                value = proxy.get(column)
+                if value is not None:
+                    proxies_by_value.setdefault(normalise_filter_value(value), []).append(proxy)
+            column_pools = {value: RotatingPool(proxies) for value, proxies in proxies_by_value.items()}
+            self.column_pools[column] = column_pools
+        return column_pools
+
+    def _build_filter_pool(self, proxy_filters: ProxyFilters) -> RotatingPool:
+        proxy_pools = [self._get_column_pools(column).get(value) for column, value in proxy_filters]
+        if any(proxy_pool is None for proxy_pool in proxy_pools):
+            return RotatingPool([])
+        if len(proxy_pools) == 1:
+            return proxy_pools[0]
+        # the smallest pool filtered by the others
+        proxy_pools.sort(key=lambda proxy_pool: len(proxy_pool.proxies))
+        other_proxy_ids = [{id(proxy) for proxy in proxy_pool.proxies} for proxy_pool in proxy_pools[1:]]
+        return RotatingPool([proxy for proxy in proxy_pools[0].proxies
+                             if all(id(proxy) in proxy_ids for proxy_ids in other_proxy_ids)])
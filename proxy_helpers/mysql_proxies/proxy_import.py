@@ -0,0 +1,262 @@
+import argparse
+import csv
+import gzip
+import json
+import logging
+import re
+from collections import OrderedDict
+from pathlib import Path
+from time import perf_counter
+from typing import IO, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+logger = logging.getLogger(f"proxy_helpers:{Path(__file__).name}")
+
+PROXY_FILE_FORMATS: Tuple[str, ...] = ("txt", "csv", "jsonl")
+# source column names accepted for each tbl_proxy_url column, first match wins
+COLUMN_ALIASES: Dict[str, Tuple[str, ...]] = {
+    "proxy_url": ("proxy_url", "proxy", "host", "ip", "address"),
+    "proxy_port": ("proxy_port", "port"),
+    "proxy_country": ("proxy_country", "country"),
+    "proxy_town": ("proxy_town", "town", "city"),
+    "proxy_speed": ("proxy_speed", "speed"),
+    "proxy_web_name": ("proxy_web_name", "source"),
+}
+_IPV4_RE = re.compile(r"^(\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3})$")
+_HOSTNAME_RE = re.compile(r"^(?=.{1,253}$)[a-z0-9]([a-z0-9-]{0,61}[a-z0-9])?(\.[a-z0-9]([a-z0-9-]{0,61}[a-z0-9])?)*$")
+
+
+def get_proxy_file_format(file_path: Union[str, Path]) -> str:
+    """return txt, csv or jsonl from the file suffix, .gz excluded"""
+    suffixes = [suffix.lower() for suffix in Path(file_path).suffixes if suffix.lower() != ".gz"]
+    suffix: str = suffixes[-1] if suffixes else ""
+    if suffix == ".csv":
+        return "csv"
+    if suffix in (".jsonl", ".ndjson"):
+        return "jsonl"
+    return "txt"
+
+
+def _open_text(file_path: Union[str, Path]) -> IO[str]:
+    if str(file_path).lower().endswith(".gz"):
+        return gzip.open(file_path, "rt", encoding="utf-8", errors="replace", newline="")
+    return open(file_path, "r", encoding="utf-8", errors="replace", newline="")
+
+
+def _iter_text_records(lines: Iterable[str]) -> Iterator[Dict]:
+    # host:port, or host and port separated by white space, # comments
+    for line in lines:
+        fields = line.split("#", 1)[0].split()
+        if not fields:
+            continue
+        if len(fields) > 1 and ":" not in fields[0].split("://")[-1]:
+            yield {"proxy_url": fields[0], "proxy_port": fields[1]}
+        else:
+            yield {"proxy_url": fields[0]}
+
+
+def _iter_jsonl_records(lines: Iterable[str]) -> Iterator[Optional[Dict]]:
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield record if isinstance(record, dict) else None
+
+
+def iter_proxy_records(file_path: Union[str, Path], file_format: Optional[str] = None) -> Iterator[Optional[Dict]]:
+    """yield one raw record per proxy line of the file, None for unreadable json lines
+    The file is read line by line, memory use doesn't grow with its size"""
+    file_format = file_format or get_proxy_file_format(file_path)
+    if file_format not in PROXY_FILE_FORMATS:
+        raise ValueError(f"Unknown proxy file format: {file_format}, expected one of {PROXY_FILE_FORMATS}")
+    with _open_text(file_path) as proxy_file:
+        if file_format == "csv":
+            for record in csv.DictReader(proxy_file):
+                yield {str(column).strip().lower(): value for column, value in record.items() if column is not None}
+        elif file_format == "jsonl":
+            yield from _iter_jsonl_records(proxy_file)
+        else:
+            yield from _iter_text_records(proxy_file)
+
+
+def _is_valid_host(host: str) -> bool:
+    ipv4_match = _IPV4_RE.match(host)
+    if ipv4_match is not None:
+        return all(int(octet) <= 255 for octet in ipv4_match.groups())
+    return not host.replace(".", "").isdigit() and _HOSTNAME_RE.match(host) is not None
+
+
+def _get_field(record: Dict, column: str):
+    for alias in COLUMN_ALIASES[column]:
+        value = record.get(alias)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def normalise_proxy(record: Optional[Dict]) -> Optional[Dict]:
+    """return a proxy dict for insert_proxies, proxy_url as a lower case host without scheme,
+    proxy_port as int, None if the host or port is invalid
+    host:port in the url column is split, credentials are not supported"""
+    if not record:
+        return None
+    proxy_url = _get_field(record, "proxy_url")
+    if proxy_url is None:
+        return None
+    host: str = str(proxy_url).strip().lower()
+    if "://" in host:
+        host = host.split("://", 1)[1]
+    host = host.rstrip("/")
+    if "@" in host or "/" in host:
+        return None
+    proxy_port = _get_field(record, "proxy_port")
+    if host.count(":") == 1:
+        host, url_port = host.split(":")
+        proxy_port = proxy_port if proxy_port is not None else url_port
+    try:
+        proxy_port = int(str(proxy_port).strip())
+    except ValueError:
+        return None
+    if not 0 < proxy_port < 65536 or not _is_valid_host(host):
+        return None
+
+    proxy_speed = _get_field(record, "proxy_speed")
+    try:
+        proxy_speed = float(proxy_speed) if proxy_speed is not None else None
+    except ValueError:
+        proxy_speed = None
+    return {
+        "proxy_url": host,
+        "proxy_port": proxy_port,
+        "proxy_country": _get_field(record, "proxy_country"),
+        "proxy_town": _get_field(record, "proxy_town"),
+        "proxy_speed": proxy_speed,
+        "proxy_web_name": _get_field(record, "proxy_web_name"),
+    }
+
+
+class ImportStats:
+    """Counts of an import, updated by the pipeline as rows go through it"""
+
+    def __init__(self, progress_interval: Optional[float] = 10.0):
+        self.progress_interval: Optional[float] = progress_interval
+        self.read_count: int = 0
+        self.invalid_count: int = 0
+        self.duplicate_count: int = 0
+        self.started: float = perf_counter()
+        self.last_progress: float = self.started
+
+    def get_rows_per_second(self) -> float:
+        elapsed: float = perf_counter() - self.started
+        return self.read_count / elapsed if elapsed > 0 else 0.0
+
+    def log_progress(self):
+        if self.progress_interval is None:
+            return
+        now: float = perf_counter()
+        if now - self.last_progress >= self.progress_interval:
+            self.last_progress = now
+            logger.info("Proxy import: %s rows read, %s invalid, %s duplicates, %.0f rows/s",
+                        self.read_count, self.invalid_count, self.duplicate_count, self.get_rows_per_second())
+
+
+def iter_proxy_file(
+        file_path: Union[str, Path],
+        file_format: Optional[str] = None,
+        proxy_web_name: Optional[str] = None,
+        dedupe_window: int = 1_000_000,
+        import_stats: Optional[ImportStats] = None,
+) -> Iterator[Dict]:
+    """yield valid, normalised proxy dicts of the file, each (proxy_url, proxy_port) once
+    Duplicates are dropped within the last dedupe_window distinct proxies, so memory stays bounded,
+    later ones are merged by the upsert. proxy_web_name is used for rows without a source"""
+    import_stats = import_stats or ImportStats(progress_interval=None)
+    # (proxy_url, proxy_port) of the last dedupe_window proxies, oldest first
+    recent_keys: OrderedDict = OrderedDict()
+    for record in iter_proxy_records(file_path, file_format=file_format):
+        import_stats.read_count += 1
+        if import_stats.read_count % 10_000 == 0:
+            import_stats.log_progress()
+        proxy_dict = normalise_proxy(record)
+        if proxy_dict is None:
+            import_stats.invalid_count += 1
+            continue
+        proxy_key = (proxy_dict["proxy_url"], proxy_dict["proxy_port"])
+        if proxy_key in recent_keys:
+            import_stats.duplicate_count += 1
+            continue
+        recent_keys[proxy_key] = None
+        if len(recent_keys) > dedupe_window:
+            recent_keys.popitem(last=False)
+        if proxy_web_name is not None and proxy_dict["proxy_web_name"] is None:
+            proxy_dict["proxy_web_name"] = proxy_web_name
+        yield proxy_dict
+
+
+def import_proxy_file(
+        proxy_handler,
+        file_path: Union[str, Path],
+        file_format: Optional[str] = None,
+        chunk_size: int = 5000,
+        proxy_web_name: Optional[str] = None,
+        dedupe_window: int = 1_000_000,
+        progress_interval: Optional[float] = 10.0,
+) -> Dict[str, Union[int, float]]:
+    """upsert the proxies of a txt, csv or jsonl file (or .gz) with proxy_handler.insert_proxies,
+    in chunks of chunk_size rows, and log progress every progress_interval seconds
+    return the upsert counts plus read/invalid/duplicate row counts, seconds and rows_per_second"""
+    import_stats = ImportStats(progress_interval=progress_interval)
+    upsert_counts: Dict[str, Union[int, float]] = proxy_handler.insert_proxies(
+        iter_proxy_file(file_path, file_format=file_format, proxy_web_name=proxy_web_name,
+                        dedupe_window=dedupe_window, import_stats=import_stats),
+        chunk_size=chunk_size,
+    )
+    upsert_counts.update({
+        "read": import_stats.read_count,
+        "invalid": import_stats.invalid_count,
+        "duplicate": import_stats.duplicate_count,
+        "seconds": perf_counter() - import_stats.started,
+        "rows_per_second": import_stats.get_rows_per_second(),
+    })
+    logger.info("Proxy import of %s done: %s", file_path, upsert_counts)
+    return upsert_counts
+
+
+def main(argv: Optional[list] = None):
+    """console entry point, the database is read from the .env file, see .env.example:
+        proxy-import proxies.csv --chunk-size 5000 --source my_provider"""
+    parser = argparse.ArgumentParser(description="Stream a txt, csv or jsonl proxy list into tbl_proxy_url")
+    parser.add_argument("file_path", type=Path)
+    parser.add_argument("--format", dest="file_format", choices=PROXY_FILE_FORMATS, default=None,
+                        help="default: from the file suffix")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--source", dest="proxy_web_name", default=None,
+                        help="proxy_web_name of rows which don't have one")
+    parser.add_argument("--dedupe-window", type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+
+    from proxy_helpers.mysql_proxies.mysql_proxies import MySQLProxy
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    load_dotenv()
+    proxy_handler = MySQLProxy()
+    try:
+        import_counts = import_proxy_file(proxy_handler, args.file_path,
+                                          file_format=args.file_format,
+                                          chunk_size=args.chunk_size,
+                                          proxy_web_name=args.proxy_web_name,
+                                          dedupe_window=args.dedupe_window)
+    finally:
+        proxy_handler.close()
+    print(f"{args.file_path}: {import_counts['read']} rows read in {import_counts['seconds']:.1f}s "
+          f"({import_counts['rows_per_second']:.0f} rows/s), inserted {import_counts['inserted']}, "
+          f"updated {import_counts['updated']}, invalid {import_counts['invalid']}, "
+          f"duplicate {import_counts['duplicate']}, failed {import_counts['failed']}")
+
+
+if __name__ == "__main__":
+    main()
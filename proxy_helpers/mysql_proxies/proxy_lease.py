@@ -0,0 +1,112 @@
+import math
+import os
+import socket
+from typing import Collection, List, Optional, Tuple
+from uuid import uuid4
+
+from proxy_helpers.mysql_proxies.proxy_record import PROXY_COLUMNS
+
+# lease mode uses the lease_owner and lease_expires columns of tbl_proxy_url, see proxy_schema
+LEASE_RELEASE_SQL: str = """
+                    UPDATE tbl_proxy_url
+                    SET lease_owner= NULL, lease_expires= NULL
+                    WHERE lease_owner= %s
+                """
+
+
+def build_lease_select_sql(order_column: str = "error_count") -> str:
+    """return the SELECT FOR UPDATE of the lowest order_column free proxies, LIMIT as variable
+    Rows locked by another worker's claim are skipped rather than waited for"""
+    return f"""
+                    SELECT proxy_id
+                    FROM tbl_proxy_url
+                    WHERE lease_expires IS NULL OR lease_expires < NOW()
+                    ORDER BY {order_column} ASC
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                """
+
+
+LEASE_SELECT_SQL: str = build_lease_select_sql()
+
+
+def build_lease_records_query(proxy_ids: List[int]) -> Tuple[str, tuple]:
+    """return the SELECT of the PROXY_COLUMNS rows of proxy_ids"""
+    sql_string = f"""
+                SELECT {", ".join(f"a.{column}" for column in PROXY_COLUMNS)}
+                FROM tbl_proxy_url a
+                WHERE a.proxy_id IN ({', '.join(['%s'] * len(proxy_ids))})
+            """
+    return sql_string, tuple(proxy_ids)
+
+
+def build_lease_release_query(lease_owner: str, keep_proxy_ids: Collection[int] = ()) -> Tuple[str, tuple]:
+    """return the UPDATE releasing lease_owner's proxies, but keep_proxy_ids"""
+    if len(keep_proxy_ids) == 0:
+        return LEASE_RELEASE_SQL, (lease_owner,)
+    sql_string = f"""
+                UPDATE tbl_proxy_url
+                SET lease_owner= NULL, lease_expires= NULL
+                WHERE lease_owner= %s AND proxy_id NOT IN ({', '.join(['%s'] * len(keep_proxy_ids))})
+            """
+    return sql_string, (lease_owner,) + tuple(keep_proxy_ids)
+
+
+def get_lease_seconds(lease_ttl: float) -> int:
+    """return lease_ttl rounded up to whole seconds, the INTERVAL of the lease queries"""
+    return math.ceil(lease_ttl)
+
+
+def new_lease_owner() -> str:
+    """return an id unique to this handler, host:pid:random"""
+    return f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid4().hex[:8]}"
+
+
+def build_lease_update_query(proxy_ids: List[int], lease_owner: str, lease_ttl: float) -> Tuple[str, tuple]:
+    """return the UPDATE leasing proxy_ids to lease_owner for lease_ttl seconds"""
+    sql_string = f"""
+                UPDATE tbl_proxy_url
+                SET lease_owner= %s, lease_expires= DATE_ADD(NOW(), INTERVAL %s SECOND)
+                WHERE proxy_id IN ({', '.join(['%s'] * len(proxy_ids))})
+            """
+    return sql_string, (lease_owner, get_lease_seconds(lease_ttl)) + tuple(proxy_ids)
+
+
+def build_lease_renew_query(lease_owner: str, lease_ttl: float) -> Tuple[str, tuple]:
+    """return the UPDATE extending all of lease_owner's leases to lease_ttl seconds from now"""
+    sql_string = """
+                UPDATE tbl_proxy_url
+                SET lease_expires= DATE_ADD(NOW(), INTERVAL %s SECOND)
+                WHERE lease_owner= %s
+            """
+    return sql_string, (get_lease_seconds(lease_ttl), lease_owner)
+
+
+def claim_proxy_lease(cursor, lease_owner: str, lease_ttl: float, lease_size: int,
+                      order_column: str = "error_count",
+                      keep_proxy_ids: Collection[int] = ()) -> Optional[List[tuple]]:
+    """release lease_owner's proxies but keep_proxy_ids (the batch still being served) and lease it
+    the lease_size best free ones, return their PROXY_COLUMNS rows
+    Must run in a transaction, see NativeRowReader.run_in_transaction"""
+    cursor.execute(*build_lease_release_query(lease_owner, keep_proxy_ids))
+    cursor.execute(build_lease_select_sql(order_column), (lease_size,))
+    proxy_ids: List[int] = [row[0] for row in cursor.fetchall()]
+    if len(proxy_ids) == 0:
+        return None
+    cursor.execute(*build_lease_update_query(proxy_ids, lease_owner=lease_owner, lease_ttl=lease_ttl))
+    cursor.execute(*build_lease_records_query(proxy_ids))
+    return cursor.fetchall()
+
+
+async def claim_proxy_lease_async(cursor, lease_owner: str, lease_ttl: float, lease_size: int,
+                                  order_column: str = "error_count",
+                                  keep_proxy_ids: Collection[int] = ()) -> Optional[List[tuple]]:
+    """claim_proxy_lease for an asyncio cursor"""
+    await cursor.execute(*build_lease_release_query(lease_owner, keep_proxy_ids))
+    await cursor.execute(build_lease_select_sql(order_column), (lease_size,))
+    proxy_ids: List[int] = [row[0] for row in await cursor.fetchall()]
+    if len(proxy_ids) == 0:
+        return None
+    await cursor.execute(*build_lease_update_query(proxy_ids, lease_owner=lease_owner, lease_ttl=lease_ttl))
+    await cursor.execute(*build_lease_records_query(proxy_ids))
+    return await cursor.fetchall()
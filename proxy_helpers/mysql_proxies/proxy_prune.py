@@ -0,0 +1,86 @@
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(f"proxy_helpers:{Path(__file__).name}")
+
+
+def get_prune_conditions(
+        min_error_count: int,
+        max_age_days: Optional[float] = None,
+        now: Optional[datetime] = None,
+) -> Tuple[str, tuple]:
+    """return the WHERE conditions of proxies to prune and their variables:
+    error_count above min_error_count and, with max_age_days, not uploaded for max_age_days"""
+    conditions: List[str] = ["error_count > %s"]
+    sql_variables: list = [min_error_count]
+    if max_age_days is not None:
+        conditions.append("upload_datetime < %s")
+        sql_variables.append((now or datetime.utcnow()) - timedelta(days=max_age_days))
+    return " AND ".join(conditions), tuple(sql_variables)
+
+
+def build_prune_select_query(conditions: Tuple[str, tuple], after_proxy_id: int,
+                             chunk_size: int) -> Tuple[str, tuple]:
+    """return the SELECT of the next chunk_size proxy ids to prune after after_proxy_id
+    Walks the primary key, each chunk starts where the previous one ended"""
+    condition_sql, condition_variables = conditions
+    sql_string = f"""
+                SELECT proxy_id
+                FROM tbl_proxy_url
+                WHERE proxy_id > %s AND {condition_sql}
+                ORDER BY proxy_id ASC
+                LIMIT %s
+            """
+    return sql_string, (after_proxy_id,) + condition_variables + (chunk_size,)
+
+
+def build_prune_delete_query(conditions: Tuple[str, tuple], proxy_ids: List[int]) -> Tuple[str, tuple]:
+    """return the DELETE of proxy_ids, conditions are checked again
+    so a proxy scored since it was selected is kept"""
+    condition_sql, condition_variables = conditions
+    sql_string = f"""
+                DELETE FROM tbl_proxy_url
+                WHERE proxy_id IN ({", ".join(["%s"] * len(proxy_ids))}) AND {condition_sql}
+            """
+    return sql_string, tuple(proxy_ids) + condition_variables
+
+
+class PruneStats:
+    """Counts of a prune, progress logged every progress_interval seconds"""
+
+    def __init__(self, progress_interval: Optional[float] = 10.0):
+        self.progress_interval: Optional[float] = progress_interval
+        self.selected_count: int = 0
+        self.deleted_count: int = 0
+        self.chunk_count: int = 0
+        self.started: float = perf_counter()
+        self.last_progress: float = self.started
+
+    def add_chunk(self, selected_count: int, deleted_count: Optional[int]):
+        self.chunk_count += 1
+        self.selected_count += selected_count
+        self.deleted_count += deleted_count or 0
+        if self.progress_interval is None:
+            return
+        now: float = perf_counter()
+        if now - self.last_progress >= self.progress_interval:
+            self.last_progress = now
+            logger.info("Proxy prune: %s deleted in %s chunks, %.0f rows/s",
+                        self.deleted_count, self.chunk_count, self.get_rows_per_second())
+
+    def get_rows_per_second(self) -> float:
+        elapsed: float = perf_counter() - self.started
+        return self.deleted_count / elapsed if elapsed > 0 else 0.0
+
+    def get_counts(self) -> Dict[str, Union[int, float]]:
+        return {
+            "deleted": self.deleted_count,
+            # selected but scored or deleted by someone else before the chunk delete
+            "kept": self.selected_count - self.deleted_count,
+            "chunks": self.chunk_count,
+            "seconds": perf_counter() - self.started,
+            "rows_per_second": self.get_rows_per_second(),
+        }
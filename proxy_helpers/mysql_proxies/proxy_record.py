@@ -0,0 +1,77 @@
+import random
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# tbl_proxy_url columns, in the order of the tuples given to Proxy
+PROXY_COLUMNS: Tuple[str, ...] = (
+    "proxy_id", "upload_datetime", "proxy_url", "proxy_port", "proxy_country", "proxy_town",
+    "proxy_speed", "proxy_web_name", "error_count", "error_selenium_count",
+)
+
+PROXY_RECORDS_SQL: str = f"""
+                    SELECT {", ".join(f"a.{column}" for column in PROXY_COLUMNS)}
+                    FROM tbl_proxy_url a
+                    ORDER BY a.error_count ASC
+                    LIMIT %s
+                """
+
+
+class Proxy:
+    """Compact tbl_proxy_url row, built straight from a cursor tuple
+    proxy["full_url"] and proxy.get(...) still work for code written against proxy dicts
+    latency_ewma is only read in latency selection mode, see latency_tracker"""
+    __slots__ = ("full_url",) + PROXY_COLUMNS + ("latency_ewma",)
+
+    def __init__(
+            self,
+            proxy_id: Optional[int] = None,
+            upload_datetime=None,
+            proxy_url: Optional[str] = None,
+            proxy_port: Optional[int] = None,
+            proxy_country: Optional[str] = None,
+            proxy_town: Optional[str] = None,
+            proxy_speed=None,
+            proxy_web_name: Optional[str] = None,
+            error_count: int = 0,
+            error_selenium_count: int = 0,
+            latency_ewma: Optional[float] = None,
+    ):
+        self.proxy_id = proxy_id
+        self.upload_datetime = upload_datetime
+        self.proxy_url = proxy_url
+        self.proxy_port = proxy_port
+        self.proxy_country = proxy_country
+        self.proxy_town = proxy_town
+        self.proxy_speed = proxy_speed
+        self.proxy_web_name = proxy_web_name
+        self.error_count = error_count
+        self.error_selenium_count = error_selenium_count
+        self.latency_ewma = latency_ewma
+        self.full_url: str = f"{proxy_url}:{proxy_port}"
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
+
+    def keys(self) -> Tuple[str, ...]:
+        return self.__slots__
+
+    def to_dict(self) -> Dict:
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"Proxy(proxy_id={self.proxy_id!r}, full_url={self.full_url!r}, error_count={self.error_count!r})"
+
+
+def get_proxy_records(rows: Iterable[tuple], shuffle_results: bool = True) -> Optional[List[Proxy]]:
+    """return Proxy records from PROXY_COLUMNS (+ latency_ewma) ordered tuples, shuffled in place, None if no rows"""
+    proxies: List[Proxy] = [Proxy(*row) for row in rows]
+    if len(proxies) == 0:
+        return None
+    if shuffle_results:
+        random.shuffle(proxies)
+    return proxies
@@ -0,0 +1,338 @@
+import argparse
+import json
+import logging
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from proxy_helpers.mysql_proxies.proxy_lease import LEASE_RELEASE_SQL
+from proxy_helpers.mysql_proxies.proxy_record import PROXY_COLUMNS, PROXY_RECORDS_SQL
+from proxy_helpers.mysql_proxies.proxy_universe import build_changed_rows_sql, build_universe_sql
+from proxy_helpers.mysql_proxies.score_decay import build_score_backfill_query
+
+logger = logging.getLogger(f"proxy_helpers:{Path(__file__).name}")
+
+# MySQL schema of tbl_proxy_url and its side tables, every column and index the handlers rely on.
+# Table: ((column, definition), ...) in table order
+SCHEMA_COLUMNS: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    "tbl_proxy_url": (
+        ("proxy_id", "INT NOT NULL AUTO_INCREMENT"),
+        ("upload_datetime", "DATETIME NULL"),
+        ("proxy_url", "VARCHAR(255) NOT NULL"),
+        ("proxy_port", "INT NOT NULL"),
+        ("proxy_country", "VARCHAR(64) NULL"),
+        ("proxy_town", "VARCHAR(128) NULL"),
+        ("proxy_speed", "FLOAT NULL"),
+        ("proxy_web_name", "VARCHAR(255) NULL"),
+        ("error_count", "INT NOT NULL DEFAULT 0"),
+        ("error_selenium_count", "INT NOT NULL DEFAULT 0"),
+        # seconds, NULL until measured, see latency_tracker
+        ("latency_ewma", "FLOAT NULL"),
+        # lease mode, see proxy_lease
+        ("lease_owner", "VARCHAR(64) NULL"),
+        ("lease_expires", "DATETIME NULL"),
+        # incremental refresh, see proxy_universe
+        ("updated_at", "TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)"),
+        # time-decayed scores, see score_decay
+        ("decayed_score", "DOUBLE NOT NULL DEFAULT 0"),
+        ("score_updated_at", "TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6)"),
+        ("score_rank", "DOUBLE NOT NULL DEFAULT 0"),
+    ),
+    # delete tombstones filled by trg_proxy_url_deleted, older than full_resync_interval they can be deleted
+    "tbl_proxy_url_deleted": (
+        ("proxy_id", "INT NOT NULL"),
+        ("deleted_at", "TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6)"),
+    ),
+    # per target domain scores, see domain_stats
+    "tbl_proxy_domain_stats": (
+        ("proxy_id", "INT NOT NULL"),
+        ("domain", "VARCHAR(255) NOT NULL"),
+        ("success_count", "INT NOT NULL DEFAULT 0"),
+        ("error_count", "INT NOT NULL DEFAULT 0"),
+    ),
+}
+
+# Table: {index name: (columns, unique)}, PRIMARY is the primary key
+SCHEMA_INDEXES: Dict[str, Dict[str, Tuple[Tuple[str, ...], bool]]] = {
+    "tbl_proxy_url": {
+        "PRIMARY": (("proxy_id",), True),
+        # upserts, and score updates and deletes by url and port
+        "uq_proxy_url_port": (("proxy_url", "proxy_port"), True),
+        # ORDER BY error_count ASC LIMIT n of the selection reads the index in order, no filesort
+        "idx_error_count": (("error_count",), False),
+        "idx_updated_at": (("updated_at",), False),
+        "idx_lease_owner": (("lease_owner",), False),
+        # ORDER BY score_rank ASC LIMIT n of the selection with score_half_life
+        "idx_score_rank": (("score_rank",), False),
+    },
+    "tbl_proxy_url_deleted": {
+        "PRIMARY": (("proxy_id",), True),
+        "idx_deleted_at": (("deleted_at",), False),
+    },
+    "tbl_proxy_domain_stats": {
+        "PRIMARY": (("proxy_id", "domain"), True),
+    },
+}
+
+SCHEMA_TRIGGERS: Dict[str, str] = {
+    "trg_proxy_url_deleted": """
+                CREATE TRIGGER trg_proxy_url_deleted AFTER DELETE ON tbl_proxy_url FOR EACH ROW
+                    REPLACE INTO tbl_proxy_url_deleted (proxy_id) VALUES (OLD.proxy_id)
+            """,
+}
+
+_TABLE_NAMES_SQL: str = ", ".join(f"'{table_name}'" for table_name in SCHEMA_COLUMNS)
+TABLES_SQL: str = f"""
+                    SELECT TABLE_NAME
+                    FROM information_schema.TABLES
+                    WHERE TABLE_SCHEMA= DATABASE() AND TABLE_NAME IN ({_TABLE_NAMES_SQL})
+                """
+COLUMNS_SQL: str = f"""
+                    SELECT TABLE_NAME, COLUMN_NAME
+                    FROM information_schema.COLUMNS
+                    WHERE TABLE_SCHEMA= DATABASE() AND TABLE_NAME IN ({_TABLE_NAMES_SQL})
+                """
+INDEXES_SQL: str = f"""
+                    SELECT TABLE_NAME, INDEX_NAME, COLUMN_NAME, NON_UNIQUE
+                    FROM information_schema.STATISTICS
+                    WHERE TABLE_SCHEMA= DATABASE() AND TABLE_NAME IN ({_TABLE_NAMES_SQL})
+                    ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX
+                """
+TRIGGERS_SQL: str = """
+                    SELECT TRIGGER_NAME
+                    FROM information_schema.TRIGGERS
+                    WHERE TRIGGER_SCHEMA= DATABASE()
+                """
+# the unique key can't be added while these exist
+DUPLICATE_PROXIES_SQL: str = """
+                    SELECT proxy_url, proxy_port, COUNT(*)
+                    FROM tbl_proxy_url
+                    GROUP BY proxy_url, proxy_port
+                    HAVING COUNT(*) > 1
+                    LIMIT 10
+                """
+
+# (name, query, variables, index it must use), checked with EXPLAIN by verify_query_plans
+HOT_QUERIES: Tuple[Tuple[str, str, tuple, str], ...] = (
+    ("proxy selection", PROXY_RECORDS_SQL, (100,), "idx_error_count"),
+    ("score update by url", """
+                    UPDATE tbl_proxy_url
+                    SET error_count= error_count + 1
+                    WHERE proxy_url= %s AND proxy_port=%s
+                """, ("10.0.0.1", 8080), "uq_proxy_url_port"),
+    ("delete by url", """
+                    DELETE FROM tbl_proxy_url
+                    WHERE proxy_url= %s AND proxy_port=%s
+                """, ("10.0.0.1", 8080), "uq_proxy_url_port"),
+    ("incremental refresh", build_changed_rows_sql(PROXY_COLUMNS), (datetime(2000, 1, 1),), "idx_updated_at"),
+    ("lease release", LEASE_RELEASE_SQL, ("lease_owner",), "idx_lease_owner"),
+    ("decayed selection", build_universe_sql(PROXY_COLUMNS, order_column="score_rank"), (100,), "idx_score_rank"),
+)
+
+# hot queries reading the first rows of an index, their plan must not sort
+ORDER_LIMIT_PATTERN = re.compile(r"\bORDER\s+BY\b.*\bLIMIT\b", re.IGNORECASE | re.DOTALL)
+
+# table: {index name: (columns, unique)}
+IndexMap = Dict[str, Dict[str, Tuple[Tuple[str, ...], bool]]]
+FetchAll = Callable[[str, Optional[tuple]], List[tuple]]
+
+
+def _format_index(index_name: str, columns: Tuple[str, ...], unique: bool) -> str:
+    column_list: str = ", ".join(f"`{column}`" for column in columns)
+    if index_name == "PRIMARY":
+        return f"PRIMARY KEY ({column_list})"
+    return f"{'UNIQUE KEY' if unique else 'KEY'} `{index_name}` ({column_list})"
+
+
+def build_create_table_sql(table_name: str) -> str:
+    """return the CREATE TABLE IF NOT EXISTS of table_name"""
+    definitions: List[str] = [f"`{column}` {definition}" for column, definition in SCHEMA_COLUMNS[table_name]]
+    definitions.extend(_format_index(index_name, columns, unique)
+                       for index_name, (columns, unique) in SCHEMA_INDEXES[table_name].items())
+    return (f"CREATE TABLE IF NOT EXISTS `{table_name}` (\n    " + ",\n    ".join(definitions)
+            + "\n) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4")
+
+
+def get_schema_sql() -> List[str]:
+    """return the statements creating the whole schema on an empty database"""
+    return [build_create_table_sql(table_name) for table_name in SCHEMA_COLUMNS] + [
+        " ".join(trigger_sql.split()) for trigger_sql in SCHEMA_TRIGGERS.values()
+    ]
+
+
+def _has_index(existing_indexes: Dict[str, Tuple[Tuple[str, ...], bool]], columns: Tuple[str, ...],
+               unique: bool) -> bool:
+    # any index starting with the columns serves lookups and ordering, a unique key must match exactly
+    for existing_columns, existing_unique in existing_indexes.values():
+        if unique and existing_unique and existing_columns == columns:
+            return True
+        if not unique and existing_columns[:len(columns)] == columns:
+            return True
+    return False
+
+
+def build_migration_statements(
+        tables: Set[str],
+        columns: Dict[str, Set[str]],
+        indexes: IndexMap,
+        triggers: Set[str],
+) -> List[str]:
+    """return the statements bringing the database to the package schema, empty if it is current
+    Missing tables are created, missing columns and indexes added with one ALTER TABLE per table,
+    indexes are matched by columns whatever their name. Columns are never dropped or changed"""
+    statements: List[str] = []
+    for table_name, table_columns in SCHEMA_COLUMNS.items():
+        if table_name not in tables:
+            statements.append(build_create_table_sql(table_name))
+            continue
+        alterations: List[str] = [
+            f"ADD COLUMN `{column}` {definition}"
+            for column, definition in table_columns
+            if column not in columns.get(table_name, set())
+        ]
+        alterations.extend(
+            f"ADD {_format_index(index_name, index_columns, unique)}"
+            for index_name, (index_columns, unique) in SCHEMA_INDEXES[table_name].items()
+            if not _has_index(indexes.get(table_name, {}), index_columns, unique)
+        )
+        if alterations:
+            statements.append(f"ALTER TABLE `{table_name}` " + ", ".join(alterations))
+    statements.extend(" ".join(trigger_sql.split())
+                      for trigger_name, trigger_sql in SCHEMA_TRIGGERS.items() if trigger_name not in triggers)
+    return statements
+
+
+def read_database_schema(fetch_all: FetchAll) -> Tuple[Set[str], Dict[str, Set[str]], IndexMap, Set[str]]:
+    """return (tables, columns, indexes, triggers) of the package tables from information_schema"""
+    tables: Set[str] = {row[0] for row in fetch_all(TABLES_SQL, None)}
+    columns: Dict[str, Set[str]] = {}
+    for table_name, column in fetch_all(COLUMNS_SQL, None):
+        columns.setdefault(table_name, set()).add(column)
+    indexes: IndexMap = {}
+    for table_name, index_name, column, non_unique in fetch_all(INDEXES_SQL, None):
+        table_indexes = indexes.setdefault(table_name, {})
+        index_columns, _ = table_indexes.get(index_name, ((), False))
+        table_indexes[index_name] = (index_columns + (column,), not int(non_unique))
+    triggers: Set[str] = {row[0] for row in fetch_all(TRIGGERS_SQL, None)}
+    return tables, columns, indexes, triggers
+
+
+def verify_schema(proxy_handler) -> List[str]:
+    """return the statements migrate_schema would run, empty if the schema is current"""
+    return build_migration_statements(*read_database_schema(proxy_handler.fetch_all_as_tuples))
+
+
+def migrate_schema(proxy_handler, dry_run: bool = False, score_half_life: Optional[float] = None) -> List[str]:
+    """create or alter the package tables, return the statements run (or to run with dry_run)
+    Not atomic: MySQL commits each DDL statement implicitly, statements run before a failure stay applied,
+    run it again to apply the rest. Raises ValueError if the unique (proxy_url, proxy_port) key is missing
+    and duplicates exist, see prune_proxies and delete_proxy to remove them.
+    When the decayed score columns are added to tbl_proxy_url, they are backfilled from error_count with
+    score_half_life, the one the handlers use. Raises ValueError if it isn't given then"""
+    statements: List[str] = verify_schema(proxy_handler)
+    if any(statement.startswith("ALTER TABLE `tbl_proxy_url`") and "ADD COLUMN `decayed_score`" in statement
+           for statement in statements):
+        if score_half_life is None:
+            raise ValueError("the decayed score columns are added to tbl_proxy_url, score_half_life is needed "
+                             "to backfill them from error_count")
+        statements.append(" ".join(build_score_backfill_query(score_half_life).split()))
+    if dry_run or len(statements) == 0:
+        return statements
+    if any("uq_proxy_url_port" in statement and statement.startswith("ALTER") for statement in statements):
+        duplicates = proxy_handler.fetch_all_as_tuples(DUPLICATE_PROXIES_SQL)
+        if duplicates:
+            raise ValueError(f"tbl_proxy_url has duplicate (proxy_url, proxy_port) rows, e.g. {duplicates}, "
+                             f"they must be removed before adding the unique key")
+    for statement in statements:
+        logger.info("Schema migration: %s", statement)
+        proxy_handler.execute_one_query(sql_query=statement)
+    return statements
+
+
+def get_explain_keys(explain_json: str) -> Set[str]:
+    """return the indexes the optimizer chose in a MySQL EXPLAIN FORMAT=JSON plan, indexes only listed
+    in possible_keys are left out"""
+    keys: Set[str] = set()
+
+    def collect(node):
+        if isinstance(node, dict):
+            for name, value in node.items():
+                if name == "key" and isinstance(value, str):
+                    keys.add(value)
+                else:
+                    collect(value)
+        elif isinstance(node, list):
+            for value in node:
+                collect(value)
+
+    collect(json.loads(explain_json))
+    return keys
+
+
+def has_explain_filesort(explain_json: str) -> bool:
+    """return True if a MySQL EXPLAIN FORMAT=JSON plan sorts rows (using_filesort)"""
+
+    def find(node) -> bool:
+        if isinstance(node, dict):
+            return node.get("using_filesort") is True or any(find(value) for value in node.values())
+        if isinstance(node, list):
+            return any(find(value) for value in node)
+        return False
+
+    return find(json.loads(explain_json))
+
+
+def verify_query_plans(proxy_handler) -> List[str]:
+    """return a problem per hot query whose EXPLAIN plan doesn't use its index, empty if all do
+    ORDER BY ... LIMIT queries must also read the index in order, without a filesort.
+    Plans depend on the table statistics, check them on a table with production-like data"""
+    problems: List[str] = []
+    for query_name, sql_query, sql_variables, index_name in HOT_QUERIES:
+        rows = proxy_handler.fetch_all_as_tuples(f"EXPLAIN FORMAT=JSON {sql_query}", sql_variables)
+        keys: Set[str] = get_explain_keys(rows[0][0]) if rows else set()
+        if index_name not in keys:
+            problems.append(f"{query_name} doesn't use {index_name}, plan keys: {sorted(keys)}")
+        elif ORDER_LIMIT_PATTERN.search(sql_query) and has_explain_filesort(rows[0][0]):
+            problems.append(f"{query_name} sorts rows with a filesort instead of reading {index_name} in order")
+    return problems
+
+
+def main(argv: Optional[list] = None) -> int:
+    """console entry point, the database is read from the .env file, see .env.example:
+        proxy-schema verify|migrate [--dry-run] [--score-half-life SECONDS]|print"""
+    parser = argparse.ArgumentParser(description="Create, migrate or verify the proxy_helpers tables")
+    parser.add_argument("command", choices=("print", "verify", "migrate"))
+    parser.add_argument("--dry-run", action="store_true", help="migrate: print the statements without running them")
+    parser.add_argument("--score-half-life", type=float,
+                        help="migrate: score_half_life of the handlers, to backfill the decayed scores when added")
+    args = parser.parse_args(argv)
+
+    if args.command == "print":
+        print(";\n\n".join(get_schema_sql()) + ";")
+        return 0
+
+    from dotenv import load_dotenv
+
+    from proxy_helpers.mysql_proxies.mysql_proxies import MySQLProxy
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    load_dotenv()
+    proxy_handler = MySQLProxy()
+    try:
+        if args.command == "migrate":
+            statements = migrate_schema(proxy_handler, dry_run=args.dry_run, score_half_life=args.score_half_life)
+            print("\n".join(f"{statement};" for statement in statements) or "Schema is up to date")
+            return 0
+        statements = verify_schema(proxy_handler)
+        problems = [f"pending: {statement}" for statement in statements]
+        if len(statements) == 0:
+            problems.extend(verify_query_plans(proxy_handler))
+        print("\n".join(problems) or "Schema and query plans are up to date")
+        return 1 if problems else 0
+    finally:
+        proxy_handler.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
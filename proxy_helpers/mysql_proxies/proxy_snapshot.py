@@ -0,0 +1,109 @@
+import logging
+import math
+import os
+import struct
+from datetime import datetime
+from pathlib import Path
+from time import time
+from typing import Iterable, List, Optional, Union
+
+from proxy_helpers.mysql_proxies.proxy_record import Proxy
+
+logger = logging.getLogger(f"proxy_helpers:{Path(__file__).name}")
+
+# Snapshot file: header, then per proxy a fixed part and length-prefixed utf-8 strings, little endian
+SNAPSHOT_MAGIC: bytes = b"PXS1"
+_HEADER = struct.Struct("<4sdI")  # magic, saved_at (epoch seconds), proxy count
+_FIXED = struct.Struct("<qIiidd")  # proxy_id, proxy_port, error_count, error_selenium_count, proxy_speed, latency_ewma
+_STRING_LENGTH = struct.Struct("<H")
+_STRING_COLUMNS = ("upload_datetime", "proxy_url", "proxy_country", "proxy_town", "proxy_web_name")
+# written for None strings, no column holds a 65535 bytes value
+_NONE_LENGTH: int = 0xFFFF
+
+
+def _to_float(value) -> float:
+    return math.nan if value is None else float(value)
+
+
+def _from_float(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+def _pack_string(value) -> bytes:
+    if value is None:
+        return _STRING_LENGTH.pack(_NONE_LENGTH)
+    if isinstance(value, datetime):
+        value = value.isoformat(sep=" ")
+    encoded: bytes = str(value).encode()[:_NONE_LENGTH - 1]
+    return _STRING_LENGTH.pack(len(encoded)) + encoded
+
+
+def write_proxy_snapshot(snapshot_path: Union[str, Path], proxies: Iterable) -> int:
+    """write Proxy records to snapshot_path, replaced atomically, return the number of proxies written"""
+    chunks: List[bytes] = []
+    proxy_count: int = 0
+    for proxy in proxies:
+        chunks.append(_FIXED.pack(proxy.proxy_id or 0, int(proxy.proxy_port or 0),
+                                  proxy.error_count or 0, proxy.error_selenium_count or 0,
+                                  _to_float(proxy.proxy_speed), _to_float(proxy.latency_ewma)))
+        chunks.extend(_pack_string(getattr(proxy, column)) for column in _STRING_COLUMNS)
+        proxy_count += 1
+    snapshot_path = Path(snapshot_path)
+    # written next to the snapshot then renamed, readers never see a partial file
+    temporary_path = snapshot_path.with_name(f"{snapshot_path.name}.{os.getpid()}.tmp")
+    with open(temporary_path, "wb") as snapshot_file:
+        snapshot_file.write(_HEADER.pack(SNAPSHOT_MAGIC, time(), proxy_count))
+        snapshot_file.write(b"".join(chunks))
+    os.replace(temporary_path, snapshot_path)
+    return proxy_count
+
+
+def _read_string(snapshot: memoryview, offset: int):
+    length: int = _STRING_LENGTH.unpack_from(snapshot, offset)[0]
+    offset += _STRING_LENGTH.size
+    if length == _NONE_LENGTH:
+        return None, offset
+    return bytes(snapshot[offset:offset + length]).decode(), offset + length
+
+
+def read_proxy_snapshot(snapshot_path: Union[str, Path], max_age: Optional[float] = None) -> Optional[List[Proxy]]:
+    """return the Proxy records of the snapshot, None if it is missing, unreadable or older than max_age seconds"""
+    try:
+        snapshot = memoryview(Path(snapshot_path).read_bytes())
+        magic, saved_at, proxy_count = _HEADER.unpack_from(snapshot, 0)
+        if magic != SNAPSHOT_MAGIC:
+            logger.warning("Not a proxy snapshot: %s", snapshot_path)
+            return None
+        if max_age is not None and time() - saved_at > max_age:
+            return None
+        proxies: List[Proxy] = []
+        offset: int = _HEADER.size
+        for _ in range(proxy_count):
+            proxy_id, proxy_port, error_count, error_selenium_count, proxy_speed, latency_ewma = (
+                _FIXED.unpack_from(snapshot, offset)
+            )
+            offset += _FIXED.size
+            strings: list = []
+            for _column in _STRING_COLUMNS:
+                value, offset = _read_string(snapshot, offset)
+                strings.append(value)
+            upload_datetime, proxy_url, proxy_country, proxy_town, proxy_web_name = strings
+            proxies.append(Proxy(
+                proxy_id=proxy_id or None,
+                upload_datetime=datetime.fromisoformat(upload_datetime) if upload_datetime else None,
+                proxy_url=proxy_url,
+                proxy_port=proxy_port,
+                proxy_country=proxy_country,
+                proxy_town=proxy_town,
+                proxy_speed=_from_float(proxy_speed),
+                proxy_web_name=proxy_web_name,
+                error_count=error_count,
+                error_selenium_count=error_selenium_count,
+                latency_ewma=_from_float(latency_ewma),
+            ))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, struct.error) as ex:
+        logger.warning("Proxy snapshot %s could not be read: %s", snapshot_path, ex)
+        return None
+    return proxies or None
@@ -0,0 +1,135 @@
+import random
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from time import monotonic
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Incremental refresh needs the updated_at column and the tbl_proxy_url_deleted tombstones
+# filled by the trg_proxy_url_deleted trigger, see proxy_schema.
+# Tombstones older than full_resync_interval are no longer read and can be deleted.
+WATERMARK_SQL: str = "SELECT NOW(6)"
+
+DELETED_PROXY_IDS_SQL: str = """
+                    SELECT proxy_id
+                    FROM tbl_proxy_url_deleted
+                    WHERE deleted_at >= %s
+                """
+
+
+def build_universe_sql(columns: Sequence[str], order_column: str = "error_count") -> str:
+    """return the full load query, the lowest order_column (error_count or score_rank) rows, LIMIT as variable"""
+    return f"""
+                    SELECT {", ".join(f"a.{column}" for column in columns)}
+                    FROM tbl_proxy_url a
+                    ORDER BY a.{order_column} ASC
+                    LIMIT %s
+                """
+
+
+def build_changed_rows_sql(columns: Sequence[str]) -> str:
+    """return the incremental query, rows inserted or updated since the watermark variable"""
+    return f"""
+                    SELECT {", ".join(f"a.{column}" for column in columns)}
+                    FROM tbl_proxy_url a
+                    WHERE a.updated_at >= %s
+                """
+
+
+class IncrementalUniverse:
+    """Local copy of the best (lowest error_count) proxies, kept ordered by (error_count, proxy_id)
+    Up to universe_size * margin Proxy records are kept so rows leaving the top can be replaced
+    without a full load. A full resync is due every full_resync_interval seconds,
+    or when deletions leave fewer than universe_size rows while the table had more"""
+
+    def __init__(
+            self,
+            universe_size: int,
+            margin: float = 2.0,
+            full_resync_interval: float = 300.0,
+            watermark_overlap: float = 2.0,
+            clock: Callable[[], float] = monotonic,
+    ):
+        self.universe_size: int = universe_size
+        self.capacity: int = max(universe_size, int(universe_size * margin))
+        self.full_resync_interval: float = full_resync_interval
+        # rows committed by transactions still running at the watermark are read again next time
+        self.watermark_overlap: float = watermark_overlap
+        self.clock = clock
+
+        self.proxies: Dict[int, object] = {}
+        self.order: List[Tuple[int, int]] = []
+        self.watermark: Optional[datetime] = None
+        self.last_full_resync: Optional[float] = None
+        self.table_exhausted: bool = False
+
+    def needs_full_resync(self) -> bool:
+        if self.watermark is None or self.last_full_resync is None:
+            return True
+        if self.clock() - self.last_full_resync >= self.full_resync_interval:
+            return True
+        return not self.table_exhausted and len(self.order) < self.universe_size
+
+    def get_since(self) -> datetime:
+        """return the watermark variable of the incremental queries"""
+        return self.watermark - timedelta(seconds=self.watermark_overlap)
+
+    def load_full(self, proxies: Iterable, watermark) -> int:
+        """replace the local copy, proxies were read at most capacity rows, after watermark was taken"""
+        self.proxies = {}
+        self.order = []
+        for proxy in proxies:
+            self.proxies[proxy.proxy_id] = proxy
+            self.order.append((proxy.error_count, proxy.proxy_id))
+        self.order.sort()
+        self.table_exhausted = len(self.order) < self.capacity
+        self.watermark = _to_datetime(watermark)
+        self.last_full_resync = self.clock()
+        return len(self.order)
+
+    def apply_changes(self, changed_proxies: Iterable, deleted_proxy_ids: Iterable[int], watermark) -> int:
+        """merge rows changed and deleted since the previous watermark, return the number of rows applied"""
+        applied: int = 0
+        for proxy_id in deleted_proxy_ids:
+            applied += self._remove(proxy_id)
+        for proxy in changed_proxies:
+            applied += self._upsert(proxy)
+        if len(self.order) > self.capacity:
+            for _, proxy_id in self.order[self.capacity:]:
+                del self.proxies[proxy_id]
+            del self.order[self.capacity:]
+            self.table_exhausted = False
+        self.watermark = _to_datetime(watermark)
+        return applied
+
+    def _remove(self, proxy_id: int) -> int:
+        proxy = self.proxies.pop(proxy_id, None)
+        if proxy is None:
+            return 0
+        del self.order[bisect_left(self.order, (proxy.error_count, proxy_id))]
+        return 1
+
+    def _upsert(self, proxy) -> int:
+        order_key = (proxy.error_count, proxy.proxy_id)
+        if proxy.proxy_id not in self.proxies and len(self.order) >= self.capacity and order_key > self.order[-1]:
+            # worse than every row kept, the next full resync reads it if it gets better
+            return 0
+        self._remove(proxy.proxy_id)
+        self.proxies[proxy.proxy_id] = proxy
+        insort(self.order, order_key)
+        return 1
+
+    def top(self, shuffle_results: bool = True) -> Optional[list]:
+        """return the universe_size best proxies, None if there are none"""
+        proxies: list = [self.proxies[proxy_id] for _, proxy_id in self.order[:self.universe_size]]
+        if len(proxies) == 0:
+            return None
+        if shuffle_results:
+            random.shuffle(proxies)
+        return proxies
+
+
+def _to_datetime(watermark) -> datetime:
+    # the MySQL driver returns datetime, sqlite (memory_backend) returns text
+    if isinstance(watermark, str):
+        return datetime.fromisoformat(watermark)
+    return watermark
@@ -0,0 +1,92 @@
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+PROXY_INSERT_COLUMNS: Tuple[str, ...] = (
+    "upload_datetime", "proxy_url", "proxy_port", "proxy_country", "proxy_town", "proxy_speed", "proxy_web_name",
+)
+# columns refreshed when (proxy_url, proxy_port) already exists, error counts are kept.
+# Except upload_datetime, they keep their value when the imported row has none
+PROXY_UPDATE_COLUMNS: Tuple[str, ...] = (
+    "upload_datetime", "proxy_country", "proxy_town", "proxy_speed", "proxy_web_name",
+)
+
+
+def chunk_proxy_rows(
+        proxy_dicts: Iterable[Dict],
+        chunk_size: int = 1000,
+        upload_datetime: Optional[datetime] = None,
+) -> Iterator[List[tuple]]:
+    """yield lists of at most chunk_size insert tuples, proxy_port is cast to int
+    upload_datetime is used for proxy dicts which don't have one"""
+    if upload_datetime is None:
+        upload_datetime = datetime.utcnow()
+    proxy_rows: List[tuple] = []
+    for proxy_dict in proxy_dicts:
+        proxy_rows.append((
+            proxy_dict.get("upload_datetime") or upload_datetime,
+            proxy_dict["proxy_url"],
+            int(proxy_dict["proxy_port"]),
+            proxy_dict.get("proxy_country"),
+            proxy_dict.get("proxy_town"),
+            proxy_dict.get("proxy_speed"),
+            proxy_dict.get("proxy_web_name"),
+        ))
+        if len(proxy_rows) >= chunk_size:
+            yield proxy_rows
+            proxy_rows = []
+    if len(proxy_rows) > 0:
+        yield proxy_rows
+
+
+def build_proxy_upsert_query(proxy_rows: List[tuple]) -> Tuple[str, tuple]:
+    """return one multi-row INSERT ... ON DUPLICATE KEY UPDATE for rows from chunk_proxy_rows
+    Relies on the unique (proxy_url, proxy_port) key of tbl_proxy_url, the row alias needs MySQL 8.0.19+"""
+    row_placeholder = "(" + ", ".join(["%s"] * len(PROXY_INSERT_COLUMNS)) + ")"
+    sql_string = f"""
+                INSERT INTO `tbl_proxy_url`
+                ({", ".join(f"`{column}`" for column in PROXY_INSERT_COLUMNS)})
+                VALUES
+                {", ".join([row_placeholder] * len(proxy_rows))}
+                AS new
+                ON DUPLICATE KEY UPDATE
+                {", ".join(_build_update_assignment(column) for column in PROXY_UPDATE_COLUMNS)}
+    """
+    sql_variables = tuple(value for proxy_row in proxy_rows for value in proxy_row)
+    return sql_string, sql_variables
+
+
+def _build_update_assignment(column: str) -> str:
+    if column == "upload_datetime":
+        return f"`{column}`=new.`{column}`"
+    return f"`{column}`=COALESCE(new.`{column}`, `{column}`)"
+
+
+def build_existing_proxy_count_query(proxy_rows: List[tuple]) -> Tuple[str, tuple]:
+    """return the SELECT COUNT(*) of the (proxy_url, proxy_port) of rows from chunk_proxy_rows
+    already in tbl_proxy_url"""
+    proxy_keys: List[tuple] = sorted({(proxy_row[1], proxy_row[2]) for proxy_row in proxy_rows})
+    sql_string = f"""
+                SELECT COUNT(*)
+                FROM tbl_proxy_url
+                WHERE (proxy_url, proxy_port) IN ({", ".join(["(%s, %s)"] * len(proxy_keys))})
+    """
+    sql_variables = tuple(value for proxy_key in proxy_keys for value in proxy_key)
+    return sql_string, sql_variables
+
+
+def add_upsert_counts(upsert_counts: Dict[str, int], proxy_rows: List[tuple], existing_count: int,
+                      affected_rows: Optional[int]):
+    """add the result of one upsert statement to upsert_counts, existing_count is the result of
+    build_existing_proxy_count_query run just before it. Affected rows can't tell updated rows from
+    unchanged ones (nor, with CLIENT_FOUND_ROWS, from inserted ones), so rows matching an existing proxy
+    count as updated. Exact unless another writer inserts the same proxies in between"""
+    if affected_rows is None:
+        upsert_counts["failed"] += len(proxy_rows)
+        return
+    inserted: int = len({(proxy_row[1], proxy_row[2]) for proxy_row in proxy_rows}) - existing_count
+    upsert_counts["inserted"] += inserted
+    upsert_counts["updated"] += len(proxy_rows) - inserted
+
+
+def new_upsert_counts() -> Dict[str, int]:
+    return {"inserted": 0, "updated": 0, "failed": 0}
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+from heapq import heapify, heapreplace
+from itertools import count
+from math import inf
+from pathlib import Path
+from threading import Lock
+from time import monotonic, sleep
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from proxy_helpers.mysql_proxies.proxy_dispenser import AsyncBatchLoader, BatchLoader
+from proxy_helpers.mysql_proxies.score_buffer import ProxyKey, get_proxy_key
+
+logger = logging.getLogger(f"proxy_helpers:{Path(__file__).name}")
+
+
+class ProxyRateLimiter:
+    """Per-proxy token buckets, scheduled by a min-heap of next-available times
+    Each proxy is served at most rate times per second on average, up to burst times in a row.
+    acquire pops the earliest available proxy and pushes it back at its next-available time, O(log n)"""
+
+    def __init__(
+            self,
+            rate: float,
+            burst: float = 1.0,
+            clock: Callable[[], float] = monotonic,
+    ):
+        self.rate: float = rate
+        self.burst: float = max(1.0, burst)
+        self.clock = clock
+
+        # proxy key: [tokens, time they were counted]
+        self.buckets: Dict[ProxyKey, List[float]] = {}
+        self.proxies: Dict[ProxyKey, object] = {}
+        # (next-available time, sequence, proxy key), the sequence serves ties in load then serve order
+        self.schedule: List[Tuple[float, int, ProxyKey]] = []
+        self.sequence = count()
+        self.schedule_lock: Lock = Lock()
+
+    def load(self, proxies: Iterable) -> int:
+        """schedule proxies instead of the current ones, return their number
+        Proxies already scheduled keep their bucket, so a refresh doesn't reset their limit"""
+        now: float = self.clock()
+        proxies_by_key: Dict[ProxyKey, object] = {}
+        for proxy in proxies:
+            proxy_key = get_proxy_key(proxy_id=proxy.get("proxy_id"),
+                                      proxy_url=proxy.get("proxy_url"),
+                                      proxy_port=proxy.get("proxy_port"))
+            if proxy_key is not None:
+                proxies_by_key[proxy_key] = proxy
+        with self.schedule_lock:
+            self.buckets = {proxy_key: self.buckets.get(proxy_key) or [self.burst, now]
+                            for proxy_key in proxies_by_key}
+            self.proxies = proxies_by_key
+            self.schedule = [
+                (self._get_next_available(self._refill(proxy_key, now), now), next(self.sequence), proxy_key)
+                for proxy_key in proxies_by_key
+            ]
+            heapify(self.schedule)
+        return len(proxies_by_key)
+
+    def _refill(self, proxy_key: ProxyKey, now: float) -> float:
+        bucket = self.buckets[proxy_key]
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        return bucket[0]
+
+    def _get_next_available(self, tokens: float, now: float) -> float:
+        return now if tokens >= 1 else now + (1 - tokens) / self.rate
+
+    def acquire(self) -> Tuple[Optional[object], float]:
+        """return the earliest available proxy and 0.0,
+        or None and the seconds until a proxy is available, inf if none is scheduled"""
+        with self.schedule_lock:
+            now: float = self.clock()
+            while len(self.schedule) > 0:
+                next_available, _, proxy_key = self.schedule[0]
+                if next_available > now:
+                    return None, next_available - now
+                tokens: float = self._refill(proxy_key, now)
+                if tokens < 1:
+                    # served out of turn by acquire_proxy since it was scheduled
+                    heapreplace(self.schedule, (self._get_next_available(tokens, now), next(self.sequence), proxy_key))
+                    continue
+                tokens -= 1
+                self.buckets[proxy_key][0] = tokens
+                heapreplace(self.schedule, (self._get_next_available(tokens, now), next(self.sequence), proxy_key))
+                return self.proxies[proxy_key], 0.0
+            return None, inf
+
+    def acquire_proxy(self, proxy) -> bool:
+        """take a token of proxy, picked out of turn (e.g. by filters), False if it is at its rate limit
+        Proxies which are not scheduled have no limit"""
+        proxy_key = get_proxy_key(proxy_id=proxy.get("proxy_id"),
+                                  proxy_url=proxy.get("proxy_url"),
+                                  proxy_port=proxy.get("proxy_port"))
+        with self.schedule_lock:
+            if proxy_key not in self.buckets:
+                return True
+            tokens: float = self._refill(proxy_key, self.clock()) - 1
+            if tokens < 0:
+                return False
+            self.buckets[proxy_key][0] = tokens
+            return True
+
+
+class RateLimitedDispenser:
+    """ProxyDispenser interface over a ProxyRateLimiter
+    Batches are loaded in the background by a BatchLoader, proxies already scheduled keep their limit"""
+
+    def __init__(
+            self,
+            load_batch: Callable[[], Optional[list]],
+            rate: float,
+            burst: float = 1.0,
+            clock: Callable[[], float] = monotonic,
+            low_watermark: Optional[float] = 0.2,
+            on_install: Optional[Callable[[list], None]] = None,
+    ):
+        self.rate_limiter: ProxyRateLimiter = ProxyRateLimiter(rate=rate, burst=burst, clock=clock)
+        self.batch_loader: BatchLoader = BatchLoader(load_batch=load_batch,
+                                                     install_batch=self.rate_limiter.load,
+                                                     low_watermark=low_watermark,
+                                                     clock=clock,
+                                                     on_install=on_install)
+
+    def next_proxy(self, wait: bool = False):
+        """return the earliest available proxy, None if no proxy could be loaded
+        or, unless wait, if every proxy is at its rate limit"""
+        while True:
+            self.batch_loader.before_serve()
+            proxy, wait_time = self.rate_limiter.acquire()
+            if proxy is not None:
+                self.batch_loader.count_served()
+                return proxy
+            if not wait or wait_time == inf:
+                return None
+            sleep(wait_time)
+
+    def load_first_batch(self):
+        """load a batch if none is scheduled, without serving a proxy"""
+        self.batch_loader.before_serve()
+
+    def preload(self, batch: list):
+        """schedule batch (e.g. read from a snapshot) right away, a fresh batch is loaded in the background
+        on the next call and replaces it once loaded"""
+        self.batch_loader.preload(batch)
+
+    def clear(self):
+        """the next call to next_proxy loads a fresh batch, rate limits are kept"""
+        self.batch_loader.clear()
+
+
+class AsyncRateLimitedDispenser:
+    """asyncio version of RateLimitedDispenser"""
+
+    def __init__(
+            self,
+            load_batch: Callable[[], Awaitable[Optional[list]]],
+            rate: float,
+            burst: float = 1.0,
+            clock: Callable[[], float] = monotonic,
+            low_watermark: Optional[float] = 0.2,
+            on_install: Optional[Callable[[list], None]] = None,
+    ):
+        self.rate_limiter: ProxyRateLimiter = ProxyRateLimiter(rate=rate, burst=burst, clock=clock)
+        self.batch_loader: AsyncBatchLoader = AsyncBatchLoader(load_batch=load_batch,
+                                                               install_batch=self.rate_limiter.load,
+                                                               low_watermark=low_watermark,
+                                                               clock=clock,
+                                                               on_install=on_install)
+
+    async def next_proxy(self, wait: bool = False):
+        """return the earliest available proxy, None if no proxy could be loaded
+        or, unless wait, if every proxy is at its rate limit"""
+        while True:
+            await self.batch_loader.before_serve()
+            proxy, wait_time = self.rate_limiter.acquire()
+            if proxy is not None:
+                self.batch_loader.count_served()
+                return proxy
+            if not wait or wait_time == inf:
+                return None
+            await asyncio.sleep(wait_time)
+
+    async def load_first_batch(self):
+        """load a batch if none is scheduled, without serving a proxy"""
+        await self.batch_loader.before_serve()
+
+    def preload(self, batch: list):
+        """schedule batch (e.g. read from a snapshot) right away, a fresh batch is loaded in a task
+        on the next call and replaces it once loaded"""
+        self.batch_loader.preload(batch)
+
+    def clear(self):
+        """the next call to next_proxy loads a fresh batch, rate limits are kept"""
+        self.batch_loader.clear()
@@ -0,0 +1,320 @@
+import asyncio
+import atexit
+import logging
+from pathlib import Path
+from threading import RLock, Thread, Event
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Union
+
+from proxy_helpers.mysql_proxies.score_decay import build_decay_assignments
+
+logger = logging.getLogger(f"proxy_helpers:{Path(__file__).name}")
+
+ProxyKey = Union[int, Tuple[str, int]]
+
+ERROR_COUNT_MIN: int = -5000
+ERROR_COUNT_MAX: int = 5000
+
+
+def get_proxy_key(
+        proxy_id: Optional[Union[str, int]] = None,
+        proxy_url: Optional[str] = None,
+        proxy_port: Optional[Union[int, str]] = None,
+) -> Optional[ProxyKey]:
+    """return proxy_id as int, or (proxy_url, proxy_port) when no id is given"""
+    if proxy_id:
+        return int(proxy_id)
+    elif proxy_url and proxy_port:
+        return proxy_url, int(proxy_port)
+    return None
+
+
+def build_score_update_query(deltas: Dict[ProxyKey, int],
+                             score_half_life: Optional[float] = None) -> Optional[Tuple[str, tuple]]:
+    """return one multi-row UPDATE applying net error_count deltas, clamped at +/-5000
+    Keys are either proxy_id or (proxy_url, proxy_port), see get_proxy_key.
+    With score_half_life, the deltas are also added to the decayed score, see score_decay"""
+    case_strings: list = []
+    delta_strings: list = []
+    case_variables: list = []
+    proxy_ids: list = []
+    url_where_strings: list = []
+    url_where_variables: list = []
+    for proxy_key, delta in deltas.items():
+        if delta == 0:
+            continue
+        if isinstance(proxy_key, tuple):
+            condition = "(proxy_url= %s AND proxy_port=%s)"
+            case_variables.extend(proxy_key)
+            url_where_strings.append(condition)
+            url_where_variables.extend(proxy_key)
+        else:
+            condition = "proxy_id= %s"
+            case_variables.append(proxy_key)
+            proxy_ids.append(proxy_key)
+        case_strings.append(
+            f"WHEN {condition} THEN LEAST(GREATEST((error_count + %s), {ERROR_COUNT_MIN}), {ERROR_COUNT_MAX})"
+        )
+        delta_strings.append(f"WHEN {condition} THEN %s")
+        case_variables.append(delta)
+
+    if len(case_strings) == 0:
+        return None
+
+    # proxy_id IN (...) lets MySQL use the primary key instead of one OR branch per proxy
+    where_strings: list = url_where_strings
+    if len(proxy_ids) > 0:
+        where_strings = [f"proxy_id IN ({', '.join(['%s'] * len(proxy_ids))})"] + url_where_strings
+
+    decay_string, decay_variables = "", ()
+    if score_half_life is not None:
+        # the deltas again, with the same variables as the error_count CASE
+        decay_string, decay_variables = build_decay_assignments(
+            score_half_life, delta_sql=f"CASE {' '.join(delta_strings)} ELSE 0 END", delta_variables=tuple(case_variables)
+        )
+        decay_string = ",\n                    " + decay_string
+
+    sql_string = f"""
+                UPDATE tbl_proxy_url
+                SET error_count= CASE
+                    {" ".join(case_strings)}
+                    ELSE error_count END{decay_string}
+                WHERE {" OR ".join(where_strings)}
+            """
+    return sql_string, tuple(case_variables) + decay_variables + tuple(proxy_ids + url_where_variables)
+
+
+class ScoreBuffer:
+    """Write-behind buffer for proxy scores, net deltas are merged per proxy
+    and handed to flush_callback on a size (distinct proxies) or time trigger"""
+
+    def __init__(
+            self,
+            flush_callback: Callable[[Dict[ProxyKey, int]], object],
+            flush_size: int = 500,
+            flush_interval: Optional[float] = 1.0,
+    ):
+        self.flush_callback = flush_callback
+        self.flush_size: int = flush_size
+        self.flush_interval: Optional[float] = flush_interval
+
+        self.deltas: Dict[ProxyKey, int] = {}
+        self.buffer_rlock: RLock = RLock()
+        self.flush_rlock: RLock = RLock()
+
+        self._stop_event: Event = Event()
+        self._flush_event: Event = Event()
+        self._flush_thread: Optional[Thread] = None
+        atexit.register(self.close)
+
+    def add(self, proxy_key: ProxyKey, success: bool):
+        """merge one success (-1) or failure (+1) into the buffer
+        The size trigger wakes the flush thread, callers only flush themselves without one
+        or if the buffer outgrows the flush thread"""
+        with self.buffer_rlock:
+            self.deltas[proxy_key] = self.deltas.get(proxy_key, 0) + (-1 if success else 1)
+            pending: int = len(self.deltas)
+        self._start_flush_thread()
+        if pending >= self.flush_size:
+            if self._flush_thread is None or pending >= 4 * self.flush_size:
+                self.flush()
+            else:
+                self._flush_event.set()
+
+    def drain(self) -> Dict[ProxyKey, int]:
+        """return buffered deltas and reset the buffer"""
+        with self.buffer_rlock:
+            deltas, self.deltas = self.deltas, {}
+        return deltas
+
+    def _requeue(self, deltas: Dict[ProxyKey, int]):
+        with self.buffer_rlock:
+            for proxy_key, delta in deltas.items():
+                self.deltas[proxy_key] = self.deltas.get(proxy_key, 0) + delta
+
+    def flush(self) -> int:
+        """write buffered deltas, return the number of proxies flushed
+        On error the deltas are put back in the buffer to be retried"""
+        with self.flush_rlock:
+            deltas = self.drain()
+            if len(deltas) == 0:
+                return 0
+            try:
+                self.flush_callback(deltas)
+            except Exception as ex:
+                logger.warning("Proxy score flush failed, %s proxies requeued: %s", len(deltas), ex)
+                self._requeue(deltas)
+                return 0
+            return len(deltas)
+
+    def _start_flush_thread(self):
+        if self.flush_interval is None or self._flush_thread is not None:
+            return
+        with self.buffer_rlock:
+            if self._flush_thread is None and not self._stop_event.is_set():
+                self._flush_thread = Thread(target=self._flush_periodically,
+                                            name="proxy_score_flush",
+                                            daemon=True)
+                self._flush_thread.start()
+
+    def _flush_periodically(self):
+        while not self._stop_event.is_set():
+            self._flush_event.wait(self.flush_interval)
+            self._flush_event.clear()
+            self.flush()
+
+    def close(self):
+        """stop the flush thread and write anything left in the buffer"""
+        self._stop_event.set()
+        self._flush_event.set()
+        if self._flush_thread is not None:
+            self._flush_thread.join()
+        self.flush()
+        atexit.unregister(self.close)
+
+
+class AsyncScoreBuffer:
+    """asyncio version of ScoreBuffer, flush_callback is a coroutine function
+    aclose() must be awaited at shutdown to write anything left"""
+
+    def __init__(
+            self,
+            flush_callback: Callable[[Dict[ProxyKey, int]], Awaitable[object]],
+            flush_size: int = 500,
+            flush_interval: Optional[float] = 1.0,
+    ):
+        self.flush_callback = flush_callback
+        self.flush_size: int = flush_size
+        self.flush_interval: Optional[float] = flush_interval
+
+        self.deltas: Dict[ProxyKey, int] = {}
+        self.flush_lock = asyncio.Lock()
+        self._flush_event: Optional[asyncio.Event] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._closing: bool = False
+
+    async def add(self, proxy_key: ProxyKey, success: bool):
+        """merge one success (-1) or failure (+1) into the buffer
+        The size trigger wakes the flush task, callers only flush themselves without one
+        or if the buffer outgrows the flush task"""
+        self.deltas[proxy_key] = self.deltas.get(proxy_key, 0) + (-1 if success else 1)
+        if self.flush_interval is not None and self._flush_task is None and not self._closing:
+            self._flush_event = asyncio.Event()
+            self._flush_task = asyncio.create_task(self._flush_periodically())
+        pending: int = len(self.deltas)
+        if pending >= self.flush_size:
+            if self._flush_task is None or pending >= 4 * self.flush_size:
+                await self.flush()
+            else:
+                self._flush_event.set()
+
+    def drain(self) -> Dict[ProxyKey, int]:
+        """return buffered deltas and reset the buffer"""
+        deltas, self.deltas = self.deltas, {}
+        return deltas
+
+    async def flush(self) -> int:
+        """write buffered deltas, return the number of proxies flushed
+        On error the deltas are put back in the buffer to be retried"""
+        async with self.flush_lock:
+            deltas = self.drain()
+            if len(deltas) == 0:
+                return 0
+            try:
+                await self.flush_callback(deltas)
+            except asyncio.CancelledError:
+                self._requeue(deltas)
+                raise
+            except Exception as ex:
+                logger.warning("Proxy score flush failed, %s proxies requeued: %s", len(deltas), ex)
+                self._requeue(deltas)
+                return 0
+            return len(deltas)
+
+    def _requeue(self, deltas: Dict[ProxyKey, int]):
+        for proxy_key, delta in deltas.items():
+            self.deltas[proxy_key] = self.deltas.get(proxy_key, 0) + delta
+
+    async def _flush_periodically(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            await self.flush()
+
+    async def aclose(self):
+        """stop the flush task and write anything left in the buffer"""
+        # no task.cancel(): a cancelled flush would have to be retried anyway
+        self._closing = True
+        if self._flush_task is not None:
+            self._flush_event.set()
+            await self._flush_task
+            self._flush_task = None
+        await self.flush()
+
+
+_CLOSE_REPORTER = object()
+
+
+class AsyncScoreReporter(AsyncScoreBuffer):
+    """Fire-and-forget proxy scores for asyncio code: report() only puts the result on an asyncio.Queue,
+    a background task merges queued results and hands them to flush_callback on a size or time trigger.
+    aclose() must be awaited at shutdown, it drains the queue and writes what is left"""
+
+    def __init__(
+            self,
+            flush_callback: Callable[[Dict[ProxyKey, int]], Awaitable[object]],
+            flush_size: int = 500,
+            flush_interval: Optional[float] = 1.0,
+    ):
+        super().__init__(flush_callback=flush_callback, flush_size=flush_size, flush_interval=flush_interval)
+        self.report_queue: Optional[asyncio.Queue] = None
+        self._report_task: Optional[asyncio.Task] = None
+
+    def report(self, proxy_key: Optional[ProxyKey], success: bool):
+        """queue one success or failure, never waits, must be called from the event loop"""
+        if proxy_key is None:
+            return
+        if self._report_task is None:
+            if self._closing:
+                raise RuntimeError("AsyncScoreReporter is closed")
+            self.report_queue = asyncio.Queue()
+            self._report_task = asyncio.create_task(self._merge_reports())
+        self.report_queue.put_nowait((proxy_key, success))
+
+    async def _merge_reports(self):
+        loop = asyncio.get_running_loop()
+        flush_interval: float = float("inf") if self.flush_interval is None else self.flush_interval
+        flush_time: float = loop.time() + flush_interval
+        closing: bool = False
+        while not closing:
+            try:
+                report = await asyncio.wait_for(self.report_queue.get(), timeout=max(0.0, flush_time - loop.time()))
+            except asyncio.TimeoutError:
+                report = None
+            # merge whatever is queued without yielding, up to flush_size proxies
+            while report is not None:
+                if report is _CLOSE_REPORTER:
+                    closing = True
+                    break
+                proxy_key, success = report
+                self.deltas[proxy_key] = self.deltas.get(proxy_key, 0) + (-1 if success else 1)
+                if len(self.deltas) >= self.flush_size:
+                    break
+                try:
+                    report = self.report_queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    report = None
+            if closing or len(self.deltas) >= self.flush_size or loop.time() >= flush_time:
+                await self.flush()
+                flush_time = loop.time() + flush_interval
+
+    async def aclose(self):
+        """merge everything reported so far, write it and stop the background task"""
+        self._closing = True
+        if self._report_task is not None:
+            self.report_queue.put_nowait(_CLOSE_REPORTER)
+            await self._report_task
+            self._report_task = None
+        await super().aclose()
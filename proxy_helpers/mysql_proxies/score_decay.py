@@ -0,0 +1,56 @@
+import math
+from typing import Tuple
+
+# Time-decayed proxy scores, ranked instead of error_count when a handler is given score_half_life.
+# decayed_score halves every half_life seconds after score_updated_at. It is only brought up to date when
+# the row is scored, never by a full table UPDATE: decayed_score * 0.5 ** (elapsed / half_life) + delta.
+# All scores decay at the same rate, so their order only changes when one is scored. score_rank is a key
+# of that order written with the score, log2 |score| + (score_updated_at - DECAY_EPOCH) / half_life
+# banded by sign, so selection is ORDER BY score_rank on an index. score_rank grows linearly with time,
+# it doesn't overflow. Every handler writing to a table must use the same half_life.
+DECAY_EPOCH: int = 1704067200  # 2024-01-01 UTC
+# log2 of the smallest positive double is -1074, so positive scores always rank above 0
+RANK_OFFSET: int = 2048
+
+
+def get_decayed_score(decayed_score: float, elapsed: float, half_life: float) -> float:
+    """return decayed_score decayed by elapsed seconds"""
+    return decayed_score * 0.5 ** (elapsed / half_life)
+
+
+def get_score_rank(score: float, score_updated_at: float, half_life: float) -> float:
+    """return the score_rank of score written at score_updated_at (epoch seconds), lower is better"""
+    if score == 0:
+        return 0.0
+    rank: float = RANK_OFFSET + math.log2(abs(score)) + (score_updated_at - DECAY_EPOCH) / half_life
+    return rank if score > 0 else -rank
+
+
+def build_decay_assignments(half_life: float, delta_sql: str, delta_variables: tuple = ()) -> Tuple[str, tuple]:
+    """return the SET assignments adding delta_sql to the decayed score and their variables
+    Every assignment reads the row as it was before the UPDATE, so MySQL (left to right) and sqlite agree"""
+    half_life = float(half_life)
+    elapsed_sql: str = "(UNIX_TIMESTAMP(NOW(6)) - UNIX_TIMESTAMP(score_updated_at))"
+    score_sql: str = f"(decayed_score * POW(0.5, {elapsed_sql} / {half_life!r}) + {delta_sql})"
+    # score_sql appears 4 times in the rank, then once for decayed_score
+    return (f"score_rank= {_build_rank_sql(score_sql, half_life)}, decayed_score= {score_sql}, "
+            f"score_updated_at= NOW(6)", tuple(delta_variables) * 5)
+
+
+def _build_rank_sql(score_sql: str, half_life: float) -> str:
+    """return the score_rank of score_sql written now, see get_score_rank"""
+    age_sql: str = f"((UNIX_TIMESTAMP(NOW(6)) - {DECAY_EPOCH}) / {half_life!r})"
+    return (f"CASE WHEN {score_sql} > 0 THEN {RANK_OFFSET} + LOG2({score_sql}) + {age_sql} "
+            f"WHEN {score_sql} < 0 THEN -({RANK_OFFSET} + LOG2(-{score_sql}) + {age_sql}) ELSE 0 END")
+
+
+def build_score_backfill_query(half_life: float) -> str:
+    """return the UPDATE seeding the decayed scores from error_count, run once by migrate_schema
+    when it adds the decayed score columns, so the error history isn't lost"""
+    # rows at error_count 0 keep the column defaults, which are already their scores
+    return f"""
+                UPDATE tbl_proxy_url
+                SET score_rank= {_build_rank_sql("error_count", float(half_life))},
+                decayed_score= error_count, score_updated_at= NOW(6)
+                WHERE error_count <> 0
+            """
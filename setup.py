@@ -14,10 +14,16 @@ setup(
     ],
     install_requires=["python-dotenv",
                       "pandas",
+                      "numpy",
                       "mysql-connector-python",
                       "requests",
+                      "aiohttp",
                       "mysql_helpers>=0.0.0.1"
                       ],
+    entry_points={
+        "console_scripts": ["proxy-import=proxy_helpers.mysql_proxies.proxy_import:main",
+                            "proxy-schema=proxy_helpers.mysql_proxies.proxy_schema:main"],
+    },
     dependency_links=["git+https://github.com/nono-london/mysql_helpers.git"],
     setup_requires=["pytest-runner"],
     tests_require=["pytest"],
@@ -0,0 +1,24 @@
+import logging
+
+from proxy_helpers.app_config import logging_config, stop_logging
+
+
+def test_logging_config_writes_from_listener(tmp_path):
+    log_path = tmp_path / "proxy_helpers.log"
+    root_level = logging.getLogger().level
+    logging_config(level=logging.INFO, log_path=log_path)
+    try:
+        logger = logging.getLogger("proxy_helpers:test_app_config.py")
+        logger.debug("Proxy %s debug", 1)
+        logger.warning("Proxy %s opened after %s failures", 2, 3)
+    finally:
+        stop_logging()
+    log_lines = log_path.read_text().splitlines()
+    assert len(log_lines) == 1
+    assert log_lines[0].endswith("proxy_helpers:test_app_config.py - WARNING - Proxy 2 opened after 3 failures")
+
+    # stopped: nothing is left on the root logger, and its level is restored
+    stop_logging()
+    assert logging.getLogger().level == root_level
+    logging.getLogger("proxy_helpers:test_app_config.py").warning("after stop")
+    assert len(log_path.read_text().splitlines()) == 1
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from proxy_helpers.mysql_proxies.async_connection_pool import AsyncConnectionPool
+
+
+class FakeCursor:
+    def __init__(self, connection: "FakeConnection"):
+        self.connection = connection
+        self.description = [("proxy_id",)]
+        self.rowcount: int = -1
+
+    async def execute(self, sql_query: str, sql_variables=None):
+        self.connection.queries.append(sql_query)
+        await asyncio.sleep(0.05)
+        self.rowcount = 1
+
+    async def fetchall(self):
+        return [(1,)]
+
+    async def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.queries: list = []
+        self.ping_error: bool = False
+        self.closed: bool = False
+
+    async def cursor(self):
+        return FakeCursor(self)
+
+    async def ping(self, reconnect: bool = False):
+        if self.ping_error:
+            raise ConnectionError("lost connection")
+
+    async def start_transaction(self):
+        self.queries.append("START TRANSACTION")
+
+    async def commit(self):
+        self.queries.append("COMMIT")
+
+    async def rollback(self):
+        self.queries.append("ROLLBACK")
+
+    async def close(self):
+        self.closed = True
+
+
+def get_connection_pool(pool_size: int, health_check_interval=30.0):
+    connections: list = []
+
+    async def connect(**connection_settings):
+        connections.append(FakeConnection())
+        return connections[-1]
+
+    return AsyncConnectionPool({}, pool_size=pool_size, health_check_interval=health_check_interval,
+                               connect=connect), connections
+
+
+@pytest.mark.asyncio
+async def test_connection_pool_runs_queries_in_parallel():
+    connection_pool, connections = get_connection_pool(pool_size=4)
+    started = asyncio.get_running_loop().time()
+    results = await asyncio.gather(*(connection_pool.fetch_all("SELECT 1") for _ in range(8)))
+    elapsed = asyncio.get_running_loop().time() - started
+    assert results == [[(1,)]] * 8
+    # 8 queries of 50ms on 4 connections
+    assert 0.1 <= elapsed < 0.2
+    assert len(connections) == 4
+    pool_metrics = connection_pool.pool_metrics()
+    assert pool_metrics["acquired"] == 8 and pool_metrics["idle"] == 4 and pool_metrics["in_use"] == 0
+    assert pool_metrics["wait_time_max"] >= 0.04
+    assert await connection_pool.execute("UPDATE tbl_proxy_url SET error_count= 0") == 1
+    await connection_pool.close()
+    assert all(connection.closed for connection in connections)
+
+
+@pytest.mark.asyncio
+async def test_connection_pool_health_check():
+    connection_pool, connections = get_connection_pool(pool_size=1, health_check_interval=0)
+    await connection_pool.fetch_all("SELECT 1")
+    connections[0].ping_error = True
+    await connection_pool.fetch_all("SELECT 1")
+    assert len(connections) == 2 and connections[0].closed
+    assert connection_pool.pool_metrics()["health_check_failures"] == 1
+
+
+@pytest.mark.asyncio
+async def test_connection_pool_drops_cancelled_connections():
+    connection_pool, connections = get_connection_pool(pool_size=1)
+    fetch_task = asyncio.create_task(connection_pool.fetch_all("SELECT 1"))
+    await asyncio.sleep(0.01)
+    fetch_task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await fetch_task
+    assert connections[0].closed
+    assert await connection_pool.fetch_all("SELECT 1") == [(1,)]
+    assert connection_pool.pool_metrics()["connections"] == 1
+
+
+@pytest.mark.asyncio
+async def test_connection_pool_transaction():
+    connection_pool, connections = get_connection_pool(pool_size=2)
+
+    async def failing_callback(cursor):
+        await cursor.execute("UPDATE tbl_proxy_url SET lease_owner= NULL")
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        await connection_pool.run_in_transaction(failing_callback)
+    assert connections[0].queries[-1] == "ROLLBACK"
+    # an SQL error doesn't make the connection unusable
+    assert connection_pool.pool_metrics()["idle"] == 1
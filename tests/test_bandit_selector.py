@@ -0,0 +1,103 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+from proxy_helpers.mysql_proxies.bandit_selector import AsyncBanditDispenser, BanditDispenser, BanditSelector
+from proxy_helpers.mysql_proxies.proxy_record import Proxy
+
+
+def get_proxies(proxy_count: int, error_count: int = 0) -> list:
+    return [Proxy(proxy_id=proxy_id, proxy_url=f"10.0.0.{proxy_id}", proxy_port=8080, error_count=error_count)
+            for proxy_id in range(1, proxy_count + 1)]
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        BanditSelector(strategy="greedy")
+
+
+@pytest.mark.parametrize("strategy, draw_size", [("thompson", 16), ("ucb", 2)])
+def test_bandit_selector_learns_best_proxy(strategy, draw_size):
+    bandit_selector = BanditSelector(strategy=strategy, draw_size=draw_size, seed=1)
+    assert bandit_selector.draw() is None
+    assert bandit_selector.load(get_proxies(10)) == 10
+    for _ in range(50):
+        proxy = bandit_selector.draw()
+        # only proxy 3 works, by id or by url
+        if proxy.proxy_id == 3:
+            bandit_selector.record(("10.0.0.3", 8080), success=True)
+        else:
+            bandit_selector.record(proxy.proxy_id, success=False)
+    draws = Counter(bandit_selector.draw().proxy_id for _ in range(200))
+    assert draws.most_common(1)[0][0] == 3
+    assert draws[3] >= 100
+    assert bandit_selector.record(11, success=True) is False
+
+
+def test_ucb_explores_untried_proxies():
+    bandit_selector = BanditSelector(strategy="ucb", draw_size=5)
+    bandit_selector.load(get_proxies(5))
+    assert sorted(bandit_selector.draw().proxy_id for _ in range(5)) == [1, 2, 3, 4, 5]
+
+
+def test_bandit_selector_prior_latency_and_reload():
+    bandit_selector = BanditSelector(strategy="ucb", draw_size=1, prior_cap=10)
+    proxies = get_proxies(2)
+    proxies[0].error_count = 5000
+    bandit_selector.load(proxies)
+    assert (bandit_selector.failures.tolist(), bandit_selector.successes.tolist()) == ([10.0, 0.0], [0.0, 0.0])
+    assert bandit_selector.draw().proxy_id == 2
+
+    # same counts, the faster proxy is served
+    bandit_selector.load(get_proxies(2))
+    bandit_selector.failures[:] = 0
+    bandit_selector.record(1, latency=0.1)
+    bandit_selector.record(2, latency=2.0)
+    bandit_selector.record(2, latency=4.0)
+    assert bandit_selector.latencies.tolist() == [0.1, pytest.approx(2.6)]
+    assert bandit_selector.draw().proxy_id == 1
+
+    # counts and latencies are kept for proxies still loaded
+    bandit_selector.record(2, success=True)
+    bandit_selector.load(get_proxies(3)[1:])
+    assert bandit_selector.successes.tolist() == [1.0, 0.0]
+    assert bandit_selector.latencies[0] == pytest.approx(2.6)
+
+
+def test_bandit_dispenser_reloads():
+    load_count = []
+
+    def load_batch():
+        load_count.append(1)
+        return get_proxies(4)
+
+    bandit_dispenser = BanditDispenser(load_batch=load_batch, strategy="thompson", seed=1)
+    proxies = [bandit_dispenser.next_proxy() for _ in range(4)]
+    assert all(proxy is not None for proxy in proxies)
+    # the next batch is loaded in the background once the batch is nearly served
+    prefetch_thread = bandit_dispenser.batch_loader._prefetch_thread
+    if prefetch_thread is not None:
+        prefetch_thread.join()
+    assert len(load_count) == 2
+    assert bandit_dispenser.next_proxy() is not None
+    assert bandit_dispenser.batch_loader.served_count == 1
+    assert bandit_dispenser.record(1, success=True)
+    bandit_dispenser.clear()
+    bandit_dispenser.next_proxy()
+    assert len(load_count) == 3
+    assert bandit_dispenser.bandit_selector.successes[0] == 1
+
+    assert BanditDispenser(load_batch=lambda: None).next_proxy() is None
+
+
+def test_async_bandit_dispenser():
+    async def load_batch():
+        return get_proxies(3)
+
+    async def run():
+        bandit_dispenser = AsyncBanditDispenser(load_batch=load_batch, strategy="ucb")
+        proxies = [await bandit_dispenser.next_proxy() for _ in range(3)]
+        assert sorted(proxy.proxy_id for proxy in proxies) == [1, 2, 3]
+
+    asyncio.run(run())
@@ -0,0 +1,55 @@
+from proxy_helpers.mysql_proxies.circuit_breaker import CircuitBreaker
+from proxy_helpers.mysql_proxies.proxy_record import Proxy
+
+
+class FakeClock:
+    def __init__(self):
+        self.now: float = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_circuit_breaker_cooldown_and_probe():
+    clock = FakeClock()
+    circuit_breaker = CircuitBreaker(cooldown=10, clock=clock)
+    assert circuit_breaker.allow(1)
+    circuit_breaker.record(1, success=False)
+    assert not circuit_breaker.allow(1)
+    assert circuit_breaker.allow(2)
+
+    clock.now = 10
+    # one half-open probe, then open again until the probe result or the next cooldown
+    assert circuit_breaker.allow(1)
+    assert not circuit_breaker.allow(1)
+    circuit_breaker.record(1, success=False)
+    clock.now = 15
+    assert not circuit_breaker.allow(1)
+    clock.now = 20
+    assert circuit_breaker.allow(1)
+    circuit_breaker.record(1, success=True)
+    assert circuit_breaker.allow(1)
+    assert not circuit_breaker.is_open(1)
+
+
+def test_circuit_breaker_threshold():
+    circuit_breaker = CircuitBreaker(cooldown=10, failure_threshold=2, clock=FakeClock())
+    circuit_breaker.record(("10.0.0.1", 8080), success=False)
+    assert circuit_breaker.allow(("10.0.0.1", 8080))
+    circuit_breaker.record(("10.0.0.1", 8080), success=True)
+    circuit_breaker.record(("10.0.0.1", 8080), success=False)
+    assert circuit_breaker.allow(("10.0.0.1", 8080))
+    circuit_breaker.record(("10.0.0.1", 8080), success=False)
+    assert not circuit_breaker.allow(("10.0.0.1", 8080))
+
+
+def test_circuit_breaker_allow_proxy():
+    circuit_breaker = CircuitBreaker(cooldown=10, clock=FakeClock())
+    proxy = Proxy(proxy_id=1, proxy_url="10.0.0.1", proxy_port=8080)
+    assert circuit_breaker.allow_proxy(proxy)
+    circuit_breaker.record(("10.0.0.1", 8080), success=False)
+    assert not circuit_breaker.allow_proxy(proxy)
+    assert not circuit_breaker.allow_proxy({"proxy_url": "10.0.0.1", "proxy_port": "8080"})
+    circuit_breaker.clear()
+    circuit_breaker.record(1, success=False)
+    assert not circuit_breaker.allow_proxy(proxy)
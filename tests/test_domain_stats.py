@@ -0,0 +1,61 @@
+from proxy_helpers.mysql_proxies.domain_stats import (DomainStats, build_domain_stats_select_query,
+                                                      build_domain_stats_upsert_query, get_domain)
+from proxy_helpers.mysql_proxies.proxy_record import Proxy
+
+
+def test_get_domain():
+    assert get_domain("https://www.Example.com:8443/path?q=1") == "example.com"
+    assert get_domain("api.example.com/path") == "api.example.com"
+    assert get_domain("example.com:443") == "example.com"
+
+
+def test_domain_stats_record_and_drain():
+    domain_stats = DomainStats()
+    domain_stats.record(1, "example.com", success=False)
+    domain_stats.record(1, "example.com", success=False)
+    domain_stats.record(1, "other.com", success=True)
+    domain_stats.record(("10.0.0.1", 8080), "example.com", success=True)
+    domain_stats.record(None, "example.com", success=True)
+    assert domain_stats.get_error_score(1, "example.com") == 2
+    assert domain_stats.get_error_score(1, "other.com") == -1
+    assert domain_stats.get_error_score(2, "example.com") == 0
+
+    deltas = domain_stats.drain()
+    assert deltas == {(1, "example.com"): [0, 2], (1, "other.com"): [1, 0]}
+    assert domain_stats.drain() == {}
+    domain_stats.requeue(deltas)
+    domain_stats.seed("example.com", [(1, 5, 1), (2, 0, 3)])
+    # deltas not yet written are added to the seeded counts
+    assert domain_stats.get_error_score(1, "example.com") == -2
+    assert domain_stats.get_error_score(2, "example.com") == 3
+
+
+def test_domain_stats_rank_and_sticky():
+    domain_stats = DomainStats(top_fraction=0.5)
+    proxies = [Proxy(proxy_id=proxy_id, proxy_url=f"10.0.0.{proxy_id}", proxy_port=8080) for proxy_id in range(1, 7)]
+    domain_stats.seed("example.com", [(1, 0, 4), (2, 0, 2), (3, 3, 0)])
+    ranked_proxies = domain_stats.rank(proxies, "example.com")
+    assert len(ranked_proxies) == 3
+    assert 3 in {proxy.proxy_id for proxy in ranked_proxies}
+    assert not {1, 2} & {proxy.proxy_id for proxy in ranked_proxies}
+    assert domain_stats.rank([], "example.com") == []
+
+    assert domain_stats.get_sticky_proxy("example.com") is None
+    domain_stats.record(("10.0.0.3", 8080), "example.com", success=True)
+    assert domain_stats.get_sticky_proxy("example.com").proxy_id == 3
+    domain_stats.record(3, "example.com", success=False)
+    assert domain_stats.get_sticky_proxy("example.com") is None
+    # proxy 1 is not in the ranked batch
+    domain_stats.record(1, "example.com", success=True)
+    assert domain_stats.get_sticky_proxy("example.com") is None
+
+
+def test_build_domain_stats_queries():
+    sql_string, sql_variables = build_domain_stats_upsert_query({(1, "example.com"): [2, 1], (2, "other.com"): [0, 1]})
+    assert "ON DUPLICATE KEY UPDATE" in sql_string
+    assert "success_count= success_count + new.success_count" in sql_string and "VALUES(" not in sql_string
+    assert sql_string.count("%s") == len(sql_variables)
+    assert sql_variables == (1, "example.com", 2, 1, 2, "other.com", 0, 1)
+    assert build_domain_stats_upsert_query({}) is None
+    sql_string, sql_variables = build_domain_stats_select_query("example.com", [1, 2, 3])
+    assert sql_string.count("%s") == len(sql_variables) == 4
@@ -0,0 +1,88 @@
+import subprocess
+import sys
+
+import pytest
+
+# modules which must import without pulling in heavy dependencies
+LIGHT_MODULES = [
+    "proxy_helpers.app_config",
+    "proxy_helpers.mysql_proxies.async_connection_pool",
+    "proxy_helpers.mysql_proxies.circuit_breaker",
+    "proxy_helpers.mysql_proxies.domain_stats",
+    "proxy_helpers.mysql_proxies.latency_tracker",
+    "proxy_helpers.mysql_proxies.memory_backend",
+    "proxy_helpers.mysql_proxies.metrics",
+    "proxy_helpers.mysql_proxies.native_rows",
+    "proxy_helpers.mysql_proxies.proxy_checker",
+    "proxy_helpers.mysql_proxies.proxy_checker_async",
+    "proxy_helpers.mysql_proxies.proxy_dispenser",
+    "proxy_helpers.mysql_proxies.proxy_filter",
+    "proxy_helpers.mysql_proxies.proxy_import",
+    "proxy_helpers.mysql_proxies.proxy_prune",
+    "proxy_helpers.mysql_proxies.proxy_lease",
+    "proxy_helpers.mysql_proxies.proxy_record",
+    "proxy_helpers.mysql_proxies.proxy_schema",
+    "proxy_helpers.mysql_proxies.proxy_snapshot",
+    "proxy_helpers.mysql_proxies.proxy_universe",
+    "proxy_helpers.mysql_proxies.rate_limiter",
+    "proxy_helpers.mysql_proxies.proxy_upsert",
+    "proxy_helpers.mysql_proxies.score_buffer",
+    "proxy_helpers.mysql_proxies.score_decay",
+]
+# handler modules and the mysql_helpers connector module they subclass, which they import at module level
+HANDLER_MODULES = {
+    "proxy_helpers.mysql_proxies.mysql_proxies": "mysql_helpers.mysql_con.mysql_sync",
+    "proxy_helpers.mysql_proxies.mysql_pool_proxies": "mysql_helpers.mysql_con.mysql_pool_sync",
+    "proxy_helpers.mysql_proxies.mysql_proxies_async": "mysql_helpers.mysql_con.mysql_async",
+}
+HEAVY_PACKAGES = {"pandas", "numpy", "mysql", "mysql_helpers", "requests", "aiohttp"}
+# cumulative import time budget in microseconds, stdlib imports included
+IMPORT_TIME_BUDGET_US: int = 150_000
+
+
+def get_import_times(module_name: str) -> dict:
+    """return {imported module: cumulative import time in us} using python -X importtime"""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+                               capture_output=True, text=True, check=True)
+    import_times: dict = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, imported_module = line.split(":", 1)[1].split("|")
+        import_times[imported_module.strip()] = int(cumulative)
+    return import_times
+
+
+def get_heavy_imports(import_times: dict) -> set:
+    return {imported_module for imported_module in import_times if imported_module.split(".")[0] in HEAVY_PACKAGES}
+
+
+@pytest.mark.parametrize("module_name", LIGHT_MODULES)
+def test_import_is_light(module_name):
+    import_times = get_import_times(module_name)
+    assert get_heavy_imports(import_times) == set()
+    assert import_times[module_name] < IMPORT_TIME_BUDGET_US
+
+
+@pytest.mark.parametrize("module_name, connector_module_name", HANDLER_MODULES.items())
+def test_handler_import_adds_no_heavy_import(module_name, connector_module_name):
+    # the handlers subclass the mysql_helpers connectors, only what the connector module imports is allowed
+    pytest.importorskip(connector_module_name)
+    connector_heavy_imports = get_heavy_imports(get_import_times(connector_module_name))
+    assert get_heavy_imports(get_import_times(module_name)) - connector_heavy_imports == set()
+
+
+def test_import_has_no_filesystem_side_effect():
+    # audit hook reporting directories created and files opened for writing during the imports
+    code = "\n".join([
+        "import sys",
+        "events = []",
+        "def audit_hook(event, args):",
+        "    if event == 'os.mkdir' or (event == 'open' and isinstance(args[1], str) and args[1][0] in 'wax'):",
+        "        events.append((event, str(args[0])))",
+        "sys.addaudithook(audit_hook)",
+        *[f"import {module_name}" for module_name in LIGHT_MODULES],
+        "print(events)",
+    ])
+    completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert completed.stdout.strip() == "[]"
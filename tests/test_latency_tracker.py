@@ -0,0 +1,45 @@
+from proxy_helpers.mysql_proxies.latency_tracker import (LatencyTracker, build_latency_update_query,
+                                                         get_proxy_key_from_full_url)
+from proxy_helpers.mysql_proxies.proxy_record import Proxy
+
+
+def test_latency_ewma():
+    latency_tracker = LatencyTracker(alpha=0.5)
+    assert latency_tracker.report(1, 1.0) == 1.0
+    assert latency_tracker.report(1, 3.0) == 2.0
+    assert latency_tracker.report(None, 3.0) is None
+    assert latency_tracker.drain() == {1: 2.0}
+    assert latency_tracker.drain() == {}
+    latency_tracker.requeue([1])
+    assert latency_tracker.drain() == {1: 2.0}
+
+
+def test_latency_seed_and_lookup():
+    latency_tracker = LatencyTracker(alpha=0.5)
+    proxy = Proxy(proxy_id=1, proxy_url="10.0.0.1", proxy_port=8080, latency_ewma=4.0)
+    assert latency_tracker.get_latency(proxy) == 4.0
+    latency_tracker.seed([proxy])
+    assert latency_tracker.report(1, 2.0) == 3.0
+    latency_tracker.report(("10.0.0.2", 8080), 0.5)
+    assert latency_tracker.get_latency({"proxy_url": "10.0.0.2", "proxy_port": "8080"}) == 0.5
+    assert get_proxy_key_from_full_url("10.0.0.2:8080") == ("10.0.0.2", 8080)
+
+
+def test_select_fastest():
+    latency_tracker = LatencyTracker()
+    proxies = [Proxy(proxy_id=proxy_id, proxy_url=f"10.0.0.{proxy_id}", proxy_port=8080) for proxy_id in range(1, 9)]
+    for proxy_id in range(1, 8):
+        latency_tracker.report(proxy_id, float(proxy_id))
+    fastest_proxies = latency_tracker.select_fastest(proxies, top_fraction=0.5)
+    # proxy 8 was never measured, it is kept to get a latency
+    assert sorted(proxy.proxy_id for proxy in fastest_proxies) == [1, 2, 3, 8]
+    assert latency_tracker.select_fastest([]) == []
+
+
+def test_build_latency_update_query():
+    sql_string, sql_variables = build_latency_update_query({1: 0.5, ("10.0.0.1", 8080): 1.5})
+    assert "proxy_id IN (%s)" in sql_string
+    assert sql_string.count("%s") == len(sql_variables)
+    assert sql_variables == (1, 0.5, "10.0.0.1", 8080, 1.5, 1, "10.0.0.1", 8080)
+    assert build_latency_update_query({}) is None
+
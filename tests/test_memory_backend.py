@@ -0,0 +1,51 @@
+from proxy_helpers.mysql_proxies.memory_backend import MemoryBackend, translate_mysql_query
+from proxy_helpers.mysql_proxies.proxy_record import PROXY_RECORDS_SQL, get_proxy_records
+from proxy_helpers.mysql_proxies.proxy_upsert import build_proxy_upsert_query, chunk_proxy_rows
+from proxy_helpers.mysql_proxies.score_buffer import build_score_update_query
+
+
+def test_translate_mysql_query():
+    sql_string, _ = build_proxy_upsert_query(next(chunk_proxy_rows([{"proxy_url": "a", "proxy_port": 1}])))
+    sql_string = translate_mysql_query(sql_string)
+    assert "%s" not in sql_string
+    assert "ON CONFLICT(proxy_url, proxy_port) DO UPDATE SET" in sql_string
+    assert "`proxy_country`=COALESCE(excluded.`proxy_country`, `proxy_country`)" in sql_string
+    assert "AS new" not in sql_string
+
+
+def test_memory_backend_queries():
+    memory_backend = MemoryBackend()
+    assert memory_backend.add_proxies(10) == 10
+    proxies = get_proxy_records(memory_backend.fetch_all_as_tuples(sql_query=PROXY_RECORDS_SQL,
+                                                                   sql_variables=(5,)))
+    assert len(proxies) == 5
+    assert proxies[0].full_url.startswith("10.0.0.")
+
+    result_df = memory_backend.fetch_all_as_df(
+        sql_query="SELECT CONCAT(a.proxy_url,':', a.proxy_port) as 'full_url', a.* FROM tbl_proxy_url a LIMIT %s",
+        sql_variables=(3,)
+    )
+    assert list(result_df["full_url"]) == ["10.0.0.0:8080", "10.0.0.1:8080", "10.0.0.2:8080"]
+
+
+def test_memory_backend_score_update():
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(3)
+    memory_backend.execute_one_query("UPDATE tbl_proxy_url SET error_count=4999 WHERE proxy_id= %s", (1,))
+    sql_string, sql_variables = build_score_update_query({1: 5, ("10.0.0.1", 8080): -3})
+    assert memory_backend.execute_one_query(sql_query=sql_string, sql_variables=sql_variables) == 2
+    error_counts = memory_backend.fetch_all_as_tuples("SELECT proxy_id, error_count FROM tbl_proxy_url ORDER BY proxy_id")
+    assert error_counts == [(1, 5000), (2, -3), (3, 0)]
+
+
+def test_memory_backend_upsert():
+    memory_backend = MemoryBackend()
+    proxy_dicts = [{"proxy_url": "10.0.0.1", "proxy_port": "80", "proxy_country": "GB"},
+                   {"proxy_url": "10.0.0.2", "proxy_port": 80}]
+    for proxy_rows in chunk_proxy_rows(proxy_dicts):
+        memory_backend.execute_one_query(*build_proxy_upsert_query(proxy_rows))
+    proxy_dicts[0]["proxy_country"] = "FR"
+    for proxy_rows in chunk_proxy_rows(proxy_dicts):
+        memory_backend.execute_one_query(*build_proxy_upsert_query(proxy_rows))
+    rows = memory_backend.fetch_all_as_tuples("SELECT proxy_url, proxy_port, proxy_country FROM tbl_proxy_url ORDER BY proxy_id")
+    assert rows == [("10.0.0.1", 80, "FR"), ("10.0.0.2", 80, None)]
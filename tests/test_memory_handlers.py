@@ -0,0 +1,588 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from proxy_helpers.mysql_proxies import mysql_pool_proxies, mysql_proxies, mysql_proxies_async
+from proxy_helpers.mysql_proxies.memory_backend import MemoryBackend, MemoryBackendMixin, AsyncMemoryBackendMixin
+from proxy_helpers.mysql_proxies.metrics import MetricsRegistry
+from proxy_helpers.mysql_proxies.proxy_import import import_proxy_file
+from proxy_helpers.mysql_proxies.proxy_record import Proxy
+from proxy_helpers.mysql_proxies.score_decay import get_score_rank
+
+
+class MemoryProxyHandler(MemoryBackendMixin, mysql_proxies.ProxyHandler):
+    pass
+
+
+class MemoryPoolProxyHandler(MemoryBackendMixin, mysql_pool_proxies.ProxyHandler):
+    pass
+
+
+class AsyncMemoryProxyHandler(AsyncMemoryBackendMixin, mysql_proxies_async.ProxyHandler):
+    pass
+
+
+def get_error_counts(memory_backend: MemoryBackend) -> dict:
+    return dict(memory_backend.fetch_all_as_tuples("SELECT proxy_id, error_count FROM tbl_proxy_url"))
+
+
+@pytest.mark.parametrize("handler_class", [MemoryProxyHandler, MemoryPoolProxyHandler])
+def test_memory_proxy_generator(handler_class):
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(50)
+    proxy_handler = handler_class(memory_backend=memory_backend, proxy_universe_size=20)
+    proxies = [proxy_handler.get_next_proxy_from_generator() for _ in range(50)]
+    assert all(proxy["full_url"].startswith("10.0.0.") for proxy in proxies)
+    assert len({proxy["proxy_id"] for proxy in proxies[:20]}) == 20
+    assert all(isinstance(proxy, dict) for proxy in proxies)
+
+
+@pytest.mark.parametrize("handler_class", [MemoryProxyHandler, MemoryPoolProxyHandler])
+def test_memory_proxy_records(handler_class):
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(5)
+    proxy_handler = handler_class(memory_backend=memory_backend, proxy_records=True)
+    proxy = proxy_handler.get_next_proxy_from_generator()
+    assert isinstance(proxy, Proxy)
+    assert proxy.full_url == f"{proxy.proxy_url}:{proxy.proxy_port}"
+
+
+@pytest.mark.parametrize("handler_class", [MemoryProxyHandler, MemoryPoolProxyHandler])
+def test_memory_update_proxy_score(handler_class):
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(2)
+    proxy_handler = handler_class(memory_backend=memory_backend, score_write_behind=True, score_flush_interval=None)
+    proxy_handler.update_proxy_score(success=False, proxy_id=1)
+    proxy_handler.update_proxy_score(success=False, proxy_id=1)
+    proxy_handler.update_proxy_score(success=True, proxy_url="10.0.0.1", proxy_port=8080)
+    assert get_error_counts(memory_backend) == {1: 0, 2: 0}
+    proxy_handler.close()
+    assert get_error_counts(memory_backend) == {1: 2, 2: -1}
+
+
+def test_memory_insert_proxies():
+    memory_backend = MemoryBackend()
+    proxy_handler = MemoryProxyHandler(memory_backend=memory_backend)
+    upsert_counts = proxy_handler.insert_proxies(
+        ({"proxy_url": f"10.1.0.{index}", "proxy_port": "3128"} for index in range(25)), chunk_size=10
+    )
+    assert upsert_counts["inserted"] == 25
+    # a count of the existing proxies and an upsert per chunk
+    assert memory_backend.query_count == 6
+    upsert_counts = proxy_handler.insert_proxies(
+        {"proxy_url": f"10.1.0.{index}", "proxy_port": "3128"} for index in range(20, 30)
+    )
+    assert upsert_counts == {"inserted": 5, "updated": 5, "failed": 0}
+
+    # a re-imported proxy without metadata keeps the stored one
+    proxy_handler.insert_proxies([{"proxy_url": "10.1.0.1", "proxy_port": "3128", "proxy_country": "GB",
+                                   "proxy_town": "London"}])
+    proxy_handler.insert_proxies([{"proxy_url": "10.1.0.1", "proxy_port": "3128", "proxy_town": "Leeds"}])
+    assert memory_backend.fetch_all_as_tuples(
+        "SELECT proxy_country, proxy_town FROM tbl_proxy_url WHERE proxy_url= '10.1.0.1'"
+    ) == [("GB", "Leeds")]
+
+
+@pytest.mark.asyncio
+async def test_async_memory_proxy_handler():
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(30)
+    proxy_handler = AsyncMemoryProxyHandler(memory_backend=memory_backend, proxy_universe_size=10,
+                                            score_write_behind=True)
+    proxies = [await proxy_handler.get_next_proxy_from_generator() for _ in range(25)]
+    assert len({proxy["proxy_id"] for proxy in proxies[:10]}) == 10
+    await proxy_handler.update_proxy_score(success=False, proxy_id=proxies[0]["proxy_id"])
+    await proxy_handler.aclose()
+    assert get_error_counts(memory_backend)[proxies[0]["proxy_id"]] == 1
+
+
+@pytest.mark.parametrize("handler_class", [MemoryProxyHandler, MemoryPoolProxyHandler])
+def test_memory_circuit_breaker(handler_class):
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(10)
+    proxy_handler = handler_class(memory_backend=memory_backend, proxy_universe_size=10,
+                                  circuit_breaker_cooldown=60, prefetch_low_watermark=None)
+    proxy_handler.update_proxy_score(success=False, proxy_id=1)
+    proxy_handler.update_proxy_score(success=False, proxy_url="10.0.0.1", proxy_port=8080)
+    proxy_ids = [proxy_handler.get_next_proxy_from_generator()["proxy_id"] for _ in range(16)]
+    assert 1 not in proxy_ids and 2 not in proxy_ids
+    assert len(proxy_ids) == 16
+
+
+@pytest.mark.asyncio
+async def test_async_memory_circuit_breaker():
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(10)
+    proxy_handler = AsyncMemoryProxyHandler(memory_backend=memory_backend, proxy_universe_size=10,
+                                            circuit_breaker_cooldown=60, circuit_breaker_max_skips=3)
+    for proxy_id in range(1, 10):
+        await proxy_handler.update_proxy_score(success=False, proxy_id=proxy_id)
+    proxy_ids = [(await proxy_handler.get_next_proxy_from_generator())["proxy_id"] for _ in range(10)]
+    assert proxy_ids.count(10) >= 2
+    # skips are bounded, an open proxy is served rather than scanning the whole batch
+    assert set(proxy_ids) != {10}
+
+
+@pytest.mark.parametrize("handler_class", [MemoryProxyHandler, MemoryPoolProxyHandler])
+def test_memory_latency_selection(handler_class):
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(10)
+    proxy_handler = handler_class(memory_backend=memory_backend, proxy_universe_size=10, latency_selection=True,
+                                  prefetch_low_watermark=None)
+    for proxy_id in range(1, 11):
+        if proxy_id != 6:
+            proxy_handler.report_proxy_latency(proxy_id / 10, proxy_id=proxy_id)
+    proxy_handler.report_proxy_latency(0.3, proxy_id=1)
+    # proxy 6 is 10.0.0.5:8080
+    assert proxy_handler.report_proxy_checks([("10.0.0.5:8080", True, 0.05), ("10.0.0.7:8080", False, None)]) == 1
+    proxy_ids = {proxy_handler.get_next_proxy_from_generator()["proxy_id"] for _ in range(5)}
+    assert proxy_ids == {1, 2, 3, 4, 6}
+    latencies = dict(memory_backend.fetch_all_as_tuples("SELECT proxy_id, latency_ewma FROM tbl_proxy_url"))
+    assert latencies[1] == pytest.approx(0.1 * 0.7 + 0.3 * 0.3)
+    assert latencies[6] == pytest.approx(0.05)
+
+    # a second worker starts from the persisted averages
+    other_handler = handler_class(memory_backend=memory_backend, proxy_universe_size=10, latency_selection=True)
+    assert {other_handler.get_next_proxy_from_generator()["proxy_id"] for _ in range(5)} == {1, 2, 3, 4, 6}
+
+
+@pytest.mark.parametrize("handler_class", [MemoryProxyHandler, MemoryPoolProxyHandler])
+def test_memory_lease_mode(handler_class):
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(10)
+    proxy_handlers = [handler_class(memory_backend=memory_backend, proxy_universe_size=4, lease_ttl=60,
+                                    prefetch_low_watermark=None) for _ in range(3)]
+    leased_ids = [{proxy["proxy_id"] for proxy in proxy_handler.lease_proxies()} for proxy_handler in proxy_handlers]
+    assert leased_ids[0] | leased_ids[1] | leased_ids[2] == set(range(1, 11))
+    assert len(leased_ids[0]) == len(leased_ids[1]) == 4 and len(leased_ids[2]) == 2
+
+    # a new lease keeps the last one, still being served, and releases the older ones.
+    # A closed handler gives its proxies back
+    assert proxy_handlers[0].lease_proxies() is None
+    proxy_handlers[1].close()
+    assert {proxy["proxy_id"] for proxy in proxy_handlers[0].lease_proxies()} == leased_ids[1]
+    assert {proxy["proxy_id"] for proxy in proxy_handlers[0].lease_proxies()} == leased_ids[0]
+    assert proxy_handlers[1].release_proxy_lease() == 0
+
+    # leases of a dead handler expire
+    memory_backend.run_query("UPDATE tbl_proxy_url SET lease_expires= datetime('now', '-1 seconds')")
+    assert len(proxy_handlers[1].lease_proxies()) == 4
+    assert proxy_handlers[1].get_next_proxy_from_generator()["proxy_id"] is not None
+
+
+@pytest.mark.parametrize("handler_class", [MemoryProxyHandler, MemoryPoolProxyHandler])
+def test_memory_lease_renewal(handler_class):
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(4)
+    proxy_handler = handler_class(memory_backend=memory_backend, proxy_universe_size=4, lease_ttl=0.5)
+    assert proxy_handler.get_next_proxy_from_generator() is not None
+    lease_expires = memory_backend.run_query("SELECT MIN(lease_expires) FROM tbl_proxy_url")[0][0][0]
+    # the fractional lease_ttl is rounded up to a whole second, the leases are renewed past half of it
+    assert lease_expires > memory_backend.run_query("SELECT datetime('now')")[0][0][0]
+    memory_backend.run_query("UPDATE tbl_proxy_url SET lease_expires= datetime('now', '-1 seconds')")
+    proxy_handler.lease_renewed_at -= 1
+    assert proxy_handler.get_next_proxy_from_generator() is not None
+    assert memory_backend.run_query("SELECT COUNT(*) FROM tbl_proxy_url WHERE lease_expires > datetime('now')"
+                                    )[0][0][0] == 4
+
+
+@pytest.mark.asyncio
+async def test_async_memory_lease_mode():
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(6)
+    proxy_handlers = [AsyncMemoryProxyHandler(memory_backend=memory_backend, proxy_universe_size=3, lease_ttl=60)
+                      for _ in range(2)]
+    proxy_ids = [{(await proxy_handler.get_next_proxy_from_generator())["proxy_id"] for _ in range(3)}
+                 for proxy_handler in proxy_handlers]
+    assert proxy_ids[0] | proxy_ids[1] == set(range(1, 7))
+    await proxy_handlers[0].aclose()
+    assert memory_backend.run_query("SELECT COUNT(*) FROM tbl_proxy_url WHERE lease_owner IS NULL")[0][0][0] == 3
+
+
+@pytest.mark.parametrize("handler_class", [MemoryProxyHandler, MemoryPoolProxyHandler])
+def test_memory_incremental_refresh(handler_class):
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(10)
+    proxy_handler = handler_class(memory_backend=memory_backend, proxy_universe_size=3, incremental_refresh=True)
+    assert {proxy["proxy_id"] for proxy in proxy_handler.refresh_proxy_universe()} == {1, 2, 3}
+
+    memory_backend.run_query("UPDATE tbl_proxy_url SET error_count= 5 WHERE proxy_id IN (1, 2)")
+    memory_backend.run_query("UPDATE tbl_proxy_url SET error_count= 1 WHERE proxy_id > 3")
+    memory_backend.run_query("UPDATE tbl_proxy_url SET error_count= -1 WHERE proxy_id= 10")
+    memory_backend.run_query("DELETE FROM tbl_proxy_url WHERE proxy_id= 3")
+    query_count = memory_backend.query_count
+    assert {proxy["proxy_id"] for proxy in proxy_handler.refresh_proxy_universe()} == {10, 4, 5}
+    # watermark, changed rows and deleted rows queries
+    assert memory_backend.query_count == query_count + 3
+    assert len(proxy_handler.proxy_universe.order) == 6
+
+    proxy_handler.proxy_universe.last_full_resync -= 300
+    assert {proxy["proxy_id"] for proxy in proxy_handler.refresh_proxy_universe()} == {10, 4, 5}
+    assert len(proxy_handler.proxy_universe.order) == 6
+    assert proxy_handler.get_next_proxy_from_generator()["proxy_id"] in {10, 4, 5}
+
+
+@pytest.mark.asyncio
+async def test_async_memory_report():
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(5)
+    proxy_handler = AsyncMemoryProxyHandler(memory_backend=memory_backend, proxy_universe_size=5)
+    proxy = await proxy_handler.get_next_proxy_from_generator()
+    query_count = memory_backend.query_count
+    for _ in range(3):
+        proxy_handler.report(proxy, success=False)
+    other_proxy_id = 5 if proxy["proxy_id"] != 5 else 4
+    # proxy_id n is 10.0.0.(n - 1)
+    proxy_handler.report({"proxy_url": f"10.0.0.{other_proxy_id - 1}", "proxy_port": 8080}, success=True)
+    assert memory_backend.query_count == query_count
+    await proxy_handler.aclose()
+    # one multi-row UPDATE
+    assert memory_backend.query_count == query_count + 1
+    error_counts = get_error_counts(memory_backend)
+    assert error_counts[proxy["proxy_id"]] == 3 and error_counts[other_proxy_id] == -1
+
+
+@pytest.mark.parametrize("handler_class", [MemoryProxyHandler, MemoryPoolProxyHandler])
+def test_memory_domain_affinity(handler_class):
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(10)
+    proxy_handler = handler_class(memory_backend=memory_backend, proxy_universe_size=10, domain_top_fraction=0.5,
+                                  prefetch_low_watermark=None)
+    for proxy_id in range(1, 6):
+        proxy_handler.update_proxy_score(success=False, proxy_id=proxy_id, domain="https://example.com/a")
+    proxy_handler.update_proxy_score(success=True, proxy_id=6, domain="www.example.com")
+    assert proxy_handler.flush_domain_stats() == 6
+    domain_rows = memory_backend.fetch_all_as_tuples(
+        "SELECT proxy_id, success_count, error_count FROM tbl_proxy_domain_stats WHERE domain= 'example.com'"
+    )
+    assert sorted(domain_rows) == [(1, 0, 1), (2, 0, 1), (3, 0, 1), (4, 0, 1), (5, 0, 1), (6, 1, 0)]
+
+    # another worker ranks from the persisted stats, other domains are served the whole batch
+    other_handler = handler_class(memory_backend=memory_backend, proxy_universe_size=10, domain_top_fraction=0.5,
+                                  domain_sticky=True, prefetch_low_watermark=None)
+    proxy_ids = {other_handler.get_next_proxy_from_generator(domain="example.com")["proxy_id"] for _ in range(5)}
+    assert proxy_ids == {6, 7, 8, 9, 10}
+    assert other_handler.get_next_proxy_from_generator()["proxy_id"] in range(1, 11)
+
+    # sticky sessions reuse the last proxy that succeeded on the domain
+    other_handler.update_proxy_score(success=True, proxy_id=8, domain="example.com")
+    assert {other_handler.get_next_proxy_from_generator(domain="example.com")["proxy_id"] for _ in range(3)} == {8}
+    other_handler.update_proxy_score(success=False, proxy_id=8, domain="example.com")
+    assert other_handler.domain_stats.get_sticky_proxy("example.com") is None
+    other_handler.close()
+    assert memory_backend.fetch_all_as_tuples(
+        "SELECT success_count, error_count FROM tbl_proxy_domain_stats WHERE proxy_id= 8"
+    ) == [(1, 1)]
+
+
+@pytest.mark.asyncio
+async def test_async_memory_domain_affinity():
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(4)
+    proxy_handler = AsyncMemoryProxyHandler(memory_backend=memory_backend, proxy_universe_size=4,
+                                            domain_top_fraction=0.5, domain_sticky=True)
+    await proxy_handler.update_proxy_score(success=False, proxy_id=1, domain="example.com")
+    proxy_handler.report({"proxy_id": 2}, success=False, domain="example.com")
+    proxy = await proxy_handler.get_next_proxy_from_generator(domain="example.com")
+    assert proxy["proxy_id"] in {3, 4}
+    proxy_handler.report(proxy, success=True, domain="example.com")
+    assert (await proxy_handler.get_next_proxy_from_generator(domain="example.com"))["proxy_id"] == proxy["proxy_id"]
+    await proxy_handler.aclose()
+    assert sorted(memory_backend.fetch_all_as_tuples(
+        "SELECT proxy_id, success_count, error_count FROM tbl_proxy_domain_stats"
+    )) == [(1, 0, 1), (2, 0, 1), (proxy["proxy_id"], 1, 0)]
+
+
+@pytest.mark.parametrize("handler_class", [MemoryProxyHandler, MemoryPoolProxyHandler])
+def test_memory_domain_batches_share_the_main_batch(handler_class):
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(10)
+    proxy_handler = handler_class(memory_backend=memory_backend, proxy_universe_size=10, prefetch_low_watermark=None)
+    batch_loads = []
+    load_proxy_batch = proxy_handler._load_proxy_batch_locked
+
+    def count_batch_loads():
+        batch_loads.append(1)
+        return load_proxy_batch()
+
+    proxy_handler._load_proxy_batch_locked = count_batch_loads
+    proxy_handler.get_next_proxy_from_generator()
+    proxy_handler.get_next_proxy_from_generator(domain="example.com")
+    proxy_handler.get_next_proxy_from_generator(domain="example.org")
+    assert len(batch_loads) == 1
+    # a domain reloading the batch it already ranked loads the next one, which the other domains then rank
+    proxy_handler.domain_dispensers["example.com"].clear()
+    proxy_handler.get_next_proxy_from_generator(domain="example.com")
+    proxy_handler.domain_dispensers["example.org"].clear()
+    proxy_handler.get_next_proxy_from_generator(domain="example.org")
+    assert len(batch_loads) == 2
+    assert proxy_handler.domain_source_batches["example.org"] is proxy_handler.proxy_batch
+
+
+@pytest.mark.parametrize("handler_class", [MemoryProxyHandler, MemoryPoolProxyHandler])
+def test_memory_rate_limit(handler_class):
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(3)
+    proxy_handler = handler_class(memory_backend=memory_backend, proxy_universe_size=3, rate_limit=0.01)
+    assert {proxy_handler.get_next_proxy_from_generator()["proxy_id"] for _ in range(3)} == {1, 2, 3}
+    assert proxy_handler.get_next_proxy_from_generator() is None
+    assert proxy_handler.get_next_proxy_from_generator(domain="example.com")["proxy_id"] in {1, 2, 3}
+
+
+@pytest.mark.parametrize("handler_class", [MemoryProxyHandler, MemoryPoolProxyHandler])
+def test_memory_snapshot(handler_class, tmp_path):
+    snapshot_path = tmp_path / "proxies.snapshot"
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(5)
+    proxy_handler = handler_class(memory_backend=memory_backend, proxy_universe_size=5, snapshot_path=snapshot_path)
+    assert proxy_handler.get_next_proxy_from_generator()["proxy_id"] in range(1, 6)
+
+    # a new handler starts from the snapshot, MySQL is queried in the background
+    memory_backend.offline = True
+    query_count = memory_backend.query_count
+    other_handler = handler_class(memory_backend=memory_backend, proxy_universe_size=5, snapshot_path=snapshot_path,
+                                  prefetch_low_watermark=None)
+    assert other_handler.get_next_proxy_from_generator()["proxy_id"] in range(1, 6)
+    # and keeps serving it while MySQL is unreachable
+    assert all(other_handler.get_next_proxy_from_generator()["proxy_id"] in range(1, 6) for _ in range(20))
+    assert memory_backend.query_count == query_count
+
+    memory_backend.offline = False
+    memory_backend.add_proxies(2)
+    other_handler.proxy_universe_size = 7
+    # what is left of the current batch, then a batch read from MySQL
+    assert {other_handler.get_next_proxy_from_generator()["proxy_id"] for _ in range(12)} == set(range(1, 8))
+    assert handler_class(memory_backend=memory_backend, snapshot_path=tmp_path / "missing").preload_proxy_snapshot() == 0
+
+
+@pytest.mark.asyncio
+async def test_async_memory_snapshot(tmp_path):
+    snapshot_path = tmp_path / "proxies.snapshot"
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(3)
+    proxy_handler = AsyncMemoryProxyHandler(memory_backend=memory_backend, proxy_universe_size=3,
+                                            snapshot_path=snapshot_path)
+    assert (await proxy_handler.get_next_proxy_from_generator())["proxy_id"] in range(1, 4)
+
+    memory_backend.offline = True
+    other_handler = AsyncMemoryProxyHandler(memory_backend=memory_backend, proxy_universe_size=3,
+                                            snapshot_path=snapshot_path)
+    assert {(await other_handler.get_next_proxy_from_generator())["proxy_id"] for _ in range(6)} == {1, 2, 3}
+
+
+@pytest.mark.parametrize("handler_class", [MemoryProxyHandler, MemoryPoolProxyHandler])
+def test_memory_metrics(handler_class):
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(5)
+    metrics = MetricsRegistry()
+    proxy_handler = handler_class(memory_backend=memory_backend, proxy_universe_size=5, metrics=metrics)
+    proxy = proxy_handler.get_next_proxy_from_generator()
+    proxy_handler.get_next_proxy_from_generator()
+    proxy_handler.update_proxy_score(success=False, proxy_id=proxy["proxy_id"])
+    counters = metrics.snapshot()["counters"]
+    assert counters["proxies_served_total"] == 2
+    assert counters["proxy_batches_loaded_total"] >= 1
+    assert counters['proxy_scores_total{result="failure"}'] == 1
+    assert metrics.snapshot()["histograms"]["next_proxy_seconds"]["count"] == 2
+
+
+@pytest.mark.asyncio
+async def test_async_memory_metrics():
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(3)
+    metrics = MetricsRegistry()
+    proxy_handler = AsyncMemoryProxyHandler(memory_backend=memory_backend, proxy_universe_size=3, metrics=metrics)
+    proxy = await proxy_handler.get_next_proxy_from_generator()
+    proxy_handler.report(proxy, success=True)
+    await proxy_handler.aclose()
+    counters = metrics.snapshot()["counters"]
+    assert counters["proxies_served_total"] == 1
+    assert counters['proxy_scores_total{result="success"}'] == 1
+
+
+def test_memory_import_proxy_file(tmp_path):
+    file_path = tmp_path / "proxies.txt"
+    file_path.write_text("".join(f"10.2.0.{index}:3128\n" for index in range(30)) + "10.2.0.1:3128\nbad\n")
+    memory_backend = MemoryBackend()
+    proxy_handler = MemoryProxyHandler(memory_backend=memory_backend)
+    import_counts = import_proxy_file(proxy_handler, file_path, chunk_size=10, proxy_web_name="dump")
+    assert import_counts["inserted"] == 30
+    assert (import_counts["read"], import_counts["invalid"], import_counts["duplicate"]) == (32, 1, 1)
+    assert import_counts["rows_per_second"] > 0
+    assert memory_backend.query_count == 6
+    assert memory_backend.fetch_all_as_tuples(
+        "SELECT COUNT(*) FROM tbl_proxy_url WHERE proxy_web_name= %s", ("dump",)
+    ) == [(30,)]
+
+
+@pytest.mark.parametrize("handler_class", [MemoryProxyHandler, MemoryPoolProxyHandler])
+def test_memory_prune_proxies(handler_class):
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(10)
+    memory_backend.add_proxies(25, error_count=5000)
+    memory_backend.execute_one_query("UPDATE tbl_proxy_url SET upload_datetime= %s WHERE proxy_id > 30",
+                                     (datetime(2020, 1, 1),))
+    proxy_handler = handler_class(memory_backend=memory_backend)
+    assert proxy_handler.prune_proxies(min_error_count=4000, max_age_days=30)["deleted"] == 5
+    query_count = memory_backend.query_count
+    prune_counts = proxy_handler.prune_proxies(min_error_count=4000, chunk_size=8)
+    assert (prune_counts["deleted"], prune_counts["chunks"]) == (20, 3)
+    assert memory_backend.query_count - query_count == 6
+    assert set(get_error_counts(memory_backend)) == set(range(1, 11))
+    # tombstones let incremental refresh drop them
+    assert len(memory_backend.fetch_all_as_tuples("SELECT proxy_id FROM tbl_proxy_url_deleted")) == 25
+
+
+@pytest.mark.asyncio
+async def test_async_memory_prune_proxies():
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(3)
+    memory_backend.add_proxies(4, error_count=5000)
+    proxy_handler = AsyncMemoryProxyHandler(memory_backend=memory_backend)
+    prune_counts = await proxy_handler.prune_proxies(min_error_count=4000, chunk_size=2)
+    assert (prune_counts["deleted"], prune_counts["chunks"]) == (4, 2)
+    assert set(get_error_counts(memory_backend)) == {1, 2, 3}
+
+
+def set_decayed_score(memory_backend: MemoryBackend, proxy_id: int, score: float, hours_ago: float, half_life: float):
+    score_updated_at = datetime.utcnow() - timedelta(hours=hours_ago)
+    score_rank = get_score_rank(score, score_updated_at.replace(tzinfo=timezone.utc).timestamp(), half_life)
+    memory_backend.execute_one_query(
+        "UPDATE tbl_proxy_url SET decayed_score= %s, score_updated_at= %s, score_rank= %s WHERE proxy_id= %s",
+        (score, score_updated_at, score_rank, proxy_id)
+    )
+
+
+@pytest.mark.parametrize("handler_class", [MemoryProxyHandler, MemoryPoolProxyHandler])
+def test_memory_score_decay(handler_class):
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(4)
+    proxy_handler = handler_class(memory_backend=memory_backend, score_half_life=3600)
+    # 4 errors 10 hours ago weigh less than 1 error now
+    set_decayed_score(memory_backend, proxy_id=1, score=4, hours_ago=10, half_life=3600)
+    proxy_handler.update_proxy_score(success=False, proxy_id=2)
+    proxy_handler.update_proxy_score(success=True, proxy_url="10.0.0.2", proxy_port=8080)
+    proxies = proxy_handler.get_proxy_universe(proxy_universe_size=4, shuffle_results=False, return_as_records=True)
+    assert [proxy["proxy_id"] for proxy in proxies] == [3, 4, 1, 2]
+    assert get_error_counts(memory_backend) == {1: 0, 2: 1, 3: -1, 4: 0}
+
+    # scoring brings the decayed score up to date before adding to it
+    proxy_handler.update_proxy_score(success=False, proxy_id=1)
+    decayed_score = memory_backend.fetch_all_as_tuples("SELECT decayed_score FROM tbl_proxy_url WHERE proxy_id= 1")
+    assert decayed_score[0][0] == pytest.approx(1 + 4 * 0.5 ** 10, rel=1e-3)
+    proxies = proxy_handler.get_proxy_universe(proxy_universe_size=4, shuffle_results=False, return_as_records=True)
+    assert [proxy["proxy_id"] for proxy in proxies] == [3, 4, 2, 1]
+
+    with pytest.raises(ValueError):
+        handler_class(memory_backend=memory_backend, score_half_life=3600, incremental_refresh=True)
+
+
+@pytest.mark.asyncio
+async def test_async_memory_score_decay():
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(3)
+    proxy_handler = AsyncMemoryProxyHandler(memory_backend=memory_backend, score_half_life=3600)
+    set_decayed_score(memory_backend, proxy_id=1, score=-4, hours_ago=1, half_life=3600)
+    await proxy_handler.update_proxy_score(success=False, proxy_id=3)
+    proxy_handler.report({"proxy_id": 2}, success=False)
+    proxy_handler.report({"proxy_id": 2}, success=False)
+    await proxy_handler.aclose()
+    assert get_error_counts(memory_backend) == {1: 0, 2: 2, 3: 1}
+
+    proxy_handler = AsyncMemoryProxyHandler(memory_backend=memory_backend, score_half_life=3600, lease_ttl=60)
+    proxies = await proxy_handler.lease_proxies(lease_size=2)
+    assert [proxy["proxy_id"] for proxy in sorted(proxies, key=lambda proxy: proxy["proxy_id"])] == [1, 3]
+    await proxy_handler.aclose()
+
+
+@pytest.mark.parametrize("handler_class", [MemoryProxyHandler, MemoryPoolProxyHandler])
+def test_memory_bandit_selection(handler_class):
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(10)
+    proxy_handler = handler_class(memory_backend=memory_backend, proxy_universe_size=10,
+                                  selection_strategy="thompson", selection_draw_size=8)
+    for _ in range(60):
+        proxy = proxy_handler.get_next_proxy_from_generator()
+        proxy_handler.update_proxy_score(success=proxy["proxy_id"] == 4, proxy_id=proxy["proxy_id"])
+    proxy_ids = [proxy_handler.get_next_proxy_from_generator()["proxy_id"] for _ in range(40)]
+    assert proxy_ids.count(4) > 20
+    # counts are kept across batch reloads, and the scores were still written
+    assert get_error_counts(memory_backend)[4] < 0
+
+    proxy_handler.report_proxy_latency(0.5, proxy_id=4)
+    assert proxy_handler.proxy_dispenser.bandit_selector.latencies[
+        proxy_handler.proxy_dispenser.bandit_selector.proxy_indexes[4]] == 0.5
+    # proxy checks are counted by the bandit, proxy 6 is 10.0.0.5:8080 and proxy 8 is 10.0.0.7:8080
+    bandit_selector = proxy_handler.proxy_dispenser.bandit_selector
+    successes, failures = bandit_selector.successes.copy(), bandit_selector.failures.copy()
+    proxy_handler.report_proxy_checks([("10.0.0.5:8080", True, 0.05), ("10.0.0.7:8080", False, None)])
+    checked_index, failed_index = bandit_selector.proxy_indexes[6], bandit_selector.proxy_indexes[8]
+    assert bandit_selector.successes[checked_index] == successes[checked_index] + 1
+    assert bandit_selector.failures[failed_index] == failures[failed_index] + 1
+    with pytest.raises(ValueError):
+        handler_class(memory_backend=memory_backend, selection_strategy="ucb", rate_limit=1.0)
+
+
+@pytest.mark.asyncio
+async def test_async_memory_bandit_selection():
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(5)
+    proxy_handler = AsyncMemoryProxyHandler(memory_backend=memory_backend, proxy_universe_size=5,
+                                            selection_strategy="ucb", selection_draw_size=1)
+    for _ in range(30):
+        proxy = await proxy_handler.get_next_proxy_from_generator()
+        proxy_handler.report(proxy, success=proxy["proxy_id"] == 2)
+    proxy_ids = [(await proxy_handler.get_next_proxy_from_generator())["proxy_id"] for _ in range(10)]
+    assert proxy_ids.count(2) >= 5
+    await proxy_handler.aclose()
+
+
+@pytest.mark.parametrize("handler_class", [MemoryProxyHandler, MemoryPoolProxyHandler])
+def test_memory_filtered_selection(handler_class):
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(6, proxy_country="GB")
+    memory_backend.add_proxies(4, proxy_country="FR")
+    proxy_handler = handler_class(memory_backend=memory_backend, proxy_universe_size=10)
+    proxies = [proxy_handler.get_next_proxy_from_generator(country="fr") for _ in range(8)]
+    assert {proxy["proxy_country"] for proxy in proxies} == {"FR"}
+    assert len({proxy["proxy_id"] for proxy in proxies}) == 4
+    # only the first pick loads a batch, the one the main dispenser then serves
+    query_count = memory_backend.query_count
+    assert proxy_handler.get_next_proxy_from_generator() is not None
+    assert proxy_handler.get_next_proxy_from_generator(country="GB", source="memory_backend")["proxy_country"] == "GB"
+    assert proxy_handler.get_next_proxy_from_generator(country="DE") is None
+    assert proxy_handler.get_next_proxy_from_generator(country="GB", town="London") is None
+    assert memory_backend.query_count == query_count
+
+    # batches loaded by the dispenser are indexed too
+    memory_backend.execute_one_query("UPDATE tbl_proxy_url SET proxy_country= 'DE' WHERE proxy_id= 1")
+    proxy_handler.proxy_dispenser.clear()
+    proxy_handler.get_next_proxy_from_generator()
+    assert proxy_handler.get_next_proxy_from_generator(country="de")["proxy_id"] == 1
+
+
+@pytest.mark.parametrize("handler_class", [MemoryProxyHandler, MemoryPoolProxyHandler])
+def test_memory_filtered_selection_rate_limit(handler_class):
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(2, proxy_country="GB")
+    memory_backend.add_proxies(2, proxy_country="FR")
+    proxy_handler = handler_class(memory_backend=memory_backend, proxy_universe_size=4, rate_limit=0.01)
+    assert {proxy_handler.get_next_proxy_from_generator(country="gb")["proxy_id"] for _ in range(2)} == {1, 2}
+    assert proxy_handler.get_next_proxy_from_generator(country="gb") is None
+    # filtered picks count in the rate limits of the main dispenser
+    assert {proxy_handler.get_next_proxy_from_generator()["proxy_id"] for _ in range(2)} == {3, 4}
+    assert proxy_handler.get_next_proxy_from_generator() is None
+
+
+@pytest.mark.asyncio
+async def test_async_memory_filtered_selection():
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(3, proxy_country="GB")
+    memory_backend.add_proxies(2, proxy_country="US")
+    proxy_handler = AsyncMemoryProxyHandler(memory_backend=memory_backend, proxy_universe_size=5,
+                                            circuit_breaker_cooldown=60)
+    await proxy_handler.update_proxy_score(success=False, proxy_id=4)
+    proxies = [await proxy_handler.get_next_proxy_from_generator(country="us") for _ in range(4)]
+    # proxy 4 is open in the circuit breaker
+    assert {proxy["proxy_id"] for proxy in proxies} == {5}
+    await proxy_handler.aclose()
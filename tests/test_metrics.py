@@ -0,0 +1,57 @@
+from urllib.request import urlopen
+
+import pytest
+
+from proxy_helpers.mysql_proxies.metrics import Histogram, MetricsRegistry, start_metrics_server
+
+
+def test_histogram_buckets():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.get_cumulative_counts() == [(0.1, 2), (1.0, 3), (float("inf"), 4)]
+    assert histogram.sum == pytest.approx(2.65)
+    assert histogram.count == 4
+
+
+def test_metrics_snapshot():
+    metrics = MetricsRegistry(buckets=(0.1, 1.0))
+    metrics.increment("proxies_served_total")
+    metrics.increment("proxies_served_total", 2)
+    metrics.increment("proxy_scores_total", labels={"result": "failure"})
+    metrics.observe("db_query_seconds", 0.5, {"method": "fetch_all_as_tuples"})
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"] == {"proxies_served_total": 3, 'proxy_scores_total{result="failure"}': 1}
+    assert snapshot["histograms"]['db_query_seconds{method="fetch_all_as_tuples"}'] == {
+        "buckets": [(0.1, 0), (1.0, 1), (float("inf"), 1)], "sum": 0.5, "count": 1,
+    }
+    metrics.clear()
+    assert metrics.snapshot() == {"counters": {}, "histograms": {}}
+
+
+def test_metrics_prometheus_text():
+    metrics = MetricsRegistry(buckets=(0.1,))
+    metrics.increment("proxy_checks_total", labels={"result": 'o"k'})
+    metrics.observe("proxy_check_seconds", 0.05)
+    assert metrics.to_prometheus_text().splitlines() == [
+        "# TYPE proxy_helpers_proxy_checks_total counter",
+        'proxy_helpers_proxy_checks_total{result="o\\"k"} 1',
+        "# TYPE proxy_helpers_proxy_check_seconds histogram",
+        'proxy_helpers_proxy_check_seconds_bucket{le="0.1"} 1',
+        'proxy_helpers_proxy_check_seconds_bucket{le="+Inf"} 1',
+        "proxy_helpers_proxy_check_seconds_sum 0.05",
+        "proxy_helpers_proxy_check_seconds_count 1",
+    ]
+
+
+def test_metrics_server():
+    metrics = MetricsRegistry()
+    metrics.increment("proxies_served_total")
+    metrics_server = start_metrics_server(metrics, port=0)
+    try:
+        with urlopen(f"http://127.0.0.1:{metrics_server.server_address[1]}/metrics", timeout=5) as response:
+            assert "proxy_helpers_proxies_served_total 1" in response.read().decode()
+    finally:
+        metrics_server.shutdown()
+        metrics_server.server_close()
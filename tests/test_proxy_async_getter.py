@@ -31,7 +31,22 @@ async def test_proxy_generator():
     assert len(proxies) == proxy_number
 
 
+@pytest.mark.asyncio
+async def test_connection_pool():
+    proxy_handler = ProxyHandler(pool_size=4)
+    proxy_sql_query = """
+    SELECT proxy_id FROM tbl_proxy_url ORDER BY error_count ASC LIMIT 10
+    """
+    results = await asyncio.gather(*(proxy_handler.fetch_all_as_tuples(sql_query=proxy_sql_query) for _ in range(8)))
+    assert all(len(rows) == len(results[0]) for rows in results)
+    pool_metrics = proxy_handler.pool_metrics()
+    print(pool_metrics)
+    assert pool_metrics["acquired"] == 8 and pool_metrics["connections"] <= 4
+    await proxy_handler.aclose()
+
+
 if __name__ == '__main__':
     loop = asyncio.get_event_loop()
     loop.run_until_complete(test_mysql_proxies())
     loop.run_until_complete(test_proxy_generator())
+    loop.run_until_complete(test_connection_pool())
@@ -0,0 +1,11 @@
+from proxy_helpers.mysql_proxies.proxy_checker import ProxyChecker
+from tests.test_proxy_checker_async import echo_proxy_full_url  # noqa: F401
+
+
+def test_check_proxy(echo_proxy_full_url):
+    proxy_checker = ProxyChecker(timeout=5, base_url="http://httpbin.test/ip")
+    proxy_full_url, ok, latency = proxy_checker.check_proxy_result(echo_proxy_full_url)
+    assert proxy_full_url == echo_proxy_full_url
+    assert ok is True
+    assert latency > 0
+    assert proxy_checker.check_proxy(echo_proxy_full_url) is True
@@ -0,0 +1,64 @@
+import json
+import socket
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+import pytest
+
+from proxy_helpers.mysql_proxies.proxy_checker_async import ProxyChecker
+
+
+class EchoProxyRequestHandler(BaseHTTPRequestHandler):
+    """stands in for both the proxy and httpbin.org/ip"""
+
+    def do_GET(self):
+        body = json.dumps({"origin": self.client_address[0]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def echo_proxy_full_url():
+    echo_server = ThreadingHTTPServer(("127.0.0.1", 0), EchoProxyRequestHandler)
+    Thread(target=echo_server.serve_forever, daemon=True).start()
+    yield f"127.0.0.1:{echo_server.server_address[1]}"
+    echo_server.shutdown()
+
+
+def get_dead_proxy_full_url() -> str:
+    with socket.socket() as closed_socket:
+        closed_socket.bind(("127.0.0.1", 0))
+        return f"127.0.0.1:{closed_socket.getsockname()[1]}"
+
+
+@pytest.mark.asyncio
+async def test_check_proxy(echo_proxy_full_url):
+    proxy_checker = ProxyChecker(timeout=5, base_url="http://httpbin.test/ip")
+    proxy_full_url, ok, latency = await proxy_checker.check_proxy(echo_proxy_full_url)
+    assert proxy_full_url == echo_proxy_full_url
+    assert ok is True
+    assert latency > 0
+
+
+@pytest.mark.asyncio
+async def test_check_proxies(echo_proxy_full_url):
+    proxy_checker = ProxyChecker(timeout=5, max_concurrency=4, base_url="http://httpbin.test/ip", backoff=0.01)
+    dead_proxy_full_url = get_dead_proxy_full_url()
+    proxy_full_urls = [echo_proxy_full_url] * 20 + [dead_proxy_full_url]
+    results = [result async for result in proxy_checker.check_proxies(proxy_full_urls, max_attempts=2)]
+    assert len(results) == 21
+    assert sum(1 for _, ok, _ in results if ok) == 20
+    assert (dead_proxy_full_url, False, None) in results
+
+
+@pytest.mark.asyncio
+async def test_check_proxy_deadline():
+    proxy_checker = ProxyChecker(timeout=5, base_url="http://httpbin.test/ip", backoff=10)
+    result = await proxy_checker.check_proxy(get_dead_proxy_full_url(), max_attempts=5, deadline=0.2)
+    assert result[1] is False
@@ -0,0 +1,193 @@
+import asyncio
+from threading import Event, Thread
+from time import sleep
+
+import pytest
+
+from proxy_helpers.mysql_proxies.proxy_dispenser import ProxyDispenser, AsyncProxyDispenser
+
+
+class BatchLoader:
+    def __init__(self, batch_size: int = 10):
+        self.batch_size: int = batch_size
+        self.load_count: int = 0
+
+    def __call__(self):
+        self.load_count += 1
+        return [(self.load_count, index) for index in range(self.batch_size)]
+
+
+def test_dispenser_prefetches_next_batch():
+    batch_loader = BatchLoader()
+    proxy_dispenser = ProxyDispenser(load_batch=batch_loader, low_watermark=0.2)
+    proxies = [proxy_dispenser.next_proxy() for _ in range(8)]
+    assert proxies == [(1, index) for index in range(8)]
+    for _ in range(100):
+        if proxy_dispenser.next_batch is not None:
+            break
+        sleep(0.01)
+    assert batch_loader.load_count == 2
+    proxies = [proxy_dispenser.next_proxy() for _ in range(4)]
+    assert proxies == [(1, 8), (1, 9), (2, 0), (2, 1)]
+
+
+def test_dispenser_swap_waits_for_prefetch():
+    load_event = Event()
+    batch_loader = BatchLoader(batch_size=4)
+
+    def slow_loader():
+        if batch_loader.load_count > 0:
+            load_event.wait(5)
+        return batch_loader()
+
+    proxy_dispenser = ProxyDispenser(load_batch=slow_loader, low_watermark=0.5)
+    proxies = [proxy_dispenser.next_proxy() for _ in range(4)]
+    assert proxies == [(1, index) for index in range(4)]
+    load_event.set()
+    assert proxy_dispenser.next_proxy() == (2, 0)
+    assert batch_loader.load_count == 2
+
+
+def test_dispenser_without_prefetch():
+    batch_loader = BatchLoader(batch_size=3)
+    proxy_dispenser = ProxyDispenser(load_batch=batch_loader, low_watermark=None)
+    proxies = [proxy_dispenser.next_proxy() for _ in range(4)]
+    assert proxies[-1] == (2, 0)
+    assert proxy_dispenser.next_batch is None
+
+
+def test_dispenser_load_first_batch_and_on_install():
+    batch_loader = BatchLoader(batch_size=2)
+    installed_batches = []
+    proxy_dispenser = ProxyDispenser(load_batch=batch_loader, low_watermark=None, on_install=installed_batches.append)
+    proxy_dispenser.load_first_batch()
+    proxy_dispenser.load_first_batch()
+    assert batch_loader.load_count == 1
+    assert installed_batches == [[(1, 0), (1, 1)]]
+    assert [proxy_dispenser.next_proxy() for _ in range(3)] == [(1, 0), (1, 1), (2, 0)]
+    assert len(installed_batches) == 2
+    proxy_dispenser.preload([(0, 0)])
+    assert installed_batches[-1] == [(0, 0)]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now: float = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_dispenser_backs_off_after_failed_prefetch():
+    load_counts = []
+
+    def load_batch():
+        load_counts.append(1)
+        if len(load_counts) == 1:
+            return [(1, index) for index in range(10)]
+        raise ConnectionError("database unreachable")
+
+    clock = FakeClock()
+    proxy_dispenser = ProxyDispenser(load_batch=load_batch, low_watermark=0.5, clock=clock)
+    for _ in range(8):
+        proxy_dispenser.next_proxy()
+        prefetch_thread = proxy_dispenser._prefetch_thread
+        if prefetch_thread is not None:
+            prefetch_thread.join()
+    # the first prefetch failed, none is started again before retry_interval
+    assert len(load_counts) == 2
+    clock.now += proxy_dispenser.retry_interval
+    proxy_dispenser.next_proxy()
+    for _ in range(100):
+        if len(load_counts) == 3:
+            break
+        sleep(0.01)
+    assert len(load_counts) == 3
+
+
+def test_dispenser_empty_universe():
+    proxy_dispenser = ProxyDispenser(load_batch=lambda: None)
+    assert proxy_dispenser.next_proxy() is None
+
+
+def test_dispenser_many_threads():
+    batch_loader = BatchLoader(batch_size=100)
+    proxy_dispenser = ProxyDispenser(load_batch=batch_loader, low_watermark=0.2)
+    served = [[] for _ in range(16)]
+
+    def consume(consumer_served: list):
+        for _ in range(250):
+            consumer_served.append(proxy_dispenser.next_proxy())
+
+    threads = [Thread(target=consume, args=(consumer_served,)) for consumer_served in served]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    proxies = [proxy for consumer_served in served for proxy in consumer_served]
+    # every proxy of the 40 batches is served exactly once
+    assert sorted(proxies) == [(load_count, index) for load_count in range(1, 41) for index in range(100)]
+
+
+@pytest.mark.asyncio
+async def test_async_dispenser():
+    batch_loader = BatchLoader(batch_size=5)
+
+    async def load_batch():
+        return batch_loader()
+
+    proxy_dispenser = AsyncProxyDispenser(load_batch=load_batch, low_watermark=0.4)
+    proxies = [await proxy_dispenser.next_proxy() for _ in range(7)]
+    assert proxies[:5] == [(1, index) for index in range(5)]
+    assert proxies[5:] == [(2, 0), (2, 1)]
+    assert batch_loader.load_count == 2
+
+
+@pytest.mark.asyncio
+async def test_async_dispenser_backs_off_after_failed_prefetch():
+    load_counts = []
+
+    async def load_batch():
+        load_counts.append(1)
+        return [(1, index) for index in range(10)] if len(load_counts) == 1 else None
+
+    clock = FakeClock()
+    proxy_dispenser = AsyncProxyDispenser(load_batch=load_batch, low_watermark=0.5, clock=clock)
+    for _ in range(8):
+        await proxy_dispenser.next_proxy()
+        await asyncio.sleep(0)
+    assert len(load_counts) == 2
+    clock.now += proxy_dispenser.retry_interval
+    await proxy_dispenser.next_proxy()
+    await asyncio.sleep(0)
+    assert len(load_counts) == 3
+
+
+def test_dispenser_preload_is_replaced_once_loaded():
+    batch_loader = BatchLoader(batch_size=3)
+    proxy_dispenser = ProxyDispenser(load_batch=batch_loader, low_watermark=None)
+    proxy_dispenser.preload([(0, index) for index in range(10)])
+    assert proxy_dispenser.next_proxy() == (0, 0)
+    for _ in range(100):
+        if proxy_dispenser.next_batch is not None:
+            break
+        sleep(0.01)
+    assert proxy_dispenser.next_proxy() == (0, 1)
+    # the stale batch was swapped right after serving (0, 1)
+    assert [proxy_dispenser.next_proxy() for _ in range(3)] == [(1, 0), (1, 1), (1, 2)]
+    assert batch_loader.load_count == 1
+
+
+@pytest.mark.asyncio
+async def test_async_dispenser_preload():
+    batch_loader = BatchLoader(batch_size=3)
+
+    async def load_batch():
+        return batch_loader()
+
+    proxy_dispenser = AsyncProxyDispenser(load_batch=load_batch, low_watermark=None)
+    proxy_dispenser.preload([(0, index) for index in range(10)])
+    assert await proxy_dispenser.next_proxy() == (0, 0)
+    await asyncio.sleep(0)
+    assert await proxy_dispenser.next_proxy() == (0, 1)
+    assert [await proxy_dispenser.next_proxy() for _ in range(3)] == [(1, 0), (1, 1), (1, 2)]
@@ -0,0 +1,52 @@
+from collections import Counter
+
+from proxy_helpers.mysql_proxies.proxy_filter import AttributeIndex, RotatingPool, get_proxy_filters
+from proxy_helpers.mysql_proxies.proxy_record import Proxy
+
+
+def get_proxies() -> list:
+    return [
+        Proxy(proxy_id=1, proxy_country="GB", proxy_town="London", proxy_web_name="free"),
+        Proxy(proxy_id=2, proxy_country="GB", proxy_town="Leeds", proxy_web_name="paid"),
+        Proxy(proxy_id=3, proxy_country="gb ", proxy_town="London", proxy_web_name="paid"),
+        Proxy(proxy_id=4, proxy_country="FR", proxy_town="Paris", proxy_web_name="free"),
+        Proxy(proxy_id=5, proxy_country=None, proxy_town=None, proxy_web_name="free"),
+    ]
+
+
+def test_get_proxy_filters():
+    assert get_proxy_filters() is None
+    assert get_proxy_filters(source="Free", country=" GB") == (("proxy_country", "gb"), ("proxy_web_name", "free"))
+
+
+def test_rotating_pool():
+    assert RotatingPool([]).next_proxy() is None
+    rotating_pool = RotatingPool(["a", "b"])
+    assert [rotating_pool.next_proxy() for _ in range(5)] == ["a", "b", "a", "b", "a"]
+
+
+def test_attribute_index():
+    attribute_index = AttributeIndex()
+    assert not attribute_index.loaded
+    attribute_index.load(get_proxies())
+    assert attribute_index.column_pools == {}
+
+    # served in turn, values are case and space insensitive
+    picks = [attribute_index.next_proxy(get_proxy_filters(country="GB")).proxy_id for _ in range(6)]
+    assert Counter(picks) == {1: 2, 2: 2, 3: 2}
+    assert set(attribute_index.column_pools) == {"proxy_country"}
+
+    london_paid = get_proxy_filters(country="gb", town="london", source="paid")
+    assert [attribute_index.next_proxy(london_paid).proxy_id for _ in range(2)] == [3, 3]
+    assert attribute_index.next_proxy(get_proxy_filters(country="GB", town="Paris")) is None
+    assert attribute_index.next_proxy(get_proxy_filters(country="DE")) is None
+
+    # a new batch replaces the indexes
+    attribute_index.load(get_proxies()[3:])
+    assert attribute_index.next_proxy(get_proxy_filters(country="GB")) is None
+    assert attribute_index.next_proxy(get_proxy_filters(source="free")).proxy_id in (4, 5)
+    # accept skips the proxies it rejects, None once every matching proxy is
+    free_filters = get_proxy_filters(source="free")
+    assert [attribute_index.next_proxy(free_filters, accept=lambda proxy: proxy.proxy_id == 5).proxy_id
+            for _ in range(2)] == [5, 5]
+    assert attribute_index.next_proxy(free_filters, accept=lambda proxy: False) is None
@@ -24,6 +24,15 @@ def test_new_proxies():
         proxy_number -= 1
 
 
+def test_proxy_universe_as_records():
+    my_getter = MySQLProxy()
+    proxies = my_getter.get_proxy_universe(proxy_universe_size=10, return_as_records=True)
+    assert proxies is not None
+    assert len(proxies) <= 10
+    print(proxies[0]["full_url"], proxies[0].proxy_country)
+
+
 if __name__ == "__main__":
     test_mysql_proxies()
     test_new_proxies()
+    test_proxy_universe_as_records()
@@ -0,0 +1,67 @@
+import gzip
+import json
+
+import pytest
+
+from proxy_helpers.mysql_proxies.proxy_import import (ImportStats, get_proxy_file_format, iter_proxy_file,
+                                                      normalise_proxy)
+
+
+@pytest.mark.parametrize("record, expected", [
+    ({"proxy_url": "10.0.0.1:8080"}, ("10.0.0.1", 8080)),
+    ({"proxy": "HTTP://Proxy.Example.com:3128/"}, ("proxy.example.com", 3128)),
+    ({"host": "10.0.0.2", "port": " 80 "}, ("10.0.0.2", 80)),
+    ({"proxy_url": "10.0.0.256:8080"}, None),
+    ({"proxy_url": "10.0.0.1:70000"}, None),
+    ({"proxy_url": "user:password@10.0.0.1:8080"}, None),
+    ({"proxy_url": "10.0.0.1"}, None),
+    ({"port": "8080"}, None),
+    (None, None),
+])
+def test_normalise_proxy(record, expected):
+    proxy_dict = normalise_proxy(record)
+    if expected is None:
+        assert proxy_dict is None
+    else:
+        assert (proxy_dict["proxy_url"], proxy_dict["proxy_port"]) == expected
+
+
+def test_get_proxy_file_format():
+    assert get_proxy_file_format("proxies.csv") == "csv"
+    assert get_proxy_file_format("proxies.jsonl.gz") == "jsonl"
+    assert get_proxy_file_format("proxies.list") == "txt"
+
+
+def test_iter_proxy_file_txt(tmp_path):
+    file_path = tmp_path / "proxies.txt"
+    file_path.write_text("# provider dump\n10.0.0.1:8080\n10.0.0.2 3128  # comment\n\nbad line\n10.0.0.1:8080\n")
+    import_stats = ImportStats(progress_interval=None)
+    proxy_dicts = list(iter_proxy_file(file_path, proxy_web_name="dump", import_stats=import_stats))
+    assert [(proxy["proxy_url"], proxy["proxy_port"]) for proxy in proxy_dicts] == [("10.0.0.1", 8080),
+                                                                                    ("10.0.0.2", 3128)]
+    assert all(proxy["proxy_web_name"] == "dump" for proxy in proxy_dicts)
+    assert (import_stats.read_count, import_stats.invalid_count, import_stats.duplicate_count) == (4, 1, 1)
+
+
+def test_iter_proxy_file_csv_and_jsonl(tmp_path):
+    csv_path = tmp_path / "proxies.csv"
+    csv_path.write_text("IP,Port,Country,Speed\n10.0.0.1,8080,GB,1.5\n10.0.0.2,x,FR,\n")
+    assert list(iter_proxy_file(csv_path)) == [{
+        "proxy_url": "10.0.0.1", "proxy_port": 8080, "proxy_country": "GB",
+        "proxy_town": None, "proxy_speed": 1.5, "proxy_web_name": None,
+    }]
+
+    jsonl_path = tmp_path / "proxies.jsonl.gz"
+    with gzip.open(jsonl_path, "wt") as jsonl_file:
+        jsonl_file.write(json.dumps({"proxy_url": "10.0.0.3", "proxy_port": 80, "source": "api"}) + "\n")
+        jsonl_file.write("{not json\n")
+    proxy_dicts = list(iter_proxy_file(jsonl_path))
+    assert [(proxy["proxy_url"], proxy["proxy_web_name"]) for proxy in proxy_dicts] == [("10.0.0.3", "api")]
+
+
+def test_iter_proxy_file_dedupe_window(tmp_path):
+    file_path = tmp_path / "proxies.txt"
+    file_path.write_text("10.0.0.1:80\n10.0.0.2:80\n10.0.0.3:80\n10.0.0.1:80\n10.0.0.3:80\n")
+    proxy_dicts = list(iter_proxy_file(file_path, dedupe_window=2))
+    # 10.0.0.1 left the window, the upsert merges it
+    assert [proxy["proxy_url"] for proxy in proxy_dicts] == ["10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.1"]
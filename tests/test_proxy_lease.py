@@ -0,0 +1,22 @@
+from proxy_helpers.mysql_proxies.proxy_lease import (LEASE_RELEASE_SQL, build_lease_release_query,
+                                                     build_lease_update_query, new_lease_owner)
+
+
+def test_build_lease_update_query():
+    sql_string, sql_variables = build_lease_update_query([3, 4, 5], lease_owner="worker", lease_ttl=30.5)
+    assert "proxy_id IN (%s, %s, %s)" in sql_string
+    assert sql_string.count("%s") == len(sql_variables)
+    assert sql_variables == ("worker", 31, 3, 4, 5)
+
+
+def test_build_lease_release_query():
+    assert build_lease_release_query("worker") == (LEASE_RELEASE_SQL, ("worker",))
+    sql_string, sql_variables = build_lease_release_query("worker", keep_proxy_ids=[3, 4])
+    assert "proxy_id NOT IN (%s, %s)" in sql_string
+    assert sql_variables == ("worker", 3, 4)
+
+
+def test_new_lease_owner():
+    lease_owner = new_lease_owner()
+    assert len(lease_owner) <= 64
+    assert lease_owner != new_lease_owner()
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from proxy_helpers.mysql_proxies.proxy_prune import (PruneStats, build_prune_delete_query, build_prune_select_query,
+                                                     get_prune_conditions)
+
+
+def test_get_prune_conditions():
+    assert get_prune_conditions(min_error_count=4000) == ("error_count > %s", (4000,))
+    assert get_prune_conditions(min_error_count=4000, max_age_days=7, now=datetime(2024, 1, 8)) == (
+        "error_count > %s AND upload_datetime < %s", (4000, datetime(2024, 1, 1))
+    )
+
+
+def test_build_prune_queries():
+    conditions = get_prune_conditions(min_error_count=10)
+    sql_string, sql_variables = build_prune_select_query(conditions, after_proxy_id=5, chunk_size=100)
+    assert "proxy_id > %s AND error_count > %s" in sql_string
+    assert "ORDER BY proxy_id" in sql_string
+    assert sql_variables == (5, 10, 100)
+
+    sql_string, sql_variables = build_prune_delete_query(conditions, [6, 9])
+    assert "proxy_id IN (%s, %s) AND error_count > %s" in sql_string
+    assert sql_variables == (6, 9, 10)
+
+
+def test_prune_stats():
+    prune_stats = PruneStats(progress_interval=None)
+    prune_stats.add_chunk(selected_count=3, deleted_count=3)
+    prune_stats.add_chunk(selected_count=2, deleted_count=1)
+    prune_stats.add_chunk(selected_count=1, deleted_count=None)
+    prune_counts = prune_stats.get_counts()
+    assert (prune_counts["deleted"], prune_counts["kept"], prune_counts["chunks"]) == (4, 2, 3)
@@ -0,0 +1,29 @@
+from datetime import datetime
+
+import pytest
+
+from proxy_helpers.mysql_proxies.proxy_record import PROXY_COLUMNS, Proxy, get_proxy_records
+
+proxy_row: tuple = (12, datetime(2024, 1, 1), "10.0.0.1", 8080, "GB", "London", 1.5, "test_proxy_name", 3, 0)
+
+
+def test_proxy_record_from_row():
+    proxy = Proxy(*proxy_row)
+    assert proxy.full_url == "10.0.0.1:8080"
+    assert proxy["proxy_country"] == "GB"
+    assert proxy.get("proxy_town") == "London"
+    assert proxy.get("unknown_column", "default") == "default"
+    with pytest.raises(KeyError):
+        _ = proxy["unknown_column"]
+    assert dict(proxy) == proxy.to_dict()
+    assert set(proxy.to_dict()) == {"full_url", "latency_ewma", *PROXY_COLUMNS}
+    assert not hasattr(proxy, "__dict__")
+
+
+def test_get_proxy_records():
+    rows = [(index,) + proxy_row[1:] for index in range(100)]
+    proxies = get_proxy_records(rows, shuffle_results=True)
+    assert sorted(proxy.proxy_id for proxy in proxies) == list(range(100))
+    proxies = get_proxy_records(rows, shuffle_results=False)
+    assert [proxy.proxy_id for proxy in proxies] == list(range(100))
+    assert get_proxy_records([]) is None
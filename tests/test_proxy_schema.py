@@ -0,0 +1,162 @@
+import json
+from time import time
+from typing import List, Optional
+
+import pytest
+
+from proxy_helpers.mysql_proxies.memory_backend import MemoryBackend
+from proxy_helpers.mysql_proxies.proxy_schema import (HOT_QUERIES, SCHEMA_COLUMNS, SCHEMA_INDEXES, SCHEMA_TRIGGERS,
+                                                      build_create_table_sql, build_migration_statements,
+                                                      get_explain_keys, get_schema_sql, has_explain_filesort,
+                                                      migrate_schema, read_database_schema, verify_query_plans)
+from proxy_helpers.mysql_proxies.score_decay import get_score_rank
+
+
+def test_schema_sql():
+    create_table_sql = build_create_table_sql("tbl_proxy_url")
+    assert "UNIQUE KEY `uq_proxy_url_port` (`proxy_url`, `proxy_port`)" in create_table_sql
+    assert "KEY `idx_error_count` (`error_count`)" in create_table_sql
+    assert "PRIMARY KEY (`proxy_id`)" in create_table_sql
+    assert len(get_schema_sql()) == len(SCHEMA_COLUMNS) + 1
+
+
+def test_migration_statements():
+    assert build_migration_statements(set(), {}, {}, set()) == get_schema_sql()
+
+    # the table before the package owned its schema: no extra columns, only the primary key
+    tables = set(SCHEMA_COLUMNS)
+    columns = {table_name: {column for column, _ in table_columns}
+               for table_name, table_columns in SCHEMA_COLUMNS.items()}
+    columns["tbl_proxy_url"] -= {"latency_ewma", "updated_at", "decayed_score", "score_updated_at", "score_rank"}
+    indexes = {table_name: dict(table_indexes) for table_name, table_indexes in SCHEMA_INDEXES.items()}
+    indexes["tbl_proxy_url"] = {
+        "PRIMARY": (("proxy_id",), True),
+        # a differently named index covering the selection order is kept
+        "error_count_idx": (("error_count", "proxy_id"), False),
+        "idx_updated_at": (("updated_at",), False),
+        "idx_lease_owner": (("lease_owner",), False),
+        # not unique, so the unique key is still added
+        "proxy_url_idx": (("proxy_url", "proxy_port"), False),
+    }
+    statements = build_migration_statements(tables, columns, indexes, {"trg_proxy_url_deleted"})
+    assert statements == [
+        "ALTER TABLE `tbl_proxy_url` ADD COLUMN `latency_ewma` FLOAT NULL, ADD COLUMN `updated_at` TIMESTAMP(6) NOT NULL "
+        "DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6), ADD COLUMN `decayed_score` DOUBLE NOT NULL "
+        "DEFAULT 0, ADD COLUMN `score_updated_at` TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6), "
+        "ADD COLUMN `score_rank` DOUBLE NOT NULL DEFAULT 0, "
+        "ADD UNIQUE KEY `uq_proxy_url_port` (`proxy_url`, `proxy_port`), ADD KEY `idx_score_rank` (`score_rank`)"
+    ]
+
+
+class DatabaseSchemaHandler:
+    """information_schema rows of the current schema without the decayed score columns"""
+
+    def fetch_all_as_tuples(self, sql_query: str, sql_variables: Optional[tuple] = None) -> List[tuple]:
+        if "TABLE_NAME\n" in sql_query:
+            return [(table_name,) for table_name in SCHEMA_COLUMNS]
+        if "COLUMN_NAME\n" in sql_query:
+            return [(table_name, column) for table_name, table_columns in SCHEMA_COLUMNS.items()
+                    for column, _ in table_columns
+                    if column not in {"decayed_score", "score_updated_at", "score_rank"}]
+        if "NON_UNIQUE\n" in sql_query:
+            return [(table_name, index_name, column, 0 if unique else 1)
+                    for table_name, table_indexes in SCHEMA_INDEXES.items()
+                    for index_name, (index_columns, unique) in table_indexes.items() for column in index_columns]
+        return [(trigger_name,) for trigger_name in SCHEMA_TRIGGERS]
+
+
+def test_migrate_schema_backfills_decayed_scores():
+    with pytest.raises(ValueError):
+        migrate_schema(DatabaseSchemaHandler(), dry_run=True)
+    statements = migrate_schema(DatabaseSchemaHandler(), dry_run=True, score_half_life=3600)
+    assert statements[0].startswith("ALTER TABLE `tbl_proxy_url` ADD COLUMN `decayed_score`")
+    assert statements[-1].startswith("UPDATE tbl_proxy_url SET score_rank=")
+
+    # the backfill on the sqlite mirror of the schema
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(2, error_count=5000)
+    memory_backend.add_proxies(1, error_count=0)
+    memory_backend.add_proxies(1, error_count=-2)
+    memory_backend.execute_one_query(statements[-1])
+    rows = memory_backend.fetch_all_as_tuples(
+        "SELECT error_count, decayed_score, score_rank FROM tbl_proxy_url ORDER BY proxy_id"
+    )
+    assert [decayed_score for _, decayed_score, _ in rows] == [5000, 5000, 0, -2]
+    assert rows[0][2] == pytest.approx(get_score_rank(5000, time(), half_life=3600), abs=0.01)
+    assert rows[3][2] < rows[2][2] == 0 < rows[0][2]
+
+
+def test_read_database_schema():
+    rows_by_table = {
+        "TABLE_NAME\n": [("tbl_proxy_url",)],
+        "COLUMN_NAME\n": [("tbl_proxy_url", "proxy_id"), ("tbl_proxy_url", "proxy_url")],
+        "NON_UNIQUE\n": [("tbl_proxy_url", "PRIMARY", "proxy_id", 0),
+                         ("tbl_proxy_url", "uq", "proxy_url", 0), ("tbl_proxy_url", "uq", "proxy_port", 0)],
+        "TRIGGER_NAME\n": [],
+    }
+
+    def fetch_all(sql_query, sql_variables):
+        return next(rows for marker, rows in rows_by_table.items() if marker in sql_query)
+
+    tables, columns, indexes, triggers = read_database_schema(fetch_all)
+    assert tables == {"tbl_proxy_url"}
+    assert columns == {"tbl_proxy_url": {"proxy_id", "proxy_url"}}
+    assert indexes == {"tbl_proxy_url": {"PRIMARY": (("proxy_id",), True), "uq": (("proxy_url", "proxy_port"), True)}}
+    assert triggers == set()
+
+
+def test_get_explain_keys():
+    explain_json = json.dumps({"query_block": {"select_id": 1, "ordering_operation": {
+        "using_filesort": False,
+        "table": {"table_name": "a", "access_type": "index", "key": "idx_error_count", "possible_keys": None},
+    }}})
+    assert get_explain_keys(explain_json) == {"idx_error_count"}
+    assert get_explain_keys(json.dumps({"query_block": {"table": {
+        "access_type": "const", "possible_keys": ["uq_proxy_url_port"], "key": "uq_proxy_url_port",
+    }}})) == {"uq_proxy_url_port"}
+    # indexes only considered by the optimizer don't count
+    full_scan_json = json.dumps({"query_block": {"ordering_operation": {
+        "using_filesort": True,
+        "table": {"table_name": "a", "access_type": "ALL", "possible_keys": ["idx_error_count"], "key": None},
+    }}})
+    assert get_explain_keys(full_scan_json) == set()
+    assert has_explain_filesort(full_scan_json)
+    assert not has_explain_filesort(explain_json)
+
+
+class ExplainHandler:
+    def __init__(self, explain_json: str):
+        self.explain_json: str = explain_json
+
+    def fetch_all_as_tuples(self, sql_query: str, sql_variables: Optional[tuple] = None) -> List[tuple]:
+        return [(self.explain_json,)]
+
+
+def test_verify_query_plans_rejects_filesort():
+    explain_json = json.dumps({"query_block": {"ordering_operation": {
+        "using_filesort": True,
+        "table": {"table_name": "a", "access_type": "index", "key": "idx_error_count"},
+    }}})
+    problems = verify_query_plans(ExplainHandler(explain_json))
+    assert [problem for problem in problems if problem.startswith("proxy selection")] == [
+        "proxy selection sorts rows with a filesort instead of reading idx_error_count in order"
+    ]
+
+
+def test_memory_schema_matches_index_names():
+    memory_backend = MemoryBackend()
+    index_names = {row[0] for row in memory_backend.fetch_all_as_tuples(
+        "SELECT name FROM sqlite_master WHERE type= 'index' AND name NOT LIKE 'sqlite_%%'"
+    )}
+    assert index_names == {index_name for table_indexes in SCHEMA_INDEXES.values()
+                           for index_name in table_indexes if index_name != "PRIMARY"}
+
+
+@pytest.mark.parametrize("query_name, sql_query, sql_variables, index_name", HOT_QUERIES)
+def test_hot_query_plans(query_name, sql_query, sql_variables, index_name):
+    # EXPLAIN on the sqlite mirror of the schema, verify_query_plans runs the MySQL EXPLAIN
+    memory_backend = MemoryBackend()
+    memory_backend.add_proxies(100)
+    plan_rows, _, _ = memory_backend.run_query("EXPLAIN QUERY PLAN " + sql_query, sql_variables)
+    plan: str = " ".join(row[-1] for row in plan_rows)
+    assert index_name in plan, f"{query_name}: {plan}"
@@ -0,0 +1,33 @@
+import os
+
+import pytest
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# integration tests, run against the MySQL database of the .env file
+pytestmark = [
+    pytest.mark.integration,
+    pytest.mark.skipif(not os.getenv("MYSQL_DB_HOST"), reason="no MySQL database configured, see .env.example"),
+]
+
+pytest.importorskip("mysql_helpers")
+
+from proxy_helpers.mysql_proxies.mysql_proxies import MySQLProxy  # noqa: E402
+from proxy_helpers.mysql_proxies.proxy_schema import migrate_schema, verify_query_plans, verify_schema  # noqa: E402
+
+
+def test_schema_is_current():
+    my_getter = MySQLProxy()
+    assert migrate_schema(my_getter, dry_run=True) == verify_schema(my_getter)
+    assert verify_schema(my_getter) == []
+
+
+def test_hot_queries_use_indexes():
+    my_getter = MySQLProxy()
+    assert verify_query_plans(my_getter) == []
+
+
+if __name__ == "__main__":
+    test_schema_is_current()
+    test_hot_queries_use_indexes()
@@ -0,0 +1,28 @@
+from datetime import datetime
+
+from proxy_helpers.mysql_proxies.proxy_record import Proxy
+from proxy_helpers.mysql_proxies.proxy_snapshot import read_proxy_snapshot, write_proxy_snapshot
+
+
+def test_proxy_snapshot_round_trip(tmp_path):
+    snapshot_path = tmp_path / "proxies.snapshot"
+    proxies = [
+        Proxy(1, datetime(2024, 1, 2, 3, 4, 5), "10.0.0.1", 8080, "GB", "London", 1.5, "free-proxy", 3, -2, 0.25),
+        Proxy(2, None, "10.0.0.2", 3128),
+    ]
+    assert write_proxy_snapshot(snapshot_path, proxies) == 2
+    assert [proxy.to_dict() for proxy in read_proxy_snapshot(snapshot_path)] == [
+        proxy.to_dict() for proxy in proxies
+    ]
+    assert list(tmp_path.iterdir()) == [snapshot_path]
+
+
+def test_proxy_snapshot_unusable(tmp_path):
+    snapshot_path = tmp_path / "proxies.snapshot"
+    assert read_proxy_snapshot(snapshot_path) is None
+    write_proxy_snapshot(snapshot_path, [Proxy(1, None, "10.0.0.1", 8080)])
+    assert read_proxy_snapshot(snapshot_path, max_age=-1) is None
+    snapshot_path.write_bytes(snapshot_path.read_bytes()[:-3])
+    assert read_proxy_snapshot(snapshot_path) is None
+    snapshot_path.write_bytes(b"not a snapshot")
+    assert read_proxy_snapshot(snapshot_path) is None
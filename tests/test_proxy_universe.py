@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+from proxy_helpers.mysql_proxies.proxy_record import Proxy
+from proxy_helpers.mysql_proxies.proxy_universe import IncrementalUniverse
+
+watermark: datetime = datetime(2024, 1, 1, 12)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now: float = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def get_proxy(proxy_id: int, error_count: int = 0) -> Proxy:
+    return Proxy(proxy_id=proxy_id, proxy_url=f"10.0.0.{proxy_id}", proxy_port=8080, error_count=error_count)
+
+
+def get_top_ids(proxy_universe: IncrementalUniverse) -> list:
+    return [proxy.proxy_id for proxy in proxy_universe.top(shuffle_results=False)]
+
+
+def test_incremental_universe_changes():
+    proxy_universe = IncrementalUniverse(universe_size=2, margin=2.0, clock=FakeClock())
+    assert proxy_universe.needs_full_resync()
+    proxy_universe.load_full([get_proxy(proxy_id, error_count=proxy_id) for proxy_id in range(1, 5)], watermark)
+    assert not proxy_universe.needs_full_resync()
+    assert get_top_ids(proxy_universe) == [1, 2]
+    assert proxy_universe.get_since() == watermark - timedelta(seconds=2)
+
+    # proxy 1 got worse, proxy 9 is new and better than the rows kept, proxy 10 is worse than all of them
+    applied = proxy_universe.apply_changes([get_proxy(1, error_count=10), get_proxy(9, error_count=-1),
+                                            get_proxy(10, error_count=20)],
+                                           deleted_proxy_ids=[2, 42], watermark="2024-01-01 12:00:05.000")
+    assert applied == 3
+    assert get_top_ids(proxy_universe) == [9, 3]
+    assert proxy_universe.order == [(-1, 9), (3, 3), (4, 4), (10, 1)]
+    assert proxy_universe.watermark == datetime(2024, 1, 1, 12, 0, 5)
+
+
+def test_incremental_universe_full_resync():
+    clock = FakeClock()
+    proxy_universe = IncrementalUniverse(universe_size=2, full_resync_interval=60, clock=clock)
+    proxy_universe.load_full([get_proxy(proxy_id) for proxy_id in range(1, 5)], watermark)
+    clock.now = 60
+    assert proxy_universe.needs_full_resync()
+
+    proxy_universe.load_full([get_proxy(proxy_id) for proxy_id in range(1, 5)], watermark)
+    proxy_universe.apply_changes([], deleted_proxy_ids=[1, 2, 3], watermark=watermark)
+    # the table had more rows than were kept, reload to fill the universe
+    assert proxy_universe.needs_full_resync()
+
+    proxy_universe.load_full([get_proxy(1)], watermark)
+    proxy_universe.apply_changes([], deleted_proxy_ids=[1], watermark=watermark)
+    assert not proxy_universe.needs_full_resync()
+    assert proxy_universe.top() is None
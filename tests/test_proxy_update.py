@@ -60,8 +60,23 @@ def test_delete_proxy():
     assert result == 1
 
 
+def test_insert_proxies():
+    load_dotenv()
+
+    my_proxy = MySQLProxy()
+    result = my_proxy.insert_proxies([test_proxy])
+    assert result["inserted"] == 1
+    result = my_proxy.insert_proxies([{**test_proxy, "upload_datetime": datetime.utcnow()}])
+    assert result["updated"] == 1
+    result = my_proxy.delete_proxy(
+        proxy_url=test_proxy["proxy_url"], proxy_port=test_proxy["proxy_port"]
+    )
+    assert result == 1
+
+
 if __name__ == "__main__":
     test_insert_new_proxy()
     test_success_new_proxy()
     test_error_new_proxy()
     test_delete_proxy()
+    test_insert_proxies()
@@ -0,0 +1,49 @@
+from datetime import datetime
+
+from proxy_helpers.mysql_proxies.proxy_upsert import (add_upsert_counts, build_existing_proxy_count_query,
+                                                      build_proxy_upsert_query, chunk_proxy_rows, new_upsert_counts)
+
+upload_datetime = datetime(2024, 1, 1)
+
+
+def test_chunk_proxy_rows():
+    proxy_dicts = ({"proxy_url": f"10.0.0.{index}", "proxy_port": "8080"} for index in range(5))
+    chunks = list(chunk_proxy_rows(proxy_dicts, chunk_size=2, upload_datetime=upload_datetime))
+    assert [len(proxy_rows) for proxy_rows in chunks] == [2, 2, 1]
+    assert chunks[0][0] == (upload_datetime, "10.0.0.0", 8080, None, None, None, None)
+
+
+def test_build_proxy_upsert_query():
+    proxy_rows = next(chunk_proxy_rows([{"proxy_url": "10.0.0.1", "proxy_port": 80, "proxy_country": "GB"},
+                                        {"proxy_url": "10.0.0.2", "proxy_port": 81}],
+                                       upload_datetime=upload_datetime))
+    sql_string, sql_variables = build_proxy_upsert_query(proxy_rows)
+    assert sql_string.count("(%s, %s, %s, %s, %s, %s, %s)") == 2
+    assert "AS new\n                ON DUPLICATE KEY UPDATE" in sql_string
+    assert "VALUES(" not in sql_string
+    assert "`upload_datetime`=new.`upload_datetime`" in sql_string
+    assert "`proxy_country`=COALESCE(new.`proxy_country`, `proxy_country`)" in sql_string
+    assert "`error_count`" not in sql_string
+    assert len(sql_variables) == 14 and sql_variables[3] == "GB"
+
+
+def test_build_existing_proxy_count_query():
+    proxy_rows = next(chunk_proxy_rows([{"proxy_url": "10.0.0.1", "proxy_port": 80},
+                                        {"proxy_url": "10.0.0.1", "proxy_port": "80"},
+                                        {"proxy_url": "10.0.0.2", "proxy_port": 81}],
+                                       upload_datetime=upload_datetime))
+    sql_string, sql_variables = build_existing_proxy_count_query(proxy_rows)
+    assert "(proxy_url, proxy_port) IN ((%s, %s), (%s, %s))" in sql_string
+    assert sql_variables == ("10.0.0.1", 80, "10.0.0.2", 81)
+
+
+def test_add_upsert_counts():
+    proxy_rows = list(chunk_proxy_rows([{"proxy_url": f"10.0.0.{index}", "proxy_port": 80} for index in range(4)],
+                                       upload_datetime=upload_datetime))[0]
+    upsert_counts = new_upsert_counts()
+    # 1 of the 4 proxies already exists
+    add_upsert_counts(upsert_counts, proxy_rows, existing_count=1, affected_rows=5)
+    # a proxy given twice is inserted once, then updated
+    add_upsert_counts(upsert_counts, proxy_rows[:1] * 2, existing_count=0, affected_rows=3)
+    add_upsert_counts(upsert_counts, proxy_rows[:3], existing_count=0, affected_rows=None)
+    assert upsert_counts == {"inserted": 4, "updated": 2, "failed": 3}
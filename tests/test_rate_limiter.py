@@ -0,0 +1,114 @@
+import asyncio
+from math import inf
+
+import pytest
+
+from proxy_helpers.mysql_proxies.proxy_record import Proxy
+from proxy_helpers.mysql_proxies.rate_limiter import (AsyncRateLimitedDispenser, ProxyRateLimiter,
+                                                      RateLimitedDispenser)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now: float = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def get_proxies(proxy_count: int) -> list:
+    return [Proxy(proxy_id=proxy_id, proxy_url=f"10.0.0.{proxy_id}", proxy_port=8080)
+            for proxy_id in range(1, proxy_count + 1)]
+
+
+def test_rate_limiter_serves_earliest_available():
+    clock = FakeClock()
+    rate_limiter = ProxyRateLimiter(rate=1.0, burst=1, clock=clock)
+    assert rate_limiter.acquire() == (None, inf)
+    assert rate_limiter.load(get_proxies(3)) == 3
+    assert [rate_limiter.acquire()[0].proxy_id for _ in range(3)] == [1, 2, 3]
+    assert rate_limiter.acquire() == (None, pytest.approx(1.0))
+
+    clock.now += 0.5
+    assert rate_limiter.acquire() == (None, pytest.approx(0.5))
+    clock.now += 0.5
+    assert [rate_limiter.acquire()[0].proxy_id for _ in range(3)] == [1, 2, 3]
+
+
+def test_rate_limiter_burst_and_reload():
+    clock = FakeClock()
+    rate_limiter = ProxyRateLimiter(rate=0.5, burst=2, clock=clock)
+    rate_limiter.load(get_proxies(1))
+    assert rate_limiter.acquire()[0].proxy_id == 1
+    assert rate_limiter.acquire()[0].proxy_id == 1
+    assert rate_limiter.acquire() == (None, pytest.approx(2.0))
+
+    # a refresh keeps the limit of proxies already scheduled
+    rate_limiter.load(get_proxies(2))
+    assert rate_limiter.acquire()[0].proxy_id == 2
+    assert rate_limiter.acquire()[0].proxy_id == 2
+    assert rate_limiter.acquire() == (None, pytest.approx(2.0))
+    clock.now += 2.0
+    assert rate_limiter.acquire()[0].proxy_id == 1
+
+
+def test_rate_limiter_acquire_proxy_out_of_turn():
+    clock = FakeClock()
+    rate_limiter = ProxyRateLimiter(rate=1.0, burst=1, clock=clock)
+    proxies = get_proxies(2)
+    rate_limiter.load(proxies)
+    assert rate_limiter.acquire_proxy(proxies[0])
+    assert not rate_limiter.acquire_proxy(proxies[0])
+    # proxy 1 is still scheduled first, it is skipped until its token is back
+    assert rate_limiter.acquire()[0].proxy_id == 2
+    assert rate_limiter.acquire() == (None, pytest.approx(1.0))
+    clock.now += 1.0
+    assert rate_limiter.acquire()[0].proxy_id == 1
+    assert rate_limiter.acquire_proxy(Proxy(proxy_id=3, proxy_url="10.0.0.3", proxy_port=8080))
+
+
+def test_rate_limited_dispenser_prefetches_and_waits():
+    load_counts = []
+
+    def load_batch():
+        load_counts.append(1)
+        return get_proxies(2)
+
+    proxy_dispenser = RateLimitedDispenser(load_batch=load_batch, rate=20.0)
+    assert {proxy_dispenser.next_proxy().proxy_id for _ in range(2)} == {1, 2}
+    # the next batch is loaded in the background once the batch is nearly served
+    prefetch_thread = proxy_dispenser.batch_loader._prefetch_thread
+    if prefetch_thread is not None:
+        prefetch_thread.join()
+    assert len(load_counts) == 2
+    assert proxy_dispenser.next_proxy() is None
+    assert proxy_dispenser.next_proxy(wait=True).proxy_id in {1, 2}
+    assert RateLimitedDispenser(load_batch=lambda: None, rate=1.0).next_proxy(wait=True) is None
+
+
+def test_rate_limited_dispenser_backs_off_after_empty_load():
+    load_counts = []
+
+    def load_batch():
+        load_counts.append(1)
+        return None
+
+    clock = FakeClock()
+    proxy_dispenser = RateLimitedDispenser(load_batch=load_batch, rate=1.0, clock=clock)
+    assert [proxy_dispenser.next_proxy() for _ in range(3)] == [None, None, None]
+    assert len(load_counts) == 1
+    clock.now += proxy_dispenser.batch_loader.retry_interval
+    assert proxy_dispenser.next_proxy() is None
+    assert len(load_counts) == 2
+
+
+@pytest.mark.asyncio
+async def test_async_rate_limited_dispenser():
+    async def load_batch():
+        await asyncio.sleep(0)
+        return get_proxies(2)
+
+    proxy_dispenser = AsyncRateLimitedDispenser(load_batch=load_batch, rate=20.0)
+    proxies = await asyncio.gather(*(proxy_dispenser.next_proxy() for _ in range(3)))
+    assert sorted(proxy.proxy_id for proxy in proxies if proxy is not None) == [1, 2]
+    assert (await proxy_dispenser.next_proxy(wait=True)).proxy_id in {1, 2}
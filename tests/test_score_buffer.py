@@ -0,0 +1,108 @@
+import asyncio
+from time import sleep
+
+import pytest
+
+from proxy_helpers.mysql_proxies.score_buffer import (ScoreBuffer, AsyncScoreBuffer, AsyncScoreReporter,
+                                                      build_score_update_query, get_proxy_key)
+
+
+def test_get_proxy_key():
+    assert get_proxy_key(proxy_id="12") == 12
+    assert get_proxy_key(proxy_url="test_proxy_url", proxy_port="80") == ("test_proxy_url", 80)
+    assert get_proxy_key() is None
+
+
+def test_build_score_update_query():
+    sql_string, sql_variables = build_score_update_query({12: -3, ("test_proxy_url", 80): 2, 13: 0})
+    assert sql_string.count("WHEN") == 2
+    assert "GREATEST" in sql_string and "LEAST" in sql_string
+    assert sql_variables == (12, -3, "test_proxy_url", 80, 2, 12, "test_proxy_url", 80)
+    assert build_score_update_query({12: 0}) is None
+
+
+def test_score_buffer_merges_and_flushes_on_size():
+    flushed = []
+    score_buffer = ScoreBuffer(flush_callback=flushed.append, flush_size=2, flush_interval=None)
+    score_buffer.add(1, success=True)
+    score_buffer.add(1, success=True)
+    score_buffer.add(1, success=False)
+    assert flushed == []
+    score_buffer.add(2, success=False)
+    assert flushed == [{1: -1, 2: 1}]
+    score_buffer.close()
+
+
+def test_score_buffer_flushes_on_time_and_close():
+    flushed = []
+    score_buffer = ScoreBuffer(flush_callback=flushed.append, flush_size=100, flush_interval=0.05)
+    score_buffer.add(1, success=False)
+    for _ in range(40):
+        if flushed:
+            break
+        sleep(0.05)
+    assert flushed == [{1: 1}]
+    score_buffer.add(2, success=True)
+    score_buffer.close()
+    assert flushed == [{1: 1}, {2: -1}]
+
+
+def test_score_buffer_requeues_on_error():
+    def failing_flush(deltas):
+        raise ConnectionError("database is down")
+
+    score_buffer = ScoreBuffer(flush_callback=failing_flush, flush_size=100, flush_interval=None)
+    score_buffer.add(1, success=False)
+    assert score_buffer.flush() == 0
+    score_buffer.add(1, success=False)
+    assert score_buffer.deltas == {1: 2}
+    score_buffer.flush_callback = lambda deltas: None
+    score_buffer.close()
+    assert score_buffer.deltas == {}
+
+
+@pytest.mark.asyncio
+async def test_async_score_buffer():
+    flushed = []
+
+    async def flush_callback(deltas):
+        flushed.append(deltas)
+
+    score_buffer = AsyncScoreBuffer(flush_callback=flush_callback, flush_size=2, flush_interval=10)
+    await score_buffer.add(1, success=True)
+    await score_buffer.add(("test_proxy_url", 80), success=False)
+    # the size trigger wakes the flush task
+    await asyncio.sleep(0.01)
+    assert flushed == [{1: -1, ("test_proxy_url", 80): 1}]
+    await score_buffer.add(1, success=False)
+    await score_buffer.aclose()
+    assert flushed[-1] == {1: 1}
+
+
+@pytest.mark.asyncio
+async def test_async_score_reporter():
+    flushed = []
+    flush_started = asyncio.Event()
+    flush_release = asyncio.Event()
+
+    async def flush_callback(deltas):
+        flushed.append(deltas)
+        flush_started.set()
+        await flush_release.wait()
+
+    score_reporter = AsyncScoreReporter(flush_callback=flush_callback, flush_size=2, flush_interval=10)
+    score_reporter.report(1, success=True)
+    score_reporter.report(1, success=True)
+    score_reporter.report(2, success=False)
+    await flush_started.wait()
+    assert flushed == [{1: -2, 2: 1}]
+
+    # reports don't wait on a slow flush
+    for _ in range(1000):
+        score_reporter.report(3, success=False)
+    assert score_reporter.report_queue.qsize() == 1000
+    flush_release.set()
+    await score_reporter.aclose()
+    assert flushed[-1] == {3: 1000}
+    with pytest.raises(RuntimeError):
+        score_reporter.report(1, success=True)
@@ -0,0 +1,41 @@
+import itertools
+
+from proxy_helpers.mysql_proxies.score_buffer import build_score_update_query
+from proxy_helpers.mysql_proxies.score_decay import (DECAY_EPOCH, build_decay_assignments, get_decayed_score,
+                                                     get_score_rank)
+
+
+def test_get_decayed_score():
+    assert get_decayed_score(8.0, elapsed=7200, half_life=3600) == 2.0
+    assert get_decayed_score(-8.0, elapsed=0, half_life=3600) == -8.0
+
+
+def test_score_rank_follows_decayed_score_order():
+    half_life = 3600.0
+    # (score, written at), later scores are worth more than older ones of the same size
+    scores = [(4.0, DECAY_EPOCH + 1000), (1.0, DECAY_EPOCH + 36000), (-2.0, DECAY_EPOCH), (-0.5, DECAY_EPOCH + 7200),
+              (0.0, DECAY_EPOCH + 500), (1e-300, DECAY_EPOCH), (5000.0, DECAY_EPOCH + 10 ** 9)]
+    now = DECAY_EPOCH + 10 ** 9 + 1
+    for (score_a, at_a), (score_b, at_b) in itertools.combinations(scores, 2):
+        decayed_a = get_decayed_score(score_a, now - at_a, half_life)
+        decayed_b = get_decayed_score(score_b, now - at_b, half_life)
+        rank_a = get_score_rank(score_a, at_a, half_life)
+        rank_b = get_score_rank(score_b, at_b, half_life)
+        # scores decayed below the smallest double are equal, their ranks still differ
+        if decayed_a != decayed_b:
+            assert (decayed_a < decayed_b) == (rank_a < rank_b)
+    assert get_score_rank(0.0, DECAY_EPOCH, half_life) == 0.0
+
+
+def test_build_decay_assignments():
+    sql_string, sql_variables = build_decay_assignments(3600, delta_sql="%s", delta_variables=(1,))
+    assert sql_string.startswith("score_rank= CASE") and sql_string.endswith("score_updated_at= NOW(6)")
+    assert sql_string.count("%s") == len(sql_variables) == 5
+
+
+def test_build_score_update_query_with_half_life():
+    sql_string, sql_variables = build_score_update_query({12: -3, ("test_proxy_url", 80): 2}, score_half_life=60)
+    assert "decayed_score=" in sql_string
+    assert sql_string.count("%s") == len(sql_variables)
+    # the error_count CASE, the 5 decay CASEs, then the WHERE
+    assert sql_variables == (12, -3, "test_proxy_url", 80, 2) * 6 + (12, "test_proxy_url", 80)